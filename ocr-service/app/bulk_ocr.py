@@ -0,0 +1,519 @@
+"""
+Offline bulk OCR for document archives.
+
+Runs the service's OCR pipeline in-process: renderer processes decode pages into
+a shared-memory ring and OCR worker processes (one PaddleOCR engine each) read
+them from there. Results go to sharded NDJSON or Parquet files and every
+finished document is recorded in a manifest so interrupted runs can resume.
+
+    python app/bulk_ocr.py /archive/invoices --output /data/ocr-backfill --workers 4
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+from pathlib import Path
+from datetime import datetime
+import multiprocessing
+from queue import Empty
+from typing import Optional, Dict, Any, List, Set, Tuple, Iterator
+
+import numpy as np
+from PIL import Image
+
+from page_ring import PageRing, PDF_RENDER_ZOOM, pixmap_array
+from page_cache import page_content_key
+from memory_limits import OcrBudget, current_rss_bytes
+
+logger = logging.getLogger("bulk_ocr")
+
+SUPPORTED_EXTENSIONS = {'.pdf', '.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif'}
+MANIFEST_NAME = "manifest.ndjson"
+
+# Page cache namespace of offline runs (each worker process keeps its own cache)
+CACHE_NAMESPACE = "bulk"
+
+
+def file_sha256(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def open_document(path: Path, budget: OcrBudget) -> Tuple[int, Iterator[Tuple[int, np.ndarray, Optional[str]]]]:
+    """Page count and an iterator of (page_number, pixels, content_key) for a PDF or image file."""
+    if path.suffix.lower() != '.pdf':
+        budget.check_image(path)
+        with Image.open(path) as image:
+            pixels = np.array(image)
+        return 1, iter([(1, pixels, None)])
+
+    import fitz  # PyMuPDF
+    document = fitz.open(path)
+    try:
+        budget.check_pdf(document)
+    except Exception:
+        document.close()
+        raise
+
+    def pages() -> Iterator[Tuple[int, np.ndarray, Optional[str]]]:
+        matrix = fitz.Matrix(PDF_RENDER_ZOOM, PDF_RENDER_ZOOM)
+        try:
+            for page_num in range(len(document)):
+                pixmap = document.load_page(page_num).get_pixmap(matrix=matrix)
+                # Pixels are copied once, into the ring; no PNG round trip
+                yield page_num + 1, pixmap_array(pixmap), page_content_key(document, page_num)
+        finally:
+            document.close()
+
+    return len(document), pages()
+
+
+def _render_loop(ring_info: Tuple[str, int, int], tasks, pages, free_slots, events) -> None:
+    """Renderer process: decode documents into ring slots and queue page descriptors."""
+    ring = PageRing.attach(*ring_info)
+    budget = OcrBudget.from_env()
+    try:
+        for doc_id, path_str in iter(tasks.get, None):
+            try:
+                page_count, page_iter = open_document(Path(path_str), budget)
+                events.put(("opened", doc_id, page_count))
+                for page_number, pixels, content_key in page_iter:
+                    if ring.fits(pixels.shape, pixels.dtype.str):
+                        slot = free_slots.get()
+                        shape, dtype = ring.write(slot, pixels)
+                        pages.put((doc_id, page_number, content_key, slot, shape, dtype, None))
+                    else:
+                        # Oversized page: fall back to pickling the pixels
+                        pages.put((doc_id, page_number, content_key, None, pixels.shape, pixels.dtype.str, pixels))
+                    pixels = None
+            except Exception as e:
+                events.put(("failed", doc_id, str(e)))
+    finally:
+        ring.close()
+
+
+def _ocr_loop(index: int, ring_info: Tuple[str, int, int], pages, free_slots, events,
+              max_jobs: int = 0, max_rss_bytes: int = 0) -> None:
+    """
+    OCR worker process: one PaddleOCR engine reading pages from ring slots.
+
+    Retires (exits after its current page) once it has done ``max_jobs`` pages
+    or its RSS passed ``max_rss_bytes``; the pipeline starts a replacement.
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    # This process is the engine worker: run PaddleOCR inline, not in sub-processes
+    os.environ["OCR_ENGINE_PROCESSES"] = "0"
+    # The service's page OCR without its singletons (upload storage, scheduler, search index)
+    from catalog_matcher import CatalogMatcher
+    from ocr_pipeline import OcrPipeline
+    pipeline = OcrPipeline.from_env(CatalogMatcher.from_env())
+
+    ring = PageRing.attach(*ring_info)
+    jobs = 0
+    try:
+        for doc_id, page_number, content_key, slot, shape, dtype, payload in iter(pages.get, None):
+            started = time.perf_counter()
+            page, error = None, None
+            try:
+                pixels = payload if slot is None else ring.view(slot, shape, dtype)
+                page = pipeline.ocr_page(page_number, pixels, CACHE_NAMESPACE, content_key)
+            except Exception as e:
+                error = str(e)
+            finally:
+                # The view must be gone before the slot is reused
+                pixels = None
+                if slot is not None:
+                    free_slots.put(slot)
+            events.put(("page", doc_id, page_number, page, error, time.perf_counter() - started))
+
+            jobs += 1
+            if (max_jobs and jobs >= max_jobs) or (max_rss_bytes and current_rss_bytes() >= max_rss_bytes):
+                events.put(("retired", index, jobs, current_rss_bytes()))
+                break
+    finally:
+        ring.close()
+
+
+class ShardWriter:
+    """
+    Writes result records into numbered shards of ``shard_size`` documents.
+
+    ``add`` returns the records that are durably on disk: every record for
+    NDJSON (flushed line by line), a whole shard at a time for Parquet.
+    """
+
+    def __init__(self, output_dir: Path, output_format: str = "ndjson", shard_size: int = 1000):
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.shard_size = max(shard_size, 1)
+        self.shard_index = self._next_shard_index()
+        self.shard_records = 0
+        self.buffer: List[Dict[str, Any]] = []
+        self.file = None
+        self.shards_written: List[Path] = []
+        if output_format == "parquet":
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise RuntimeError("Parquet output requires pyarrow: pip install pyarrow")
+            self.pa, self.pq = pyarrow, pyarrow.parquet
+
+    def _next_shard_index(self) -> int:
+        # Resumed runs append new shards instead of overwriting earlier ones
+        existing = [int(p.stem.split("-")[1]) for p in self.output_dir.glob("ocr-*.*") if p.stem.split("-")[1].isdigit()]
+        return max(existing) + 1 if existing else 0
+
+    def _shard_path(self) -> Path:
+        extension = "parquet" if self.output_format == "parquet" else "ndjson"
+        return self.output_dir / f"ocr-{self.shard_index:05d}.{extension}"
+
+    def add(self, record: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if self.output_format == "parquet":
+            self.buffer.append(record)
+            if len(self.buffer) >= self.shard_size:
+                return self._flush_parquet()
+            return []
+
+        if self.file is None:
+            path = self._shard_path()
+            self.file = open(path, 'w', encoding='utf-8')
+            self.shards_written.append(path)
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        self.shard_records += 1
+        if self.shard_records >= self.shard_size:
+            self.file.close()
+            self.file = None
+            self.shard_records = 0
+            self.shard_index += 1
+        return [record]
+
+    def _flush_parquet(self) -> List[Dict[str, Any]]:
+        records, self.buffer = self.buffer, []
+        if not records:
+            return []
+        table = self.pa.table({
+            "path": [r["path"] for r in records],
+            "sha256": [r["sha256"] for r in records],
+            "size": self.pa.array([r["size"] for r in records], type=self.pa.int64()),
+            "page_count": self.pa.array([r["page_count"] for r in records], type=self.pa.int32()),
+            "text": [r["text"] for r in records],
+            "pages": [json.dumps(r["pages"], ensure_ascii=False) for r in records],
+            "seconds": self.pa.array([r["seconds"] for r in records], type=self.pa.float64()),
+            "processed_at": [r["processed_at"] for r in records],
+        })
+        path = self._shard_path()
+        tmp_path = path.with_suffix(".parquet.tmp")
+        self.pq.write_table(table, str(tmp_path), compression="zstd")
+        os.replace(tmp_path, path)
+        self.shards_written.append(path)
+        self.shard_index += 1
+        return records
+
+    def close(self) -> List[Dict[str, Any]]:
+        if self.output_format == "parquet":
+            return self._flush_parquet()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        return []
+
+
+class Manifest:
+    """Append-only NDJSON log of processed documents, keyed by content hash."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.completed: Set[str] = set()
+        if path.exists():
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line after a crash
+                    if entry.get("status") == "ok":
+                        self.completed.add(entry["sha256"])
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def record(self, record: Dict[str, Any]) -> None:
+        self.file.write(json.dumps({
+            "sha256": record["sha256"],
+            "path": record["path"],
+            "status": record["status"],
+            "pages": record["page_count"],
+            "seconds": record["seconds"],
+            "error": record["error"]
+        }, ensure_ascii=False) + "\n")
+        self.file.flush()
+        if record["status"] == "ok":
+            self.completed.add(record["sha256"])
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def find_documents(input_dir: Path) -> List[Path]:
+    return sorted(
+        path for path in input_dir.rglob("*")
+        if path.is_file() and path.suffix.lower() in SUPPORTED_EXTENSIONS
+    )
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class PagePipeline:
+    """
+    Renderer and OCR worker processes connected through a shared-memory PageRing.
+
+    Renderers decode whole documents into free ring slots; workers OCR single
+    pages, so the pages of one large PDF are spread over all engines. Only
+    descriptors and per-page results cross process boundaries. Retired workers
+    (see _ocr_loop) are replaced as their "retired" event arrives.
+    """
+
+    def __init__(self, workers: int, renderers: int = 1, ring_slots: Optional[int] = None,
+                 slot_bytes: int = 32 * 1024 * 1024, max_jobs: int = 0, max_rss_bytes: int = 0):
+        self.ring = PageRing(ring_slots or workers * 2, slot_bytes)
+        self.ring_info = ring_info = (self.ring.name, self.ring.slots, self.ring.slot_bytes)
+        self.max_jobs = max_jobs
+        self.max_rss_bytes = max_rss_bytes
+        self.recycled = 0
+        self.tasks = multiprocessing.Queue()
+        self.pages = multiprocessing.Queue()
+        self.free_slots = multiprocessing.Queue()
+        self.events = multiprocessing.Queue()
+        for slot in range(self.ring.slots):
+            self.free_slots.put(slot)
+
+        self.renderers = [
+            multiprocessing.Process(target=_render_loop, daemon=True,
+                                    args=(ring_info, self.tasks, self.pages, self.free_slots, self.events))
+            for _ in range(renderers)
+        ]
+        self.workers = [self._worker_process(index) for index in range(workers)]
+        for process in self.renderers + self.workers:
+            process.start()
+
+    def _worker_process(self, index: int) -> multiprocessing.Process:
+        return multiprocessing.Process(target=_ocr_loop, daemon=True, args=(
+            index, self.ring_info, self.pages, self.free_slots, self.events, self.max_jobs, self.max_rss_bytes
+        ))
+
+    def submit(self, doc_id: int, path: str) -> None:
+        self.tasks.put((doc_id, path))
+
+    def next_event(self, timeout: float = 1.0) -> Optional[Tuple]:
+        try:
+            event = self.events.get(timeout=timeout)
+        except Empty:
+            # Exit code 0 is a retired worker whose event has not been read yet
+            dead = [process for process in self.renderers + self.workers
+                    if not process.is_alive() and process.exitcode != 0]
+            if dead:
+                raise RuntimeError(f"{len(dead)} pipeline process(es) exited unexpectedly "
+                                   f"(exit code {dead[0].exitcode}); rerun with --resume")
+            return None
+
+        if event[0] == "retired":
+            _, index, jobs, rss_bytes = event
+            logger.info(f"Recycling OCR worker {index} after {jobs} pages ({rss_bytes / 1e6:.0f} MB)")
+            self.workers[index].join()
+            self.workers[index] = self._worker_process(index)
+            self.workers[index].start()
+            self.recycled += 1
+            return None
+        return event
+
+    def close(self) -> None:
+        for _ in self.renderers:
+            self.tasks.put(None)
+        for process in self.renderers:
+            process.join(timeout=30)
+        for _ in self.workers:
+            self.pages.put(None)
+        for process in self.renderers + self.workers:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+        for queue in (self.tasks, self.pages, self.free_slots, self.events):
+            queue.cancel_join_thread()
+        self.ring.close()
+
+
+def run(input_dir: Path, output_dir: Path, workers: int, output_format: str, shard_size: int,
+        resume: bool, limit: Optional[int] = None, renderers: int = 1, ring_slots: Optional[int] = None,
+        slot_bytes: int = 32 * 1024 * 1024, max_jobs: int = 0, max_rss_bytes: int = 0) -> Dict[str, Any]:
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / MANIFEST_NAME
+    if not resume and manifest_path.exists():
+        raise RuntimeError(f"{manifest_path} exists; use --resume to continue or choose another --output")
+    manifest = Manifest(manifest_path)
+
+    documents = find_documents(input_dir)
+    pending = []
+    skipped = 0
+    queued_hashes = set()
+    for path in documents:
+        digest = file_sha256(path)
+        if digest in manifest.completed or digest in queued_hashes:
+            skipped += 1
+            continue
+        queued_hashes.add(digest)
+        pending.append((str(path), digest))
+    if limit:
+        pending = pending[:limit]
+
+    logger.info(f"{len(documents)} documents found, {skipped} already done or duplicate, {len(pending)} to process")
+
+    writer = ShardWriter(output_dir, output_format, shard_size)
+    stats = {"documents": 0, "failed": 0, "pages": 0, "cached_pages": 0, "bytes": 0, "skipped": skipped}
+    latencies: List[float] = []
+    started = time.perf_counter()
+
+    def finish(record: Dict[str, Any]) -> None:
+        if record["status"] == "ok":
+            stats["documents"] += 1
+            stats["pages"] += record["page_count"]
+            stats["cached_pages"] += sum(1 for page in record["pages"] if page.get("cached"))
+            stats["bytes"] += record["size"]
+            latencies.append(record["seconds"])
+            for durable in writer.add(record):
+                manifest.record(durable)
+        else:
+            stats["failed"] += 1
+            manifest.record(record)
+            logger.warning(f"Failed: {record['path']}: {record['error']}")
+
+        processed = stats["documents"] + stats["failed"]
+        if processed % 100 == 0:
+            elapsed = time.perf_counter() - started
+            logger.info(f"{processed}/{len(pending)} documents, {stats['pages'] / elapsed:.2f} pages/s")
+
+    pipeline = PagePipeline(workers, renderers, ring_slots, slot_bytes, max_jobs, max_rss_bytes)
+    queue = iter(enumerate(pending))
+    in_flight: Dict[int, Dict[str, Any]] = {}
+    try:
+        while True:
+            # Keep a bounded window of documents in the pipeline
+            while len(in_flight) < workers * 2:
+                item = next(queue, None)
+                if item is None:
+                    break
+                doc_id, (path_str, digest) = item
+                in_flight[doc_id] = {"path": path_str, "sha256": digest, "size": Path(path_str).stat().st_size,
+                                     "page_count": None, "pages": [], "seconds": 0.0, "error": None}
+                pipeline.submit(doc_id, path_str)
+            if not in_flight:
+                break
+
+            event = pipeline.next_event()
+            if event is None or event[1] not in in_flight:
+                continue  # late pages of a document that already failed
+            document = in_flight[event[1]]
+            if event[0] == "opened":
+                document["page_count"] = event[2]
+            elif event[0] == "failed":
+                document["error"] = event[2]
+            else:
+                _, _, page_number, page, error, seconds = event
+                document["seconds"] += seconds
+                if error is not None:
+                    document["error"] = f"page {page_number}: {error}"
+                else:
+                    document["pages"].append(page)
+
+            if document["error"] is None and len(document["pages"]) != document["page_count"]:
+                continue
+            del in_flight[event[1]]
+            document["pages"].sort(key=lambda page: page["page"])
+            failed = document["error"] is not None
+            document.update({
+                "status": "failed" if failed else "ok",
+                "page_count": 0 if failed else len(document["pages"]),
+                "pages": [] if failed else document["pages"],
+                "text": "" if failed else "\n\n".join(page["text"] for page in document["pages"]),
+                "seconds": round(document["seconds"], 3),
+                "processed_at": datetime.utcnow().isoformat() + "Z"
+            })
+            finish(document)
+    finally:
+        pipeline.close()
+        for durable in writer.close():
+            manifest.record(durable)
+        manifest.close()
+
+    elapsed = time.perf_counter() - started
+    stats.update({
+        "workers": workers,
+        "renderers": renderers,
+        "recycled_workers": pipeline.recycled,
+        "elapsed_seconds": round(elapsed, 2),
+        "documents_per_second": round(stats["documents"] / elapsed, 3) if elapsed else 0.0,
+        "pages_per_second": round(stats["pages"] / elapsed, 3) if elapsed else 0.0,
+        "pages_per_worker_hour": round(stats["pages"] / elapsed * 3600 / workers, 1) if elapsed else 0.0,
+        "mb_per_second": round(stats["bytes"] / elapsed / 1e6, 3) if elapsed else 0.0,
+        "document_seconds_p50": percentile(latencies, 0.5),
+        "document_seconds_p95": percentile(latencies, 0.95),
+        "shards": [str(path) for path in writer.shards_written]
+    })
+    return stats
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Bulk OCR a directory of PDFs/images without the HTTP API")
+    parser.add_argument("input_dir", help="Directory to walk (recursively) for PDF and image files")
+    parser.add_argument("--output", required=True, help="Directory for result shards and the resume manifest")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="OCR worker processes, each with its own engine")
+    parser.add_argument("--renderers", type=int, default=1, help="Processes rendering/decoding documents into shared memory")
+    parser.add_argument("--ring-slots", type=int, default=None, help="Shared-memory page slots (default: 2 per worker)")
+    parser.add_argument("--slot-mb", type=int, default=32,
+                        help="Size of one page slot; larger pages are sent through the queue instead")
+    parser.add_argument("--max-jobs-per-worker", type=int, default=int(os.getenv("OCR_ENGINE_MAX_JOBS", "1000")),
+                        help="Restart an OCR worker after this many pages (0 = never)")
+    parser.add_argument("--max-worker-rss-mb", type=int, default=int(os.getenv("OCR_ENGINE_MAX_RSS_MB", "3072")),
+                        help="Restart an OCR worker once its RSS exceeds this (0 = never)")
+    parser.add_argument("--format", choices=("ndjson", "parquet"), default="ndjson", help="Result shard format")
+    parser.add_argument("--shard-size", type=int, default=1000, help="Documents per result shard")
+    parser.add_argument("--resume", action="store_true", help="Skip documents already completed in the manifest")
+    parser.add_argument("--limit", type=int, default=None, help="Process at most N new documents")
+    return parser.parse_args(argv)
+
+
+def main_cli() -> int:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    args = parse_args()
+    input_dir = Path(args.input_dir)
+    if not input_dir.is_dir():
+        logger.error(f"Input directory not found: {input_dir}")
+        return 1
+
+    try:
+        stats = run(input_dir, Path(args.output), max(args.workers, 1), args.format,
+                    args.shard_size, args.resume, args.limit, max(args.renderers, 1),
+                    args.ring_slots, max(args.slot_mb, 1) * 1024 * 1024,
+                    args.max_jobs_per_worker, args.max_worker_rss_mb * 1024 * 1024)
+    except RuntimeError as e:
+        logger.error(str(e))
+        return 1
+
+    print(json.dumps({"summary": stats}, indent=2))
+    return 0 if stats["failed"] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
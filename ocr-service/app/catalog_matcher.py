@@ -0,0 +1,195 @@
+import os
+import re
+import time
+import threading
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+
+try:
+    # Built and shipped by scripts/catalog_index.py (mounted next to the app)
+    from catalog_index import CatalogIndex
+except ImportError:
+    CatalogIndex = None
+
+logger = logging.getLogger(__name__)
+
+UNIT_ALIASES = {
+    'szt': 'szt', 'sztuk': 'szt', 'sztuki': 'szt', 'pcs': 'szt', 'kpl': 'szt',
+    'mb': 'mb', 'm.b.': 'mb', 'mbież': 'mb',
+    'm2': 'm²', 'm²': 'm²', 'm^2': 'm²', 'mkw': 'm²',
+    'paczka': 'paczka', 'paczki': 'paczka', 'paczek': 'paczka', 'opak': 'paczka', 'op': 'paczka',
+    'kg': 'kg', 'l': 'l', 'litr': 'l',
+}
+
+# "12,5 m²", "3 szt.", "2x paczka"
+QUANTITY_PATTERN = re.compile(
+    r"(?<![\w,.])(\d+(?:[.,]\d+)?)\s*x?\s*(" + "|".join(
+        re.escape(unit) for unit in sorted(UNIT_ALIASES, key=len, reverse=True)
+    ) + r")\.?(?=[\s,;:|)]|$)",
+    re.IGNORECASE
+)
+
+# Amounts with two decimals, optional thousands separators and currency: "1 234,50 zł"
+PRICE_PATTERN = re.compile(r"(?<![\w.,])(\d{1,3}(?:[  ]\d{3})+|\d+)[.,](\d{2})(?![\d])\s*(?:zł|pln)?", re.IGNORECASE)
+
+# Item number in front of the description: "1.", "2)", "3 "
+LEADING_ORDINAL = re.compile(r"^\s*\d{1,3}(?:[.)]\s*|\s+)(?=[^\W\d])")
+
+# Totals and footer lines carry amounts but are not items
+SUMMARY_WORDS = re.compile(r"\b(razem|suma|do zapłaty|zapłacono|podsumowanie|w tym vat|netto razem)\b", re.IGNORECASE)
+
+
+def parse_amount(integer_part: str, fraction: str) -> float:
+    return float(re.sub(r"[  ]", "", integer_part) + "." + fraction)
+
+
+def parse_invoice_line(line: str) -> Dict[str, Any]:
+    """Split an OCR invoice item line into description, quantity, unit and prices."""
+    text = line
+    if not QUANTITY_PATTERN.match(text.strip()):
+        text = LEADING_ORDINAL.sub("", text)
+    quantity = unit = None
+    spans = []
+
+    quantity_match = QUANTITY_PATTERN.search(text)
+    if quantity_match:
+        quantity = float(quantity_match.group(1).replace(",", "."))
+        unit = UNIT_ALIASES[quantity_match.group(2).lower()]
+        spans.append(quantity_match.span())
+
+    prices = []
+    for match in PRICE_PATTERN.finditer(text):
+        if quantity_match and match.start() < quantity_match.end() and match.end() > quantity_match.start():
+            continue
+        prices.append(parse_amount(match.group(1), match.group(2)))
+        spans.append(match.span())
+
+    # Typical layout: ... quantity unit, unit price, (VAT), line total
+    unit_price = prices[0] if prices else None
+    line_total = prices[-1] if len(prices) > 1 else None
+    if quantity and len(prices) > 1:
+        for candidate in prices[:-1]:
+            if abs(candidate * quantity - prices[-1]) <= 0.02 * max(prices[-1], 1):
+                unit_price = candidate
+                break
+
+    description = text
+    for start, end in sorted(spans, reverse=True):
+        description = description[:start] + " " + description[end:]
+    description = " ".join(description.replace("|", " ").split())
+
+    return {
+        "line": line,
+        "description": description,
+        "quantity": quantity,
+        "unit": unit,
+        "unit_price": unit_price,
+        "line_total": line_total,
+        "is_item": quantity is not None or (bool(prices) and not SUMMARY_WORDS.search(text))
+    }
+
+
+class CatalogMatcher:
+    """
+    Matches invoice lines against the newest catalog index in ``catalog_dir``.
+
+    The directory is polled at most every ``reload_interval_seconds``; when a
+    newer ``*.idx`` file appears it is opened and swapped in atomically, so
+    requests in flight keep using the snapshot they started with.
+    """
+
+    def __init__(self, catalog_dir: Path, reload_interval_seconds: int = 30):
+        self.catalog_dir = Path(catalog_dir)
+        self.reload_interval_seconds = reload_interval_seconds
+        self.snapshot = None
+        self.snapshot_key = None
+        self.checked_at = 0.0
+        self.loaded_at = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "CatalogMatcher":
+        return cls(
+            catalog_dir=Path(os.getenv("CATALOG_DIR", "catalog")),
+            reload_interval_seconds=int(os.getenv("CATALOG_RELOAD_INTERVAL_SECONDS", "30"))
+        )
+
+    @property
+    def available(self) -> bool:
+        return CatalogIndex is not None
+
+    def latest_index_file(self) -> Optional[Path]:
+        if not self.catalog_dir.is_dir():
+            return None
+        candidates = [path for path in self.catalog_dir.glob("*.idx") if path.is_file()]
+        return max(candidates, key=lambda path: path.stat().st_mtime_ns) if candidates else None
+
+    def current(self) -> Optional["CatalogIndex"]:
+        """Return the active snapshot, reloading if a newer index file appeared."""
+        if CatalogIndex is None:
+            return None
+        now = time.monotonic()
+        if self.snapshot is not None and now - self.checked_at < self.reload_interval_seconds:
+            return self.snapshot
+
+        with self._lock:
+            if self.snapshot is not None and now - self.checked_at < self.reload_interval_seconds:
+                return self.snapshot
+            self.checked_at = now
+            path = self.latest_index_file()
+            if path is None:
+                return self.snapshot
+            stat = path.stat()
+            key = (str(path), stat.st_mtime_ns, stat.st_size)
+            if key != self.snapshot_key:
+                try:
+                    # The previous snapshot is released once no request references it
+                    self.snapshot = CatalogIndex(path)
+                    self.snapshot_key = key
+                    self.loaded_at = datetime.utcnow().isoformat() + "Z"
+                    logger.info(f"Loaded catalog index {path.name} ({len(self.snapshot)} products)")
+                except Exception as e:
+                    logger.error(f"Failed to load catalog index {path}: {str(e)}")
+            return self.snapshot
+
+    def match_lines(self, lines: List[str], top_k: int = 3, min_score: float = 0.3,
+                    items_only: bool = True) -> List[Dict[str, Any]]:
+        """Parse and match all lines in one pass over the current snapshot."""
+        index = self.current()
+        if index is None:
+            raise RuntimeError("No catalog index loaded")
+
+        parsed = [parse_invoice_line(line) for line in lines if line and line.strip()]
+        if items_only:
+            parsed = [item for item in parsed if item["is_item"]]
+
+        # Identical descriptions (repeated items) are searched once
+        unique = list(dict.fromkeys(item["description"] for item in parsed))
+        results = dict(zip(unique, index.search_many(unique, k=top_k, min_score=min_score)))
+
+        for item in parsed:
+            item["matches"] = [
+                {
+                    "product_code": product["product_code"],
+                    "product_name": product["product_name"],
+                    "score": score,
+                    "selling_unit": product.get("selling_unit"),
+                    "selling_price_per_unit": product.get("selling_price_per_unit")
+                }
+                for score, product in results[item["description"]]
+            ]
+            item["product_code"] = item["matches"][0]["product_code"] if item["matches"] else None
+        return parsed
+
+    def status(self) -> Dict[str, Any]:
+        snapshot = self.snapshot
+        return {
+            "available": self.available,
+            "catalog_dir": str(self.catalog_dir),
+            "index_file": self.snapshot_key[0] if self.snapshot_key else None,
+            "products": len(snapshot) if snapshot is not None else 0,
+            "loaded_at": self.loaded_at
+        }
+
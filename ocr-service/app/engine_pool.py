@@ -0,0 +1,276 @@
+import os
+import time
+import queue
+import threading
+import logging
+import multiprocessing
+from typing import Optional, Dict, Any, List
+
+import numpy as np
+
+from page_ring import PageRing
+from memory_limits import current_rss_bytes
+
+logger = logging.getLogger(__name__)
+
+
+def create_paddle_ocr():
+    """PaddleOCR with Polish support, as used by every engine."""
+    from paddleocr import PaddleOCR
+    # Using multilingual model with Polish and English
+    return PaddleOCR(
+        use_angle_cls=True,
+        lang='pl',  # Polish language support
+        show_log=False,
+        use_gpu=False,  # CPU mode for better compatibility
+        enable_mkldnn=True  # Enable Intel MKL-DNN for better CPU performance
+    )
+
+
+def _engine_main(conn, ring_info) -> None:
+    """Engine process: OCR page images from a one-slot PageRing until told to stop."""
+    ring = PageRing.attach(*ring_info)
+    engine = create_paddle_ocr()
+    conn.send(("ready", None, current_rss_bytes()))
+    try:
+        while True:
+            message = conn.recv()
+            if message is None:
+                break
+            shape, dtype, payload = message
+            try:
+                image = payload if payload is not None else ring.view(0, shape, dtype)
+                conn.send(("ok", engine.ocr(image, cls=True), current_rss_bytes()))
+            except Exception as e:
+                conn.send(("error", str(e), current_rss_bytes()))
+            finally:
+                image = None
+    finally:
+        ring.close()
+
+
+class EngineProcess:
+    """One PaddleOCR engine in a child process; pages travel through shared memory."""
+
+    def __init__(self, index: int, slot_bytes: int = 32 * 1024 * 1024, startup_timeout: float = 300.0):
+        self.index = index
+        self.slot_bytes = slot_bytes
+        self.startup_timeout = startup_timeout
+        self.process = None
+        self.conn = None
+        self.ring = None
+        self.jobs = 0
+        self.rss_bytes = 0
+        self.restarts = 0
+        self.started_at = None
+        self.crashed = False
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def start(self) -> None:
+        # spawn: the child must not inherit the service's threads or sockets
+        context = multiprocessing.get_context("spawn")
+        self.ring = PageRing(1, self.slot_bytes)
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_engine_main, name=f"ocr-engine-{self.index}", daemon=True,
+                                       args=(child_conn, (self.ring.name, 1, self.slot_bytes)))
+        self.process.start()
+        child_conn.close()
+        try:
+            if not self.conn.poll(self.startup_timeout):
+                raise RuntimeError(f"OCR engine {self.index} did not start within {self.startup_timeout:.0f}s")
+            _, _, self.rss_bytes = self.conn.recv()
+        except (EOFError, OSError):
+            exitcode = self.process.exitcode
+            self.stop()
+            raise RuntimeError(f"OCR engine {self.index} exited during startup (code {exitcode})")
+        except RuntimeError:
+            self.stop()
+            raise
+        self.jobs = 0
+        self.crashed = False
+        self.started_at = time.time()
+        logger.info(f"OCR engine {self.index} started (pid {self.process.pid}, {self.rss_bytes / 1e6:.0f} MB)")
+
+    def ocr(self, image_array: np.ndarray) -> Any:
+        try:
+            if self.ring.fits(image_array.shape, image_array.dtype.str):
+                shape, dtype = self.ring.write(0, image_array)
+                self.conn.send((shape, dtype, None))
+            else:
+                self.conn.send((image_array.shape, image_array.dtype.str, np.ascontiguousarray(image_array)))
+            while not self.conn.poll(1.0):
+                if not self.process.is_alive():
+                    raise EOFError
+            status, payload, self.rss_bytes = self.conn.recv()
+        except (EOFError, OSError):
+            self.crashed = True
+            self.process.join(timeout=5)
+            raise RuntimeError(f"OCR engine {self.index} exited (code {self.process.exitcode}), "
+                               f"probably out of memory")
+        self.jobs += 1
+        if status == "error":
+            raise RuntimeError(payload)
+        return payload
+
+    def stop(self) -> None:
+        """Let the engine finish and exit; kill it if it does not."""
+        if self.process is not None:
+            try:
+                if self.process.is_alive():
+                    self.conn.send(None)
+            except OSError:
+                pass
+            self.process.join(timeout=10)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join()
+            self.conn.close()
+            self.process = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def usage(self) -> Dict[str, Any]:
+        alive = self.alive
+        rss_bytes = (current_rss_bytes(self.process.pid) or self.rss_bytes) if alive else 0
+        return {
+            "engine": self.index,
+            "pid": self.process.pid if self.process is not None else None,
+            "alive": alive,
+            "jobs": self.jobs,
+            "rss_mb": round(rss_bytes / 1e6, 1),
+            "restarts": self.restarts,
+            "uptime_seconds": round(time.time() - self.started_at) if self.started_at and alive else 0
+        }
+
+
+class EnginePool:
+    """
+    PaddleOCR engines, each in its own recyclable process.
+
+    The inference runtime's RSS grows over thousands of pages, so an engine is
+    retired after ``max_jobs`` pages or once its RSS passes ``max_rss_bytes``.
+    Retiring happens between pages (the engine is idle, nothing is in flight)
+    and on a background thread, so the caller gets its result first and other
+    engines keep serving while the replacement loads. A crashed engine (e.g.
+    OOM-killed) fails only its current page and is replaced the same way.
+
+    With ``processes=0`` a single engine runs inside this process instead,
+    for callers that are themselves worker processes (see bulk_ocr.py).
+    """
+
+    def __init__(self, processes: int = 1, max_jobs: int = 1000, max_rss_bytes: int = 0,
+                 slot_bytes: int = 32 * 1024 * 1024):
+        self.processes = processes
+        self.max_jobs = max_jobs
+        self.max_rss_bytes = max_rss_bytes
+        self.slot_bytes = slot_bytes
+        self.engines: List[EngineProcess] = []
+        self.idle: "queue.Queue[EngineProcess]" = queue.Queue()
+        self.recycled = {"jobs": 0, "rss": 0, "crashed": 0}
+        self.inline_engine = None
+        self.inline_jobs = 0
+        self._inline_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "EnginePool":
+        return cls(
+            processes=int(os.getenv("OCR_ENGINE_PROCESSES", os.getenv("OCR_ENGINE_SLOTS", "1"))),
+            max_jobs=int(os.getenv("OCR_ENGINE_MAX_JOBS", "1000")),
+            max_rss_bytes=int(os.getenv("OCR_ENGINE_MAX_RSS_MB", "3072")) * 1024 * 1024,
+            slot_bytes=int(os.getenv("OCR_ENGINE_SLOT_MB", "32")) * 1024 * 1024
+        )
+
+    def start(self) -> None:
+        """Start the engine processes (blocks until their models are loaded)."""
+        if self.processes <= 0 or self.engines:
+            return
+        for index in range(self.processes):
+            engine = EngineProcess(index, self.slot_bytes)
+            engine.start()
+            self.engines.append(engine)
+            self.idle.put(engine)
+
+    def stop(self) -> None:
+        for engine in self.engines:
+            engine.stop()
+        self.engines = []
+        self.idle = queue.Queue()
+
+    def ocr(self, image_array: np.ndarray) -> Any:
+        """Run PaddleOCR (with angle classification) on one page image."""
+        if self.processes <= 0:
+            with self._inline_lock:
+                if self.inline_engine is None:
+                    self.inline_engine = create_paddle_ocr()
+                self.inline_jobs += 1
+                return self.inline_engine.ocr(image_array, cls=True)
+
+        engine = self.idle.get()
+        try:
+            return engine.ocr(image_array)
+        finally:
+            reason = self._retire_reason(engine)
+            if reason is None:
+                self.idle.put(engine)
+            else:
+                threading.Thread(target=self._recycle, args=(engine, reason),
+                                 name=f"ocr-engine-recycle-{engine.index}", daemon=True).start()
+
+    def _retire_reason(self, engine: EngineProcess) -> Optional[str]:
+        if engine.crashed or not engine.alive:
+            return "crashed"
+        if self.max_jobs and engine.jobs >= self.max_jobs:
+            return "jobs"
+        if self.max_rss_bytes and engine.rss_bytes >= self.max_rss_bytes:
+            return "rss"
+        return None
+
+    def _recycle(self, engine: EngineProcess, reason: str) -> None:
+        logger.info(f"Recycling OCR engine {engine.index} ({reason}: {engine.jobs} pages, "
+                    f"{engine.rss_bytes / 1e6:.0f} MB)")
+        self.recycled[reason] += 1
+        engine.stop()
+        while True:
+            try:
+                engine.start()
+                break
+            except Exception as e:
+                logger.error(f"Failed to restart OCR engine {engine.index}: {str(e)}")
+                engine.stop()
+                time.sleep(10)
+        engine.restarts += 1
+        self.idle.put(engine)
+
+    def usage(self) -> Dict[str, Any]:
+        """Memory and job counts per engine, for /health."""
+        if self.processes <= 0:
+            workers = [{"engine": 0, "pid": os.getpid(), "alive": True, "jobs": self.inline_jobs,
+                        "rss_mb": round(current_rss_bytes() / 1e6, 1), "restarts": 0}]
+        else:
+            workers = [engine.usage() for engine in self.engines]
+        return {
+            "mode": "process" if self.processes > 0 else "inline",
+            "max_jobs_per_engine": self.max_jobs,
+            "max_rss_mb": round(self.max_rss_bytes / 1024 / 1024),
+            "service_rss_mb": round(current_rss_bytes() / 1e6, 1),
+            "recycled": dict(self.recycled),
+            "workers": workers
+        }
+
+    def prometheus_metrics(self) -> List[str]:
+        usage = self.usage()
+        lines = [
+            "# HELP ocr_engine_rss_bytes Resident memory per OCR engine process",
+            "# TYPE ocr_engine_rss_bytes gauge",
+        ]
+        for worker in usage["workers"]:
+            lines.append(f'ocr_engine_rss_bytes{{engine="{worker["engine"]}"}} {int(worker["rss_mb"] * 1e6)}')
+        lines.append("# HELP ocr_engine_recycled_total OCR engine restarts by reason")
+        lines.append("# TYPE ocr_engine_recycled_total counter")
+        for reason, count in usage["recycled"].items():
+            lines.append(f'ocr_engine_recycled_total{{reason="{reason}"}} {count}')
+        return lines
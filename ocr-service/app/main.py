@@ -1,21 +1,37 @@
 import os
-import uuid
 import jwt
+import json
+import asyncio
+import sqlite3
+import threading
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Union, Callable, Tuple
 from pathlib import Path
 
 from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
 
-from paddleocr import PaddleOCR
 import fitz  # PyMuPDF
 from PIL import Image
+import numpy as np
 import io
 import logging
 
+from storage import UploadStorage, StoredUpload
+from catalog_matcher import CatalogMatcher
+from scheduler import OcrScheduler, OcrJob, SchedulerRejected
+from page_cache import page_content_key
+from page_ring import PDF_RENDER_ZOOM, pixmap_array
+from ocr_pipeline import OcrPipeline
+from memory_limits import OcrBudget, BudgetExceeded
+from ocr_index import OcrSearchIndex
+from ocr_jobs import OcrJobStore
+from page_selection import DocumentClassifier, parse_page_selection
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -41,20 +57,40 @@ security = HTTPBearer()
 
 # Environment variables
 JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key-here")
-UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
-
-# Initialize PaddleOCR with Polish support
-logger.info("Initializing PaddleOCR with Polish language support...")
-# Using multilingual model with Polish and English
-ocr = PaddleOCR(
-    use_angle_cls=True, 
-    lang='pl',  # Polish language support
-    show_log=False,
-    use_gpu=False,  # CPU mode for better compatibility
-    enable_mkldnn=True  # Enable Intel MKL-DNN for better CPU performance
-)
-logger.info("PaddleOCR initialized successfully with Polish language support")
+
+# Upload storage with retention policy (UPLOAD_TTL_SECONDS, UPLOAD_MAX_TOTAL_BYTES, ...)
+upload_storage = UploadStorage.from_env()
+UPLOAD_DIR = upload_storage.root
+
+# Product catalog snapshot for matching invoice lines (hot-reloaded)
+catalog_matcher = CatalogMatcher.from_env()
+
+# Page OCR: PaddleOCR (Polish) engines in recyclable worker processes (OCR_ENGINE_PROCESSES,
+# OCR_ENGINE_MAX_*), lexicon-based Polish post-correction memory-mapped and shared by workers
+# (OCR_LEXICON_PATH) and a cache for repeated pages such as terms and conditions (OCR_PAGE_CACHE_*)
+ocr_pipeline = OcrPipeline.from_env(catalog_matcher)
+polish_corrector = ocr_pipeline.corrector
+page_cache = ocr_pipeline.page_cache
+ocr_engines = ocr_pipeline.engines
+
+# Per-tenant fair scheduling of OCR pages (OCR_ENGINE_SLOTS, OCR_DEFAULT_*, ...)
+ocr_scheduler = OcrScheduler.from_env()
+
+# Pixel and page budgets checked before decoding (OCR_MAX_PAGES, OCR_MAX_*_PIXELS)
+ocr_budget = OcrBudget.from_env()
+
+# Optional full-text index of OCR results for GET /ocr/search (OCR_INDEX_PATH, disabled when empty)
+ocr_index = OcrSearchIndex.from_env()
+if ocr_index.retention_seconds > 0:
+    # Indexed text is kept for good unless OCR_INDEX_RETENTION_SECONDS is set
+    upload_storage.sweep_hooks.append(ocr_index.prune)
+
+# Asynchronous OCR jobs polled through GET /ocr/jobs/{job_id} (OCR_JOB_TTL_SECONDS, OCR_JOB_MAX_JOBS)
+ocr_jobs = OcrJobStore.from_env()
+background_tasks = set()
+
+# Cheap first-page check deciding whether a PDF is worth full OCR (?classify=true, OCR_CLASSIFY_*)
+document_classifier = DocumentClassifier.from_env()
 
 # Supported file types
 SUPPORTED_EXTENSIONS = {'.pdf', '.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif'}
@@ -92,274 +128,423 @@ def verify_jwt_token(credentials: HTTPAuthorizationCredentials = Depends(securit
 
 
 def clean_polish_text(text: str) -> str:
-    """Clean and fix Polish characters that might be misrecognized by OCR."""
-    if not text:
-        return text
-    
-    # OCR often misrecognizes Polish characters - let's fix common patterns
-    corrections = {
-        # Direct character replacements based on common OCR mistakes
-        'q': 'ą',  # ą often read as q
-        'Q': 'Ą',  # Ą often read as Q
-        
-        # Context-based word corrections for Polish text
-        'Spaaka': 'Spółka',
-        'urawia': 'Żurawia',
-        'Kraktw': 'Kraków', 
-        'dbowy': 'dębowy',
-        'Montal': 'Montaż',
-        'podtogi': 'podłogi',
-        'czyo': 'Łączyło',
-        'ZAPATY': 'ZAPŁATY',
-        
-        # Common character patterns
-        'l/': 'ł', 'L/': 'Ł',  # ł with slash
-        'c\'': 'ć', 'C\'': 'Ć',  # ć with apostrophe
-        'n\'': 'ń', 'N\'': 'Ń',  # ń with apostrophe
-        's\'': 'ś', 'S\'': 'Ś',  # ś with apostrophe
-        'z\'': 'ź', 'Z\'': 'Ź',  # ź with apostrophe
-        'z.': 'ż', 'Z.': 'Ż',   # ż with dot
-        
-        # Single character context fixes
-        ' z ': ' zł ',  # currency
-        ' z\n': ' zł\n',
-        ' z$': ' zł',
-    }
-    
-    cleaned_text = text
-    for mistake, correct in corrections.items():
-        cleaned_text = cleaned_text.replace(mistake, correct)
-    
-    # Additional Polish context fixes
-    import re
-    
-    # Fix standalone 'l' that should be 'ł' in Polish context
-    cleaned_text = re.sub(r'\bul\b', 'ul.', cleaned_text)  # ulica
-    cleaned_text = re.sub(r'\busl\b', 'usł.', cleaned_text)  # usługa
-    
-    return cleaned_text
+    """Fix Polish words misrecognized by OCR against the lexicon (lost diacritics, misread letters)."""
+    return ocr_pipeline.clean_text(text)
 
 
-def process_image_ocr(image_data: bytes) -> Dict[str, Any]:
-    """Process image data with PaddleOCR and return extracted text with coordinates with Polish support."""
+def decode_image(image_data: bytes) -> np.ndarray:
+    """Decode image bytes into the numpy array PaddleOCR expects."""
     try:
-        # Convert bytes to PIL Image
+        # Convert bytes to PIL Image, then to numpy array for PaddleOCR
         image = Image.open(io.BytesIO(image_data))
-        
-        # Get image dimensions
-        image_width, image_height = image.size
-        
-        # Convert PIL Image to numpy array for PaddleOCR
-        import numpy as np
-        image_array = np.array(image)
-        
-        # Run OCR
-        result = ocr.ocr(image_array, cls=True)
-        
-        # Process OCR results with full data
-        lines = []
-        text_blocks = []
-        combined_text = []
-        
-        if result and result[0]:
-            for line in result[0]:
-                if line and len(line) >= 2:
-                    # Extract coordinates and text
-                    coordinates = line[0]  # [[x1,y1], [x2,y2], [x3,y3], [x4,y4]]
-                    text_data = line[1]    # (text, confidence)
-                    
-                    text = text_data[0] if isinstance(text_data, (list, tuple)) else str(text_data)
-                    confidence = text_data[1] if isinstance(text_data, (list, tuple)) and len(text_data) > 1 else 1.0
-                    
-                    # Clean Polish text
-                    text = clean_polish_text(text)
-                    
-                    if text.strip():
-                        # Calculate bounding box
-                        x_coords = [point[0] for point in coordinates]
-                        y_coords = [point[1] for point in coordinates]
-                        
-                        bbox = {
-                            "x": min(x_coords),
-                            "y": min(y_coords),
-                            "width": max(x_coords) - min(x_coords),
-                            "height": max(y_coords) - min(y_coords)
-                        }
-                        
-                        text_block = {
-                            "text": text.strip(),
-                            "confidence": confidence,
-                            "coordinates": coordinates,
-                            "bbox": bbox
-                        }
-                        
-                        lines.append(text.strip())
-                        text_blocks.append(text_block)
-                        combined_text.append(text.strip())
-        
-        # Additional Polish text cleaning for combined text
-        combined_text_cleaned = [clean_polish_text(line) for line in combined_text]
-        
-        return {
-            "lines": [clean_polish_text(line) for line in lines],
-            "text_blocks": text_blocks,
-            "combined_text": "\n".join(combined_text_cleaned),
-            "image_dimensions": {
-                "width": image_width,
-                "height": image_height
-            },
-            "language": "Polish (pl) with fallback to English",
-            "processing_info": {
-                "polish_chars_supported": True,
-                "char_cleaning_applied": True,
-                "supported_chars": "ą ć ę ł ń ó ś ź ż"
-            }
-        }
-        
+        return np.array(image)
     except Exception as e:
-        logger.error(f"Error processing image OCR: {str(e)}")
+        logger.error(f"Error decoding image: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error processing image: {str(e)}"
         )
 
 
-def process_pdf_ocr(pdf_path: Path) -> List[Dict[str, Any]]:
-    """Process PDF file and return OCR results for each page."""
+def process_image_array_ocr(image_array: np.ndarray) -> Dict[str, Any]:
+    """Run PaddleOCR on a decoded image (e.g. a view over shared memory) and return text with coordinates."""
     try:
-        pages_data = []
-        
-        # Open PDF
-        pdf_document = fitz.open(pdf_path)
-        
-        for page_num in range(len(pdf_document)):
-            page = pdf_document.load_page(page_num)
-            
-            # Convert page to image
-            mat = fitz.Matrix(2.0, 2.0)  # 2x zoom for better OCR quality
-            pix = page.get_pixmap(matrix=mat)
-            img_data = pix.tobytes("png")
-            
-            # Process with OCR
-            ocr_result = process_image_ocr(img_data)
-            
-            pages_data.append({
-                "page": page_num + 1,
-                "text": ocr_result["combined_text"],
-                "text_blocks": ocr_result["text_blocks"],
-                "image_dimensions": ocr_result["image_dimensions"]
-            })
-        
-        pdf_document.close()
-        return pages_data
-        
+        return ocr_pipeline.ocr_image(image_array)
+    except Exception as e:
+        raise image_ocr_error(e)
+
+
+def image_ocr_error(error: Exception) -> HTTPException:
+    logger.error(f"Error processing image OCR: {str(error)}")
+    return HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        detail=f"Error processing image: {str(error)}"
+    )
+
+
+def open_pdf_document(pdf_source: Union[Path, bytes]) -> "fitz.Document":
+    """Open a PDF from a file path or from in-memory bytes."""
+    if isinstance(pdf_source, (bytes, bytearray)):
+        return fitz.open(stream=pdf_source, filetype="pdf")
+    return fitz.open(pdf_source)
+
+
+def render_pdf_page(pdf_document: "fitz.Document", page_num: int) -> "fitz.Pixmap":
+    """Render one PDF page for OCR; read its pixels with pixmap_array (no PNG round trip)."""
+    page = pdf_document.load_page(page_num)
+    
+    # 2x zoom for better OCR quality (the zoom OcrBudget.check_pdf counts pixels with)
+    mat = fitz.Matrix(PDF_RENDER_ZOOM, PDF_RENDER_ZOOM)
+    return page.get_pixmap(matrix=mat)
+
+
+def ocr_page(page_number: int, image_data: bytes, cache_namespace: Optional[str] = None,
+             content_key: Optional[str] = None) -> Dict[str, Any]:
+    """OCR one page image and return it in the response page format."""
+    return ocr_page_array(page_number, decode_image(image_data), cache_namespace, content_key)
+
+
+def ocr_page_array(page_number: int, image_array: np.ndarray, cache_namespace: Optional[str] = None,
+                   content_key: Optional[str] = None) -> Dict[str, Any]:
+    """OCR one decoded page image, using the page cache when a namespace (tenant) is given."""
+    try:
+        return ocr_pipeline.ocr_page(page_number, image_array, cache_namespace, content_key)
+    except Exception as e:
+        raise image_ocr_error(e)
+
+
+def build_page_tasks(upload: StoredUpload, file_extension: str, cache_namespace: Optional[str] = None,
+                     pages: Optional[str] = None) -> Tuple[List[Callable[[], Dict[str, Any]]], Callable[[], None]]:
+    """Split a stored upload into OCR tasks for the selected pages; returns (tasks, close)."""
+    if file_extension != '.pdf':
+        try:
+            parse_page_selection(pages, 1)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        try:
+            ocr_budget.check_image(io.BytesIO(upload.data) if upload.data is not None else upload.path)
+        except BudgetExceeded as e:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Error processing image: {str(e)}"
+            )
+        return [lambda: ocr_page(1, upload.read_bytes(), cache_namespace)], lambda: None
+    
+    try:
+        pdf_document = open_pdf_document(upload.data if upload.data is not None else upload.path)
     except Exception as e:
-        logger.error(f"Error processing PDF: {str(e)}")
+        logger.error(f"Error opening PDF: {str(e)}")
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Error processing PDF: {str(e)}"
         )
+    
+    try:
+        page_numbers = parse_page_selection(pages, len(pdf_document))
+        ocr_budget.check_pdf(pdf_document, page_numbers)
+    except BudgetExceeded as e:
+        pdf_document.close()
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except ValueError as e:
+        pdf_document.close()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    # PyMuPDF documents must not be used from several threads at once
+    document_lock = threading.Lock()
+    
+    def page_task(page_num: int) -> Callable[[], Dict[str, Any]]:
+        def run() -> Dict[str, Any]:
+            content_key = None
+            with document_lock:
+                if cache_namespace is not None and page_cache.enabled:
+                    # A content-stream hit skips rendering as well as OCR
+                    content_key = page_content_key(pdf_document, page_num)
+                    cached = page_cache.lookup(cache_namespace, page_num + 1, content_key=content_key)
+                    if cached is not None:
+                        return cached
+                pixmap = render_pdf_page(pdf_document, page_num)
+            # The array is a view of the pixmap's samples, which stays referenced until OCR returns
+            return ocr_page_array(page_num + 1, pixmap_array(pixmap), cache_namespace, content_key)
+        return run
+    
+    def close() -> None:
+        with document_lock:
+            pdf_document.close()
+    
+    return [page_task(page_num) for page_num in page_numbers], close
 
 
-def process_image_file_ocr(image_path: Path) -> List[Dict[str, Any]]:
-    """Process image file and return OCR results."""
+def submit_scheduled_ocr(claims: Dict[str, Any], upload: StoredUpload, file_extension: str,
+                         on_page: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+                         pages: Optional[str] = None) -> OcrJob:
+    """Queue the selected pages of an upload on the fair scheduler under the caller's tenant quota."""
+    quota = ocr_scheduler.quota_for(claims)
+    # The page cache is per tenant so cached text never crosses tenants
+    page_tasks, close = build_page_tasks(upload, file_extension, cache_namespace=quota.tenant, pages=pages)
     try:
-        with open(image_path, 'rb') as f:
-            image_data = f.read()
-        
-        ocr_result = process_image_ocr(image_data)
-        
-        return [{
-            "page": 1,
-            "text": ocr_result["combined_text"],
-            "text_blocks": ocr_result["text_blocks"],
-            "image_dimensions": ocr_result["image_dimensions"]
-        }]
-        
+        # Closed once every page task has run or been skipped, not when the first page fails
+        job = ocr_scheduler.submit(quota, page_tasks, on_page=on_page, on_finished=close)
+    except SchedulerRejected as e:
+        close()
+        raise HTTPException(status_code=e.status_code, detail=e.detail,
+                            headers={"Retry-After": str(e.retry_after)})
+    return job
+
+
+async def run_scheduled_ocr(claims: Dict[str, Any], upload: StoredUpload, file_extension: str,
+                            pages: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Run the selected pages of an upload through the fair scheduler and return them in page order."""
+    return await submit_scheduled_ocr(claims, upload, file_extension, pages=pages).future
+
+
+async def classify_upload(claims: Dict[str, Any], upload: StoredUpload, file_extension: str) -> Optional[Dict[str, Any]]:
+    """
+    Classify a PDF from its first page before full OCR (None for images).
+    
+    Uses the text layer when there is one; scans are OCR'd as a thumbnail,
+    scheduled like any other page under the caller's quota.
+    """
+    if file_extension != '.pdf':
+        return None
+    try:
+        pdf_document = open_pdf_document(upload.data if upload.data is not None else upload.path)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Error processing PDF: {str(e)}")
+    
+    try:
+        if len(pdf_document) == 0:
+            return None
+        text, source = document_classifier.text_layer(pdf_document), "text_layer"
+        if text is None:
+            source = "thumbnail"
+            thumbnail_task = lambda: process_image_array_ocr(document_classifier.thumbnail(pdf_document))["combined_text"]
+            try:
+                text, = await ocr_scheduler.run(ocr_scheduler.quota_for(claims), [thumbnail_task])
+            except SchedulerRejected as e:
+                raise HTTPException(status_code=e.status_code, detail=e.detail,
+                                    headers={"Retry-After": str(e.retry_after)})
+        classification = document_classifier.classify(text, source, len(pdf_document))
+    finally:
+        pdf_document.close()
+    
+    logger.info(f"Classified {upload.name} as {classification['label']} ({source}, "
+                f"keywords: {', '.join(classification['keywords']) or 'none'})")
+    return classification
+
+
+def request_extras(pages: Optional[str], classification: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Fields added to the /ocr response for page selection and classification."""
+    extra: Dict[str, Any] = {}
+    if pages:
+        extra["page_selection"] = pages
+    if classification is not None:
+        extra["classification"] = classification
+        extra["ocr_skipped"] = not classification["run_ocr"]
+    return extra
+
+
+def build_ocr_response(claims: Dict[str, Any], upload: StoredUpload, pages_data: List[Dict[str, Any]],
+                       extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """/ocr response body for finished pages; also adds the document to the search index."""
+    # Combine all text
+    all_text = "\n\n".join([page["text"] for page in pages_data])
+    
+    # Extract all lines
+    all_lines = []
+    for page in pages_data:
+        page_lines = page["text"].split("\n")
+        all_lines.extend([line.strip() for line in page_lines if line.strip()])
+    
+    # Get user ID from JWT
+    user_id = claims.get("sub") or claims.get("user_id") or claims.get("id")
+    
+    # Prepare response
+    response = {
+        "filename": upload.display_name,
+        "text": all_text,
+        "pages": pages_data,
+        "lines": all_lines,
+        "uploaded_by_user_id": user_id,
+        "created_at": datetime.utcnow().isoformat() + "Z"
+    }
+    response.update(extra or {})
+    
+    # Make the result searchable for the tenant (GET /ocr/search)
+    if ocr_index.enabled and pages_data:
+        try:
+            response["index_document_id"] = ocr_index.add_document(
+                ocr_scheduler.quota_for(claims).tenant, user_id, upload.display_name,
+                pages_data, response["created_at"]
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Failed to index OCR result of {upload.name}: {str(e)}")
+    
+    cached_pages = sum(1 for page in pages_data if page.get("cached"))
+    logger.info(f"Successfully processed {upload.name}: {len(pages_data)} pages ({cached_pages} from cache), {len(all_lines)} lines")
+    return response
+
+
+def finish_upload(upload: StoredUpload, failed: bool) -> None:
+    """In-memory uploads are not retained; disk/tmpfs ones expire via the sweeper unless OCR failed."""
+    if failed or upload.location == 'memory':
+        upload.discard()
+    else:
+        upload.release()
+
+
+def error_detail(error: BaseException) -> Tuple[int, str]:
+    """(status code, detail) reported for an OCR failure."""
+    if isinstance(error, HTTPException):
+        return error.status_code, str(error.detail)
+    return status.HTTP_500_INTERNAL_SERVER_ERROR, f"Unexpected error: {str(error)}"
+
+
+def stream_scheduled_ocr(claims: Dict[str, Any], upload: StoredUpload, file_extension: str,
+                         pages: Optional[str] = None, extra: Optional[Dict[str, Any]] = None) -> StreamingResponse:
+    """
+    NDJSON stream of an OCR run: a ``{"type": "page", ...}`` line per page as
+    it finishes (in completion order), then one ``{"type": "done", ...}`` line
+    with the document result minus its pages, or ``{"type": "error", ...}``.
+    
+    The upload is released when the OCR job ends, not by the response body,
+    which never runs if the client is gone before streaming starts.
+    """
+    finished: asyncio.Queue = asyncio.Queue()
+    job = None
+    if extra and extra.get("ocr_skipped"):
+        finished.put_nowait(None)
+        finish_upload(upload, failed=False)
+    else:
+        job = submit_scheduled_ocr(claims, upload, file_extension, pages=pages,
+                                   on_page=lambda index, page: finished.put_nowait(page))
+        job.future.add_done_callback(lambda _: finished.put_nowait(None))
+        job.future.add_done_callback(
+            lambda future: finish_upload(upload, failed=future.cancelled() or future.exception() is not None))
+
+    async def lines():
+        while True:
+            page = await finished.get()
+            if page is None:
+                break
+            yield json.dumps(jsonable_encoder({"type": "page", **page}), ensure_ascii=False) + "\n"
+        try:
+            result = build_ocr_response(claims, upload, job.future.result() if job else [], extra)
+            summary = {"type": "done", "page_count": len(result["pages"]),
+                       **{key: value for key, value in result.items() if key != "pages"}}
+        except Exception as e:
+            status_code, detail = error_detail(e)
+            logger.error(f"Streaming OCR of {upload.name} failed: {detail}")
+            summary = {"type": "error", "status_code": status_code, "detail": detail}
+        yield json.dumps(jsonable_encoder(summary), ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+async def run_ocr_job(job_id: str, job: OcrJob, claims: Dict[str, Any], upload: StoredUpload,
+                      extra: Optional[Dict[str, Any]] = None) -> None:
+    """Background task behind POST /ocr/jobs: wait for the pages and record the result."""
+    failed = True
+    try:
+        ocr_jobs.finish(job_id, result=build_ocr_response(claims, upload, await job.future, extra))
+        failed = False
     except Exception as e:
-        logger.error(f"Error processing image file: {str(e)}")
+        status_code, detail = error_detail(e)
+        logger.error(f"OCR job {job_id} failed: {detail}")
+        ocr_jobs.finish(job_id, error=detail, status_code=status_code)
+    finally:
+        finish_upload(upload, failed)
+
+
+@app.on_event("startup")
+async def start_upload_sweeper():
+    """Apply the upload retention policy in the background."""
+    upload_storage.start_sweeper()
+
+
+@app.on_event("startup")
+async def start_ocr_engines():
+    """Load PaddleOCR in the engine processes before taking requests."""
+    logger.info("Initializing PaddleOCR with Polish language support...")
+    ocr_engines.start()
+    logger.info("PaddleOCR initialized successfully with Polish language support")
+
+
+@app.on_event("startup")
+async def start_ocr_scheduler():
+    ocr_scheduler.start()
+
+
+@app.on_event("startup")
+async def load_polish_lexicon():
+    polish_corrector.load()
+
+
+@app.on_event("shutdown")
+async def stop_upload_sweeper():
+    upload_storage.stop_sweeper()
+
+
+@app.on_event("shutdown")
+async def stop_ocr_scheduler():
+    ocr_scheduler.stop()
+
+
+@app.on_event("shutdown")
+async def stop_ocr_engines():
+    ocr_engines.stop()
+
+
+@app.on_event("shutdown")
+async def close_ocr_index():
+    ocr_index.close()
+
+
+def validate_extension(file: UploadFile) -> str:
+    """Lowercase extension of an upload; 400 if the type is not supported."""
+    file_extension = Path(file.filename).suffix.lower() if file.filename else ""
+    if file_extension not in SUPPORTED_EXTENSIONS:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error processing image file: {str(e)}"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported file type. Supported: {', '.join(SUPPORTED_EXTENSIONS)}"
         )
+    return file_extension
 
 
 @app.post("/ocr")
 async def process_ocr(
     file: UploadFile = File(...),
+    stream: bool = False,
+    pages: Optional[str] = None,
+    classify: bool = False,
     current_user: Dict[str, Any] = Depends(verify_jwt_token)
 ):
     """
     Process PDF or image file with OCR and return extracted text.
     
     - **file**: PDF or JPG/PNG file to process
+    - **stream**: return NDJSON, one line per page as soon as it is done, then a summary line
+    - **pages**: pages to OCR, e.g. `first`, `last`, `1-3,7`, `5-last` (default: all)
+    - **classify**: check the first page (text layer or thumbnail) and skip OCR unless it may be an invoice
     - **Authorization**: Bearer JWT token required
     
     Returns JSON with extracted text, pages, and metadata.
     """
     
     # Validate file type
-    file_extension = Path(file.filename).suffix.lower() if file.filename else ""
-    if file_extension not in SUPPORTED_EXTENSIONS:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Unsupported file type. Supported: {', '.join(SUPPORTED_EXTENSIONS)}"
-        )
+    file_extension = validate_extension(file)
     
-    # Generate unique filename
-    unique_id = str(uuid.uuid4())
-    filename = f"ocr_{unique_id}{file_extension}"
-    file_path = UPLOAD_DIR / filename
+    # Store upload (sharded on disk, or in RAM/tmpfs for small documents)
+    contents = await file.read()
+    upload = upload_storage.save(contents, file_extension)
+    filename = upload.name
     
     try:
-        # Save uploaded file
-        contents = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(contents)
-        
-        logger.info(f"Processing file: {filename} (type: {file_extension})")
-        
-        # Process based on file type
-        if file_extension == '.pdf':
-            pages_data = process_pdf_ocr(file_path)
-        else:
-            pages_data = process_image_file_ocr(file_path)
-        
-        # Combine all text
-        all_text = "\n\n".join([page["text"] for page in pages_data])
+        logger.info(f"Processing file: {filename} (type: {file_extension}, stored: {upload.location})")
         
-        # Extract all lines
-        all_lines = []
-        for page in pages_data:
-            page_lines = page["text"].split("\n")
-            all_lines.extend([line.strip() for line in page_lines if line.strip()])
+        classification = await classify_upload(current_user, upload, file_extension) if classify else None
+        extra = request_extras(pages, classification)
         
-        # Get user ID from JWT
-        user_id = current_user.get("sub") or current_user.get("user_id") or current_user.get("id")
-        
-        # Prepare response
-        response = {
-            "filename": f"uploads/{filename}",
-            "text": all_text,
-            "pages": pages_data,
-            "lines": all_lines,
-            "uploaded_by_user_id": user_id,
-            "created_at": datetime.utcnow().isoformat() + "Z"
-        }
+        if stream:
+            return stream_scheduled_ocr(current_user, upload, file_extension, pages, extra)
         
-        logger.info(f"Successfully processed {filename}: {len(pages_data)} pages, {len(all_lines)} lines")
+        if extra.get("ocr_skipped"):
+            pages_data = []
+        else:
+            pages_data = await run_scheduled_ocr(current_user, upload, file_extension, pages)
+        response = build_ocr_response(current_user, upload, pages_data, extra)
+        finish_upload(upload, failed=False)
         
         return response
         
     except HTTPException:
         # Re-raise HTTP exceptions
-        if file_path.exists():
-            file_path.unlink()
+        upload.discard()
         raise
     except Exception as e:
         # Clean up file on error
-        if file_path.exists():
-            file_path.unlink()
+        upload.discard()
         logger.error(f"Unexpected error processing {filename}: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -367,6 +552,169 @@ async def process_ocr(
         )
 
 
+@app.post("/ocr/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def create_ocr_job(
+    file: UploadFile = File(...),
+    pages: Optional[str] = None,
+    classify: bool = False,
+    current_user: Dict[str, Any] = Depends(verify_jwt_token)
+):
+    """
+    Queue a PDF or image for OCR and return immediately (`pages` and `classify` as for /ocr).
+    
+    Returns a job id to poll with GET /ocr/jobs/{job_id}; the finished job holds the /ocr response.
+    """
+    file_extension = validate_extension(file)
+    contents = await file.read()
+    upload = upload_storage.save(contents, file_extension)
+    
+    try:
+        classification = await classify_upload(current_user, upload, file_extension) if classify else None
+    except HTTPException:
+        upload.discard()
+        raise
+    extra = request_extras(pages, classification)
+    
+    record = ocr_jobs.create(ocr_scheduler.quota_for(current_user).tenant, upload.display_name)
+    job_id = record["job_id"]
+    if extra.get("ocr_skipped"):
+        ocr_jobs.started(job_id, 0)
+        ocr_jobs.finish(job_id, result=build_ocr_response(current_user, upload, [], extra))
+        finish_upload(upload, failed=False)
+        return {"job_id": job_id, "status": "done", "filename": record["filename"], "page_count": 0,
+                "classification": classification, "created_at": record["created_at"]}
+    
+    try:
+        # Admission (429/503) and budget errors are returned here, not through polling
+        job = submit_scheduled_ocr(current_user, upload, file_extension, pages=pages,
+                                   on_page=lambda index, page: ocr_jobs.page_done(job_id))
+    except HTTPException:
+        ocr_jobs.remove(job_id)
+        upload.discard()
+        raise
+    ocr_jobs.started(job_id, len(job.page_tasks))
+    
+    task = asyncio.create_task(run_ocr_job(job_id, job, current_user, upload, extra))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    logger.info(f"Queued OCR job {job_id} for {upload.name} ({len(job.page_tasks)} pages)")
+    
+    return {
+        "job_id": job_id,
+        "status": record["status"],
+        "filename": record["filename"],
+        "page_count": len(job.page_tasks),
+        "created_at": record["created_at"]
+    }
+
+
+@app.get("/ocr/jobs/{job_id}")
+async def get_ocr_job(
+    job_id: str,
+    current_user: Dict[str, Any] = Depends(verify_jwt_token)
+):
+    """
+    Status of an OCR job: queued, running (pages_done of page_count), done (with result) or failed (with error).
+    """
+    job = ocr_jobs.get(ocr_scheduler.quota_for(current_user).tenant, job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="OCR job not found or expired")
+    return job
+
+
+class ProductMatchRequest(BaseModel):
+    """Invoice lines (or OCR text split on newlines) to match against the catalog."""
+    lines: Optional[List[str]] = None
+    text: Optional[str] = None
+    top_k: int = 3
+    min_score: float = 0.3
+    items_only: bool = True
+
+
+@app.post("/ocr/match-products")
+async def match_products(
+    request: ProductMatchRequest,
+    current_user: Dict[str, Any] = Depends(verify_jwt_token)
+):
+    """
+    Match OCR invoice item lines to catalog product codes.
+    
+    - **lines** or **text**: item lines, e.g. the `lines` of a /ocr response
+    - **top_k** / **min_score**: number and minimum score of candidate products
+    
+    Returns quantity, unit, unit price and scored product matches per item line.
+    """
+    if not catalog_matcher.available:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Catalog matching is not installed (catalog_index module missing)"
+        )
+    
+    lines = request.lines if request.lines is not None else (request.text or "").split("\n")
+    if not 1 <= request.top_k <= 20:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="top_k must be between 1 and 20")
+    
+    try:
+        items = catalog_matcher.match_lines(
+            lines, top_k=request.top_k, min_score=request.min_score, items_only=request.items_only
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    
+    matched = sum(1 for item in items if item["product_code"])
+    logger.info(f"Matched {matched}/{len(items)} invoice lines against the catalog")
+    
+    return {
+        "items": items,
+        "matched_items": matched,
+        "catalog": catalog_matcher.status(),
+        "created_at": datetime.utcnow().isoformat() + "Z"
+    }
+
+
+@app.get("/ocr/search")
+async def search_ocr(
+    q: str,
+    limit: int = 20,
+    offset: int = 0,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    mine: bool = False,
+    current_user: Dict[str, Any] = Depends(verify_jwt_token)
+):
+    """
+    Full-text search over the tenant's OCR results.
+    
+    - **q**: words to find (Polish diacritics optional), "quoted phrases", prefix* terms
+    - **date_from** / **date_to**: ISO dates bounding the OCR time (to is exclusive)
+    - **mine**: only documents uploaded by the caller
+    
+    Returns matching pages with a snippet, highlight offsets and the matching text blocks (bbox).
+    """
+    if not ocr_index.enabled:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="OCR search index is disabled (set OCR_INDEX_PATH)"
+        )
+    if not 1 <= limit <= 100:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="limit must be between 1 and 100")
+    if offset < 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="offset must not be negative")
+    
+    user_id = current_user.get("sub") or current_user.get("user_id") or current_user.get("id")
+    try:
+        result = ocr_index.search(
+            ocr_scheduler.quota_for(current_user).tenant, q,
+            user_id=user_id if mine else None, date_from=date_from, date_to=date_to,
+            limit=limit, offset=offset
+        )
+    except (ValueError, sqlite3.OperationalError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid query: {str(e)}")
+    
+    logger.info(f"Search returned {len(result['results'])} pages in {result['took_ms']} ms")
+    return result
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint with Polish language info."""
@@ -376,10 +724,28 @@ async def health_check():
         "language": "Polish (pl) with English fallback",
         "supported_chars": "ą ć ę ł ń ó ś ź ż",
         "ocr_engine": "PaddleOCR v2.7.3",
+        "storage": upload_storage.usage(),
+        "catalog": catalog_matcher.status(),
+        "scheduler": ocr_scheduler.usage(),
+        "page_cache": page_cache.usage(),
+        "engines": ocr_engines.usage(),
+        "limits": ocr_budget.usage(),
+        "search_index": ocr_index.usage(),
+        "jobs": ocr_jobs.usage(),
+        "classifier": document_classifier.usage(),
+        "lexicon": polish_corrector.usage(),
         "timestamp": datetime.utcnow().isoformat() + "Z"
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics (upload storage usage, OCR queue per tenant, page cache, engine memory)."""
+    lines = (upload_storage.prometheus_metrics() + ocr_scheduler.prometheus_metrics()
+             + page_cache.prometheus_metrics() + ocr_engines.prometheus_metrics())
+    return "\n".join(lines) + "\n"
+
+
 @app.post("/test-polish")
 async def test_polish_recognition():
     """Test endpoint for Polish character recognition."""
@@ -426,27 +792,9 @@ async def demo_ocr(
         
         logger.info(f"Demo OCR processing: {file.filename} ({len(contents)} bytes)")
         
-        # Process based on file type
-        if file_extension == '.pdf':
-            # For demo, save temporarily and process
-            temp_path = Path(f"/tmp/demo_{uuid.uuid4()}{file_extension}")
-            with open(temp_path, "wb") as f:
-                f.write(contents)
-            
-            try:
-                pages_data = process_pdf_ocr(temp_path)
-            finally:
-                if temp_path.exists():
-                    temp_path.unlink()
-        else:
-            # Process image directly
-            ocr_result = process_image_ocr(contents)
-            pages_data = [{
-                "page": 1,
-                "text": ocr_result["combined_text"],
-                "text_blocks": ocr_result["text_blocks"],
-                "image_dimensions": ocr_result["image_dimensions"]
-            }]
+        # Demo uploads are never retained
+        with upload_storage.save(contents, file_extension, prefix="demo") as upload:
+            pages_data = await run_scheduled_ocr({"tenant_id": "demo"}, upload, file_extension)
         
         # Combine all text
         all_text = "\n\n".join([page["text"] for page in pages_data])
@@ -480,6 +828,8 @@ async def demo_ocr(
             "timestamp": datetime.utcnow().isoformat() + "Z"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Demo OCR error: {str(e)}")
         raise HTTPException(
@@ -499,19 +849,19 @@ async def root():
         "supported_formats": list(SUPPORTED_EXTENSIONS),
         "polish_characters": "ą ć ę ł ń ó ś ź ż",
         "endpoints": {
-            "POST /ocr": "Process PDF or image file with OCR (Polish support)",
+            "POST /ocr": "Process PDF or image file with OCR (Polish support, ?stream=true for NDJSON per page, "
+                         "?pages=1-3 to select pages, ?classify=true to skip non-invoices)",
+            "POST /ocr/jobs": "Queue a file for OCR and poll GET /ocr/jobs/{job_id} for the result",
+            "POST /ocr/match-products": "Match invoice item lines to catalog product codes",
+            "GET /ocr/search": "Full-text search over the tenant's OCR results",
             "POST /test-polish": "Test Polish character recognition",
             "GET /health": "Health check with language info",
+            "GET /metrics": "Prometheus metrics",
             "GET /docs": "API documentation"
         }
     }
 
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
\ No newline at end of file
+    # Engine processes re-import the __main__ module and would rebuild every singleton above
+    raise SystemExit("Start the OCR service with: python app/serve.py")
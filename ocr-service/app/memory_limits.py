@@ -0,0 +1,91 @@
+import os
+import resource
+import logging
+from typing import Optional, Dict, Any, List, Union, BinaryIO
+
+from PIL import Image
+
+from page_ring import PDF_RENDER_ZOOM
+
+logger = logging.getLogger(__name__)
+
+
+class BudgetExceeded(ValueError):
+    """A document would need more pixels or pages than allowed; raised before decoding."""
+
+
+def current_rss_bytes(pid: Optional[int] = None) -> int:
+    """Resident set size of a process (this one by default); peak RSS where /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid or 'self'}/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        if pid is not None and pid != os.getpid():
+            return 0
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class OcrBudget:
+    """
+    Per-request pixel and page limits, checked from headers only.
+
+    Images are probed with PIL, which reads the size from the header without
+    decoding; PDFs are checked by page count and by the pixel size every page
+    would render to, so one oversized document is rejected up front instead of
+    spiking the memory of the engine that would decode it.
+    """
+
+    def __init__(self, max_pages: int = 200, max_page_pixels: int = 40_000_000,
+                 max_request_pixels: int = 500_000_000):
+        self.max_pages = max_pages
+        self.max_page_pixels = max_page_pixels
+        self.max_request_pixels = max_request_pixels
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls) -> "OcrBudget":
+        return cls(
+            max_pages=int(os.getenv("OCR_MAX_PAGES", "200")),
+            max_page_pixels=int(os.getenv("OCR_MAX_PAGE_PIXELS", "40000000")),
+            max_request_pixels=int(os.getenv("OCR_MAX_REQUEST_PIXELS", "500000000"))
+        )
+
+    def _reject(self, message: str) -> None:
+        self.rejected += 1
+        raise BudgetExceeded(message)
+
+    def check_image(self, source: Union[str, os.PathLike, BinaryIO]) -> int:
+        """Pixel count of an image from its header; raises BudgetExceeded."""
+        with Image.open(source) as image:
+            width, height = image.size
+        pixels = width * height
+        if pixels > self.max_page_pixels:
+            self._reject(f"Image is {width}x{height} pixels, limit is {self.max_page_pixels} pixels")
+        return pixels
+
+    def check_pdf(self, pdf_document, page_numbers: Optional[List[int]] = None) -> int:
+        """Total rendered pixel count of an open PyMuPDF document (or of the selected 0-based pages); raises BudgetExceeded."""
+        if page_numbers is None:
+            page_numbers = list(range(len(pdf_document)))
+        page_count = len(page_numbers)
+        if page_count > self.max_pages:
+            self._reject(f"PDF has {page_count} pages to process, limit is {self.max_pages}")
+
+        total = 0
+        for page_num in page_numbers:
+            rect = pdf_document.load_page(page_num).rect
+            pixels = int(rect.width * PDF_RENDER_ZOOM) * int(rect.height * PDF_RENDER_ZOOM)
+            if pixels > self.max_page_pixels:
+                self._reject(f"PDF page {page_num + 1} renders to {pixels} pixels, limit is {self.max_page_pixels}")
+            total += pixels
+        if total > self.max_request_pixels:
+            self._reject(f"PDF renders to {total} pixels in total, limit is {self.max_request_pixels}")
+        return total
+
+    def usage(self) -> Dict[str, Any]:
+        return {
+            "max_pages": self.max_pages,
+            "max_page_pixels": self.max_page_pixels,
+            "max_request_pixels": self.max_request_pixels,
+            "rejected_requests": self.rejected
+        }
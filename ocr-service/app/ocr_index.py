@@ -0,0 +1,269 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    tenant TEXT NOT NULL,
+    user_id TEXT,
+    filename TEXT,
+    page_count INTEGER NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_tenant_created ON documents (tenant, created_at);
+CREATE INDEX IF NOT EXISTS documents_created ON documents (created_at);
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    document_id INTEGER NOT NULL REFERENCES documents (id),
+    page INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    blocks TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_document ON pages (document_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(
+    scope, body, tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+# Letters without a Unicode decomposition that remove_diacritics leaves alone
+EXTRA_FOLDS = {'ł': 'l', 'Ł': 'l', 'đ': 'd', 'Đ': 'd', 'ø': 'o', 'Ø': 'o'}
+
+SNIPPET_CONTEXT = 80
+
+
+class _FoldTable(dict):
+    """str.translate table folding each character to one lowercase base letter."""
+
+    def __missing__(self, codepoint: int) -> str:
+        char = chr(codepoint)
+        folded = EXTRA_FOLDS.get(char) or unicodedata.normalize("NFD", char)[0].lower()
+        # Keep a 1:1 mapping so offsets in folded text are offsets in the original
+        if len(folded) != 1:
+            folded = char
+        self[codepoint] = folded
+        return folded
+
+
+FOLD_TABLE = _FoldTable()
+
+
+def fold_text(text: str) -> str:
+    """Lowercase and strip Polish diacritics (ą→a, ł→l, ż→z, ...) without changing length."""
+    return text.translate(FOLD_TABLE)
+
+
+def parse_query(query: str) -> Tuple[List[str], List[str]]:
+    """Split a query into folded phrases ("..." kept together) and terms (trailing * = prefix)."""
+    folded = fold_text(query)
+    phrases = [" ".join(re.findall(r"\w+", phrase)) for phrase in re.findall(r'"([^"]*)"', folded)]
+    terms = re.findall(r"\w+\*?", re.sub(r'"[^"]*"', " ", folded))
+    return [phrase for phrase in phrases if phrase], terms
+
+
+def tenant_scope(tenant: str) -> str:
+    """Single FTS token for a tenant, so MATCH intersects with the tenant's postings."""
+    return "t" + hashlib.sha1(tenant.encode("utf-8")).hexdigest()[:20]
+
+
+class OcrSearchIndex:
+    """
+    SQLite FTS5 index of OCR results, one row per page.
+
+    Pages are indexed as diacritic-folded text together with a per-tenant
+    scope token, so a search only walks the caller's postings. Folding keeps
+    every character at its offset, which lets snippets and matching text
+    blocks (with their bboxes) be cut from the original text. Documents are
+    kept for good unless ``retention_seconds`` is set; ``prune`` then expires
+    older ones (the service runs it after each upload sweep).
+    """
+
+    def __init__(self, path: Optional[Path], retention_seconds: int = 0):
+        self.path = Path(path) if path else None
+        self.retention_seconds = retention_seconds
+        self.conn = None
+        self.pruned_documents = 0
+        self._lock = threading.Lock()
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.execute("PRAGMA synchronous = NORMAL")
+            self.conn.executescript(SCHEMA)
+            logger.info(f"OCR search index at {self.path}")
+
+    @classmethod
+    def from_env(cls) -> "OcrSearchIndex":
+        path = os.getenv("OCR_INDEX_PATH", "")
+        return cls(Path(path) if path else None,
+                   retention_seconds=int(os.getenv("OCR_INDEX_RETENTION_SECONDS", "0")))
+
+    @property
+    def enabled(self) -> bool:
+        return self.conn is not None
+
+    def add_document(self, tenant: str, user_id: Optional[str], filename: str,
+                     pages: List[Dict[str, Any]], created_at: str) -> Optional[int]:
+        """Persist one OCR result; returns its document id."""
+        if not self.enabled:
+            return None
+        scope = tenant_scope(tenant)
+        with self._lock, self.conn:
+            document_id = self.conn.execute(
+                "INSERT INTO documents (tenant, user_id, filename, page_count, created_at) VALUES (?, ?, ?, ?, ?)",
+                (tenant, str(user_id) if user_id is not None else None, filename, len(pages), created_at)
+            ).lastrowid
+            for page in pages:
+                blocks = [
+                    {"text": block["text"], "bbox": block["bbox"], "confidence": block.get("confidence")}
+                    for block in page.get("text_blocks", [])
+                ]
+                page_id = self.conn.execute(
+                    "INSERT INTO pages (document_id, page, text, blocks) VALUES (?, ?, ?, ?)",
+                    (document_id, page["page"], page["text"], json.dumps(blocks, ensure_ascii=False))
+                ).lastrowid
+                self.conn.execute(
+                    "INSERT INTO pages_fts (rowid, scope, body) VALUES (?, ?, ?)",
+                    (page_id, scope, fold_text(page["text"]))
+                )
+        return document_id
+
+    def search(self, tenant: str, query: str, user_id: Optional[str] = None,
+               date_from: Optional[str] = None, date_to: Optional[str] = None,
+               limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+        """Best matching pages of the tenant's documents, with snippets and matching blocks."""
+        phrases, terms = parse_query(query)
+        if not phrases and not terms:
+            raise ValueError("Query has no searchable words")
+
+        started = time.perf_counter()
+        expression = " AND ".join(
+            [f'"{phrase}"' for phrase in phrases]
+            + [f'"{term[:-1]}"*' if term.endswith("*") else f'"{term}"' for term in terms]
+        )
+        match = f"scope: {tenant_scope(tenant)} AND body: ({expression})"
+        columns = "p.id, p.document_id, p.page, p.text, p.blocks, d.filename, d.user_id, d.created_at"
+        if user_id is None and not date_from and not date_to:
+            # The scope token already restricts to the tenant: rank inside FTS, join only the page of hits
+            sql = [
+                f"SELECT {columns}, hits.rank FROM (",
+                "    SELECT rowid, bm25(pages_fts, 0.0, 1.0) AS rank FROM pages_fts",
+                "    WHERE pages_fts MATCH ? ORDER BY rank LIMIT ? OFFSET ?",
+                ") AS hits JOIN pages p ON p.id = hits.rowid JOIN documents d ON d.id = p.document_id",
+                "WHERE d.tenant = ? ORDER BY hits.rank",
+            ]
+            params: List[Any] = [match, limit, offset, tenant]
+        else:
+            sql = [
+                f"SELECT {columns}, bm25(pages_fts, 0.0, 1.0) AS rank",
+                "FROM pages_fts JOIN pages p ON p.id = pages_fts.rowid JOIN documents d ON d.id = p.document_id",
+                "WHERE pages_fts MATCH ? AND d.tenant = ?",
+            ]
+            params = [match, tenant]
+            if user_id is not None:
+                sql.append("AND d.user_id = ?")
+                params.append(str(user_id))
+            if date_from:
+                sql.append("AND d.created_at >= ?")
+                params.append(date_from)
+            if date_to:
+                sql.append("AND d.created_at < ?")
+                params.append(date_to)
+            sql.append("ORDER BY rank LIMIT ? OFFSET ?")
+            params.extend([limit, offset])
+
+        with self._lock:
+            rows = self.conn.execute("\n".join(sql), params).fetchall()
+
+        pattern = match_pattern(phrases, terms)
+        results = []
+        for page_id, document_id, page, text, blocks, filename, owner, created_at, rank in rows:
+            snippet, highlights = make_snippet(text, pattern)
+            results.append({
+                "document_id": document_id,
+                "filename": filename,
+                "user_id": owner,
+                "created_at": created_at,
+                "page": page,
+                "score": round(-rank, 4),
+                "snippet": snippet,
+                "highlights": highlights,
+                "blocks": [block for block in json.loads(blocks) if pattern.search(fold_text(block["text"]))]
+            })
+        return {
+            "query": query,
+            "results": results,
+            "took_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+
+    def prune(self) -> int:
+        """Drop documents indexed more than ``retention_seconds`` ago; returns how many."""
+        if not self.enabled or self.retention_seconds <= 0:
+            return 0
+        # created_at is stored as UTC ISO 8601, so it compares as text
+        cutoff = datetime.utcfromtimestamp(time.time() - self.retention_seconds).isoformat() + "Z"
+        with self._lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM pages_fts WHERE rowid IN (SELECT p.id FROM pages p "
+                "JOIN documents d ON d.id = p.document_id WHERE d.created_at < ?)", (cutoff,)
+            )
+            self.conn.execute(
+                "DELETE FROM pages WHERE document_id IN (SELECT id FROM documents WHERE created_at < ?)", (cutoff,)
+            )
+            removed = self.conn.execute("DELETE FROM documents WHERE created_at < ?", (cutoff,)).rowcount
+        if removed:
+            self.pruned_documents += removed
+            logger.info(f"Search index pruned {removed} documents older than {self.retention_seconds}s")
+        return removed
+
+    def usage(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            documents, = self.conn.execute("SELECT COUNT(*) FROM documents").fetchone()
+            pages, = self.conn.execute("SELECT COUNT(*) FROM pages").fetchone()
+        return {
+            "enabled": True,
+            "path": str(self.path),
+            "documents": documents,
+            "pages": pages,
+            "retention_seconds": self.retention_seconds,
+            "pruned_documents": self.pruned_documents,
+            "size_mb": round(self.path.stat().st_size / 1e6, 1) if self.path.exists() else 0.0
+        }
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def match_pattern(phrases: List[str], terms: List[str]) -> "re.Pattern":
+    """Regex over folded text finding any phrase or term (prefix terms end with *)."""
+    alternatives = [r"\W+".join(re.escape(word) for word in phrase.split()) + r"\b" for phrase in phrases]
+    for term in terms:
+        alternatives.append(re.escape(term[:-1]) + r"\w*" if term.endswith("*") else re.escape(term) + r"\b")
+    return re.compile(r"\b(?:" + "|".join(alternatives) + ")")
+
+
+def make_snippet(text: str, pattern: "re.Pattern") -> Tuple[str, List[List[int]]]:
+    """Window of the original text around the first match, with match offsets inside it."""
+    folded = fold_text(text)
+    first = pattern.search(folded)
+    if first is None:
+        return text[:2 * SNIPPET_CONTEXT], []
+    start = max(0, first.start() - SNIPPET_CONTEXT)
+    end = min(len(text), first.end() + SNIPPET_CONTEXT)
+    highlights = [[match.start() - start, match.end() - start] for match in pattern.finditer(folded, start, end)]
+    return text[start:end], highlights
@@ -0,0 +1,114 @@
+import os
+import time
+import uuid
+import threading
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+class OcrJobStore:
+    """
+    Status and results of asynchronous OCR jobs (POST /ocr/jobs), kept in memory.
+
+    Clients poll a job until it is ``done`` or ``failed``; finished jobs are
+    kept for ``ttl_seconds`` so the result can be fetched, and the oldest
+    finished jobs are dropped first once more than ``max_jobs`` are held.
+    Jobs are scoped to the tenant that created them.
+    """
+
+    def __init__(self, ttl_seconds: int = 3600, max_jobs: int = 1000):
+        self.ttl_seconds = ttl_seconds
+        self.max_jobs = max_jobs
+        self.jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.expired = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "OcrJobStore":
+        return cls(
+            ttl_seconds=int(os.getenv("OCR_JOB_TTL_SECONDS", "3600")),
+            max_jobs=int(os.getenv("OCR_JOB_MAX_JOBS", "1000"))
+        )
+
+    def create(self, tenant: str, filename: str) -> Dict[str, Any]:
+        with self._lock:
+            self._expire(time.time())
+            job = {
+                "job_id": uuid.uuid4().hex,
+                "tenant": tenant,
+                "status": "queued",
+                "filename": filename,
+                "page_count": None,
+                "pages_done": 0,
+                "created_at": datetime.utcnow().isoformat() + "Z",
+                "finished_at": None,
+                "error": None,
+                "result": None,
+                "_finished": None
+            }
+            self.jobs[job["job_id"]] = job
+            return job
+
+    def get(self, tenant: str, job_id: str) -> Optional[Dict[str, Any]]:
+        """Public view of a job, or None if it is unknown, expired or another tenant's."""
+        with self._lock:
+            self._expire(time.time())
+            job = self.jobs.get(job_id)
+            if job is None or job["tenant"] != tenant:
+                return None
+            return {key: value for key, value in job.items() if key != "tenant" and not key.startswith("_")}
+
+    def remove(self, job_id: str) -> None:
+        with self._lock:
+            self.jobs.pop(job_id, None)
+
+    def started(self, job_id: str, page_count: int) -> None:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is not None:
+                job["page_count"] = page_count
+
+    def page_done(self, job_id: str) -> None:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is not None:
+                job["status"] = "running"
+                job["pages_done"] += 1
+
+    def finish(self, job_id: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None,
+               status_code: Optional[int] = None) -> None:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            job["status"] = "failed" if error is not None else "done"
+            job["result"] = result
+            job["error"] = {"status_code": status_code or 500, "detail": error} if error is not None else None
+            job["finished_at"] = datetime.utcnow().isoformat() + "Z"
+            job["_finished"] = time.time()
+
+    def _expire(self, now: float) -> None:
+        finished = [job_id for job_id, job in self.jobs.items() if job["_finished"] is not None]
+        for job_id in finished:
+            if now - self.jobs[job_id]["_finished"] > self.ttl_seconds:
+                del self.jobs[job_id]
+                self.expired += 1
+        finished = [job_id for job_id in finished if job_id in self.jobs]
+        while len(self.jobs) > self.max_jobs and finished:
+            del self.jobs[finished.pop(0)]
+            self.expired += 1
+
+    def usage(self) -> Dict[str, Any]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self.jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return {
+                "jobs": len(self.jobs),
+                "by_status": counts,
+                "expired": self.expired,
+                "ttl_seconds": self.ttl_seconds
+            }
@@ -0,0 +1,125 @@
+"""
+Page OCR shared by the service (main.py) and the offline bulk CLI (bulk_ocr.py).
+
+Importing this module builds nothing: the service and every bulk OCR worker
+construct their own OcrPipeline, so workers never touch the service's upload
+storage, scheduler or search index.
+"""
+
+from typing import Optional, Dict, Any
+
+import numpy as np
+
+from engine_pool import EnginePool
+from page_cache import PageCache
+from polish_lexicon import PolishCorrector
+
+
+class OcrPipeline:
+    """PaddleOCR engines, Polish post-correction and the page cache behind one page-OCR call."""
+
+    def __init__(self, engines: EnginePool, corrector: PolishCorrector, page_cache: PageCache):
+        self.engines = engines
+        self.corrector = corrector
+        self.page_cache = page_cache
+
+    @classmethod
+    def from_env(cls, catalog_matcher=None) -> "OcrPipeline":
+        """Engines (OCR_ENGINE_*), lexicon (OCR_LEXICON_*, plus catalog words) and page cache (OCR_PAGE_CACHE_*)."""
+        return cls(EnginePool.from_env(), PolishCorrector.from_env(catalog_matcher), PageCache.from_env())
+
+    def clean_text(self, text: str) -> str:
+        """Fix Polish words misrecognized by OCR against the lexicon (lost diacritics, misread letters)."""
+        if not text:
+            return text
+        return self.corrector.correct_text(text)
+
+    def ocr_image(self, image_array: np.ndarray) -> Dict[str, Any]:
+        """Run PaddleOCR on a decoded image (e.g. a view over shared memory) and return text with coordinates."""
+        # Get image dimensions
+        image_height, image_width = image_array.shape[:2]
+
+        # Run OCR on the next free engine
+        result = self.engines.ocr(image_array)
+
+        # Process OCR results with full data
+        lines = []
+        text_blocks = []
+        combined_text = []
+
+        if result and result[0]:
+            for line in result[0]:
+                if line and len(line) >= 2:
+                    # Extract coordinates and text
+                    coordinates = line[0]  # [[x1,y1], [x2,y2], [x3,y3], [x4,y4]]
+                    text_data = line[1]    # (text, confidence)
+
+                    text = text_data[0] if isinstance(text_data, (list, tuple)) else str(text_data)
+                    confidence = text_data[1] if isinstance(text_data, (list, tuple)) and len(text_data) > 1 else 1.0
+
+                    # Clean Polish text
+                    text = self.clean_text(text)
+
+                    if text.strip():
+                        # Calculate bounding box
+                        x_coords = [point[0] for point in coordinates]
+                        y_coords = [point[1] for point in coordinates]
+
+                        bbox = {
+                            "x": min(x_coords),
+                            "y": min(y_coords),
+                            "width": max(x_coords) - min(x_coords),
+                            "height": max(y_coords) - min(y_coords)
+                        }
+
+                        text_block = {
+                            "text": text.strip(),
+                            "confidence": confidence,
+                            "coordinates": coordinates,
+                            "bbox": bbox
+                        }
+
+                        lines.append(text.strip())
+                        text_blocks.append(text_block)
+                        combined_text.append(text.strip())
+
+        # Additional Polish text cleaning for combined text
+        combined_text_cleaned = [self.clean_text(line) for line in combined_text]
+
+        return {
+            "lines": [self.clean_text(line) for line in lines],
+            "text_blocks": text_blocks,
+            "combined_text": "\n".join(combined_text_cleaned),
+            "image_dimensions": {
+                "width": image_width,
+                "height": image_height
+            },
+            "language": "Polish (pl) with fallback to English",
+            "processing_info": {
+                "polish_chars_supported": True,
+                "char_cleaning_applied": True,
+                "supported_chars": "ą ć ę ł ń ó ś ź ż"
+            }
+        }
+
+    def ocr_page(self, page_number: int, image_array: np.ndarray, cache_namespace: Optional[str] = None,
+                 content_key: Optional[str] = None) -> Dict[str, Any]:
+        """OCR one decoded page image, using the page cache when a namespace (tenant) is given."""
+        fingerprint = None
+        if cache_namespace is not None and self.page_cache.enabled:
+            fingerprint = self.page_cache.fingerprint(image_array)
+            cached = self.page_cache.lookup(cache_namespace, page_number, content_key, fingerprint)
+            if cached is not None:
+                return cached
+
+        ocr_result = self.ocr_image(image_array)
+        page = {
+            "page": page_number,
+            "text": ocr_result["combined_text"],
+            "text_blocks": ocr_result["text_blocks"],
+            "image_dimensions": ocr_result["image_dimensions"],
+            "cached": False
+        }
+        if fingerprint is not None:
+            self.page_cache.store(cache_namespace, page, content_key, fingerprint)
+        return page
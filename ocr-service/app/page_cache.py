@@ -0,0 +1,246 @@
+import os
+import re
+import hashlib
+import threading
+import logging
+from collections import OrderedDict, deque
+from typing import Optional, Dict, Any, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+# Page entries whose objects (and everything they reference) decide what the page renders
+PAGE_KEYS = ("Contents", "Resources", "Annots")
+REFERENCE = re.compile(r"\b(\d+) 0 R\b")
+# Back-references to the page tree: following them would hash the whole document
+BACK_REFERENCE = re.compile(r"/(?:Parent|P)\s+\d+ 0 R")
+PAGE_OBJECT = re.compile(r"/Type\s*/Page\b(?!s)")
+
+
+def _page_entry(pdf_document, xref: int, key: str) -> str:
+    """A page dictionary entry, inherited from the page tree when the page has none (e.g. Resources)."""
+    while True:
+        kind, value = pdf_document.xref_get_key(xref, key)
+        if kind != "null":
+            return value
+        kind, parent = pdf_document.xref_get_key(xref, "Parent")
+        if kind != "xref":
+            return ""
+        xref = int(parent.split()[0])
+
+
+def page_content_key(pdf_document, page_num: int) -> Optional[str]:
+    """
+    Hash of everything a PDF page renders from; None if it cannot be read.
+
+    Covers the page size and rotation, its content streams and every object
+    reachable from its resources and annotations: fonts, images, form
+    XObjects (with their own resources) and annotation or widget appearance
+    streams. Two pages with the same key render identically.
+    """
+    try:
+        page = pdf_document.load_page(page_num)
+        digest = hashlib.sha256(repr((tuple(page.rect), page.rotation)).encode())
+        # Objects are numbered in visiting order, so the same page in another file gets the same key
+        numbers: Dict[int, int] = {}
+        pending: deque = deque()
+
+        def renumber(match: "re.Match") -> str:
+            xref = int(match.group(1))
+            if xref not in numbers:
+                numbers[xref] = len(numbers)
+                pending.append(xref)
+            return f"#{numbers[xref]}"
+
+        for key in PAGE_KEYS:
+            digest.update(f"/{key} {REFERENCE.sub(renumber, _page_entry(pdf_document, page.xref, key))}\n".encode())
+        while pending:
+            xref = pending.popleft()
+            source = BACK_REFERENCE.sub("", pdf_document.xref_object(xref, compressed=True))
+            # Link destinations point at other pages, which do not change how this one renders
+            if PAGE_OBJECT.search(source):
+                continue
+            digest.update(f"#{numbers[xref]} {REFERENCE.sub(renumber, source)}\n".encode())
+            if pdf_document.xref_is_stream(xref):
+                digest.update(pdf_document.xref_stream_raw(xref) or b"")
+        return digest.hexdigest()
+    except Exception as e:
+        logger.debug(f"No content hash for page {page_num + 1}: {str(e)}")
+        return None
+
+
+def page_fingerprint(image_array: np.ndarray, hash_size: int = 16,
+                     ink_width: int = 512) -> Tuple[int, Tuple[int, np.ndarray, int]]:
+    """
+    Perceptual dHash of a page image plus its "ink" thumbnail.
+
+    The dHash (one bit per horizontally adjacent pixel pair of a tiny
+    grayscale copy) only finds candidates: it does not change when a single
+    invoice number does. Candidates are confirmed against the thumbnail, a
+    ``ink_width`` pixel wide bitmap of dark pixels stored as (height, packed
+    bits, ink pixel count).
+    """
+    image = Image.fromarray(image_array).convert("L")
+    small = np.asarray(image.resize((hash_size + 1, hash_size), Image.BOX), dtype=np.int16)
+    image_hash = int.from_bytes(np.packbits(small[:, 1:] > small[:, :-1]).tobytes(), "big")
+
+    height = max(1, round(ink_width * image.height / image.width))
+    ink = np.asarray(image.resize((ink_width, height), Image.BOX)) < 128
+    return image_hash, (height, np.packbits(ink), int(ink.sum()))
+
+
+def ink_difference(first: Tuple[int, np.ndarray, int], second: Tuple[int, np.ndarray, int]) -> float:
+    """Differing dark pixels of two ink thumbnails relative to the ink on the page."""
+    if first[0] != second[0]:
+        return 1.0
+    differing = int(np.unpackbits(np.bitwise_xor(first[1], second[1])).sum())
+    return differing / max(first[2], second[2], 1)
+
+
+class PageCache:
+    """
+    LRU cache of OCR page results, scoped per tenant.
+
+    Pages are looked up by the exact hash of their PDF content stream first
+    (no rendering needed on a hit) and then by the rendered image: cached pages
+    whose dHash is within ``max_distance`` bits are candidates, found through a
+    banded index (split into ``max_distance + 1`` bands, two hashes that close
+    share at least one band), and the first whose ink thumbnail differs by at
+    most ``max_ink_difference`` is a hit. The default 0.0 only accepts pages
+    that render identically: a re-encoded or rescanned copy differs by a few
+    percent of its ink while a changed amount differs by far less, so any
+    tolerance that accepts rescans also accepts pages with different numbers.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_distance: int = 8, max_ink_difference: float = 0.0,
+                 hash_size: int = 16):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.max_ink_difference = max_ink_difference
+        self.hash_size = hash_size
+        self.hash_bits = hash_size * hash_size
+        self.band_count = min(max_distance + 1, self.hash_bits)
+        self.band_width = -(-self.hash_bits // self.band_count)
+        self.entries: "OrderedDict[Tuple[str, str, Any], Dict[str, Any]]" = OrderedDict()
+        self.bands: Dict[Tuple[str, int, int], set] = {}
+        self.inks: Dict[Tuple[str, int], Tuple[int, np.ndarray, int]] = {}
+        self.hits = {"content": 0, "perceptual": 0}
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "PageCache":
+        return cls(
+            max_entries=int(os.getenv("OCR_PAGE_CACHE_SIZE", "1024")),
+            max_distance=int(os.getenv("OCR_PAGE_CACHE_MAX_DISTANCE", "8")),
+            max_ink_difference=float(os.getenv("OCR_PAGE_CACHE_MAX_INK_DIFFERENCE", "0.0")),
+            hash_size=int(os.getenv("OCR_PAGE_CACHE_HASH_SIZE", "16"))
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def fingerprint(self, image_array: np.ndarray) -> Tuple[int, Tuple[int, np.ndarray, int]]:
+        return page_fingerprint(image_array, self.hash_size)
+
+    def _band_keys(self, namespace: str, image_hash: int) -> List[Tuple[str, int, int]]:
+        mask = (1 << self.band_width) - 1
+        return [(namespace, band, (image_hash >> (band * self.band_width)) & mask)
+                for band in range(self.band_count)]
+
+    def _hit(self, key: Tuple[str, str, Any], kind: str, page_number: int) -> Dict[str, Any]:
+        self.entries.move_to_end(key)
+        self.hits[kind] += 1
+        return dict(self.entries[key], page=page_number, cached=True, cache_match=kind)
+
+    def lookup(self, namespace: str, page_number: int, content_key: Optional[str] = None,
+               fingerprint: Optional[Tuple[int, Tuple[int, np.ndarray, int]]] = None) -> Optional[Dict[str, Any]]:
+        """Cached page result renumbered as ``page_number`` and marked ``cached``, or None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if content_key is not None and (namespace, "content", content_key) in self.entries:
+                return self._hit((namespace, "content", content_key), "content", page_number)
+            if fingerprint is None:
+                return None
+
+            image_hash, ink = fingerprint
+            candidates = {image_hash} if (namespace, "image", image_hash) in self.entries else set()
+            for band_key in self._band_keys(namespace, image_hash):
+                candidates.update(self.bands.get(band_key, ()))
+            for distance, candidate in sorted((bin(candidate ^ image_hash).count("1"), candidate)
+                                              for candidate in candidates):
+                if distance > self.max_distance:
+                    break
+                if ink_difference(ink, self.inks[(namespace, candidate)]) <= self.max_ink_difference:
+                    return self._hit((namespace, "image", candidate), "perceptual", page_number)
+            self.misses += 1
+            return None
+
+    def store(self, namespace: str, page: Dict[str, Any], content_key: Optional[str] = None,
+              fingerprint: Optional[Tuple[int, Tuple[int, np.ndarray, int]]] = None) -> None:
+        if not self.enabled:
+            return
+        value = {key: page[key] for key in ("text", "text_blocks", "image_dimensions") if key in page}
+        with self._lock:
+            if content_key is not None:
+                self._put((namespace, "content", content_key), value)
+            if fingerprint is not None:
+                image_hash, ink = fingerprint
+                if (namespace, "image", image_hash) not in self.entries:
+                    for band_key in self._band_keys(namespace, image_hash):
+                        self.bands.setdefault(band_key, set()).add(image_hash)
+                # Pages with the same dHash replace each other
+                self.inks[(namespace, image_hash)] = ink
+                self._put((namespace, "image", image_hash), value)
+
+    def _put(self, key: Tuple[str, str, Any], value: Dict[str, Any]) -> None:
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            (namespace, kind, evicted), _ = self.entries.popitem(last=False)
+            self.evictions += 1
+            if kind == "image":
+                del self.inks[(namespace, evicted)]
+                for band_key in self._band_keys(namespace, evicted):
+                    band = self.bands.get(band_key)
+                    if band is not None:
+                        band.discard(evicted)
+                        if not band:
+                            del self.bands[band_key]
+
+    def usage(self) -> Dict[str, Any]:
+        """Cache size and hit rates, for /health."""
+        with self._lock:
+            lookups = sum(self.hits.values()) + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "max_distance_bits": self.max_distance,
+                "max_ink_difference": self.max_ink_difference,
+                "hash_bits": self.hash_bits,
+                "content_hits": self.hits["content"],
+                "perceptual_hits": self.hits["perceptual"],
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(sum(self.hits.values()) / lookups, 3) if lookups else 0.0
+            }
+
+    def prometheus_metrics(self) -> List[str]:
+        with self._lock:
+            return [
+                "# HELP ocr_page_cache_lookups_total Page cache lookups by result",
+                "# TYPE ocr_page_cache_lookups_total counter",
+                f'ocr_page_cache_lookups_total{{result="content_hit"}} {self.hits["content"]}',
+                f'ocr_page_cache_lookups_total{{result="perceptual_hit"}} {self.hits["perceptual"]}',
+                f'ocr_page_cache_lookups_total{{result="miss"}} {self.misses}',
+                "# HELP ocr_page_cache_entries Cached page keys",
+                "# TYPE ocr_page_cache_entries gauge",
+                f"ocr_page_cache_entries {len(self.entries)}",
+            ]
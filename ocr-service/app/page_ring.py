@@ -0,0 +1,67 @@
+import logging
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Same zoom as main.render_pdf_page, so results match the HTTP API
+PDF_RENDER_ZOOM = 2.0
+
+
+def pixmap_array(pixmap) -> np.ndarray:
+    """
+    HxWxN array over a PyMuPDF pixmap's samples (no copy where PyMuPDF allows it).
+
+    The array does not keep the pixmap alive: hold a reference to the pixmap
+    for as long as the array is used.
+    """
+    samples = pixmap.samples_mv if hasattr(pixmap, "samples_mv") else pixmap.samples
+    rows = np.frombuffer(samples, dtype=np.uint8).reshape(pixmap.height, pixmap.stride)
+    return rows[:, :pixmap.width * pixmap.n].reshape(pixmap.height, pixmap.width, pixmap.n)
+
+
+class PageRing:
+    """
+    Fixed-size page slots in one shared memory block.
+
+    The owner creates the block and hands out slot indices through a queue of
+    free slots; renderers copy page pixels into a slot and send only a small
+    ``(slot, shape, dtype)`` descriptor to OCR workers, which read the pixels
+    through a NumPy view without copying and then return the slot.
+    """
+
+    def __init__(self, slots: int, slot_bytes: int, name: Optional[str] = None):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+
+    @classmethod
+    def attach(cls, name: str, slots: int, slot_bytes: int) -> "PageRing":
+        return cls(slots, slot_bytes, name=name)
+
+    def fits(self, shape: Tuple[int, ...], dtype: str = "uint8") -> bool:
+        return int(np.prod(shape)) * np.dtype(dtype).itemsize <= self.slot_bytes
+
+    def view(self, slot: int, shape: Tuple[int, ...], dtype: str = "uint8") -> np.ndarray:
+        """NumPy array over a slot's memory (no copy); valid until the slot is released."""
+        return np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def write(self, slot: int, array: np.ndarray) -> Tuple[Tuple[int, ...], str]:
+        """Copy page pixels into a slot and return their (shape, dtype) descriptor."""
+        self.view(slot, array.shape, array.dtype.str)[...] = array
+        return array.shape, array.dtype.str
+
+    def close(self) -> None:
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,161 @@
+import os
+import re
+import threading
+import logging
+from typing import Optional, Dict, Any, List
+
+import numpy as np
+
+from ocr_index import fold_text
+from page_ring import pixmap_array
+
+logger = logging.getLogger(__name__)
+
+# Invoice evidence, matched as whole words in diacritic-folded text
+INVOICE_KEYWORDS = {
+    "faktura": 3, "invoice": 3, "proforma": 2, "paragon": 2, "rachunek": 1,
+    "nip": 2, "sprzedawca": 2, "nabywca": 2, "wystawca": 1, "odbiorca": 1,
+    "do zaplaty": 3, "termin platnosci": 2, "forma platnosci": 1, "data sprzedazy": 2,
+    "data wystawienia": 2, "netto": 1, "brutto": 1, "stawka vat": 1, "razem": 1, "nr konta": 1,
+}
+
+# Documents uploaded by mistake: catalogs, contracts, terms, offers
+OTHER_KEYWORDS = {
+    "katalog": 3, "spis tresci": 3, "umowa": 3, "regulamin": 3, "aneks": 2, "strony umowy": 2,
+    "paragraf": 1, "oferta": 1, "cennik": 1, "instrukcja": 2, "karta techniczna": 2,
+}
+
+
+def _keyword_pattern(keywords: Dict[str, int]) -> "re.Pattern":
+    return re.compile(r"\b(" + "|".join(re.escape(k) for k in sorted(keywords, key=len, reverse=True)) + r")\b")
+
+
+INVOICE_PATTERN = _keyword_pattern(INVOICE_KEYWORDS)
+OTHER_PATTERN = _keyword_pattern(OTHER_KEYWORDS)
+
+
+def parse_page_selection(spec: Optional[str], page_count: int) -> List[int]:
+    """
+    0-based indices of the pages selected by ``spec``, in document order.
+
+    ``spec`` is a comma-separated list of page numbers and ranges, where
+    ``first`` and ``last`` may stand for a number: ``"1-3,7"``, ``"first"``,
+    ``"last"``, ``"5-last"``, ``"2-"`` (page 2 to the end). None, ``""`` and
+    ``"all"`` select every page. Ranges are clipped to the document; raises
+    ValueError for malformed specs or a selection with no page in it.
+    """
+    if spec is None or spec.strip().lower() in ("", "all"):
+        return list(range(page_count))
+
+    def page_number(token: str, default: int) -> int:
+        token = token.strip().lower()
+        if not token:
+            return default
+        if token == "first":
+            return 1
+        if token == "last":
+            return page_count
+        if not token.isdigit() or int(token) < 1:
+            raise ValueError(f"Invalid page number '{token}' in pages={spec}")
+        return int(token)
+
+    selected = set()
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        if "-" in item:
+            start_token, end_token = item.split("-", 1)
+            start, end = page_number(start_token, 1), page_number(end_token, page_count)
+            if start > end:
+                raise ValueError(f"Invalid page range '{item.strip()}' in pages={spec}")
+        else:
+            start = end = page_number(item, 1)
+        selected.update(range(start - 1, min(end, page_count)))
+
+    if not selected:
+        raise ValueError(f"pages={spec} selects no page of a {page_count}-page document")
+    return sorted(selected)
+
+
+class DocumentClassifier:
+    """
+    Cheap "is this an invoice?" pass over the first page of a PDF, run before full OCR.
+
+    The page's text layer is used when it has at least ``min_text_chars``
+    characters (born-digital PDFs: no rendering, no OCR); scans are rendered
+    to a thumbnail at most ``thumbnail_max_side`` pixels long for one small
+    OCR call. The text is scored against invoice and non-invoice keywords.
+    Only documents with enough text and no invoice evidence are classified as
+    ``other`` and skipped; too little text gives ``unknown``, which still runs
+    OCR, so a poor thumbnail never drops a real invoice.
+    """
+
+    def __init__(self, min_invoice_score: int = 3, min_text_chars: int = 40,
+                 thumbnail_max_side: int = 1000):
+        self.min_invoice_score = min_invoice_score
+        self.min_text_chars = min_text_chars
+        self.thumbnail_max_side = thumbnail_max_side
+        self.counts: Dict[str, int] = {"invoice": 0, "other": 0, "unknown": 0}
+        self.sources: Dict[str, int] = {"text_layer": 0, "thumbnail": 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "DocumentClassifier":
+        return cls(
+            min_invoice_score=int(os.getenv("OCR_CLASSIFY_MIN_INVOICE_SCORE", "3")),
+            min_text_chars=int(os.getenv("OCR_CLASSIFY_MIN_TEXT_CHARS", "40")),
+            thumbnail_max_side=int(os.getenv("OCR_CLASSIFY_THUMBNAIL_PX", "1000"))
+        )
+
+    def text_layer(self, pdf_document) -> Optional[str]:
+        """Embedded text of the first page, or None if it is (nearly) empty."""
+        try:
+            text = pdf_document.load_page(0).get_text("text")
+        except Exception as e:
+            logger.debug(f"No text layer: {str(e)}")
+            return None
+        return text if len(text.strip()) >= self.min_text_chars else None
+
+    def thumbnail(self, pdf_document) -> np.ndarray:
+        """First page rendered with its longer side at ``thumbnail_max_side`` pixels."""
+        import fitz
+        page = pdf_document.load_page(0)
+        zoom = self.thumbnail_max_side / max(page.rect.width, page.rect.height, 1)
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        return pixmap_array(pixmap).copy()
+
+    def classify(self, text: str, source: str, page_count: int) -> Dict[str, Any]:
+        """Label ("invoice", "other", "unknown") and evidence for the first page's text."""
+        folded = fold_text(text)
+        invoice_hits = sorted(set(INVOICE_PATTERN.findall(folded)))
+        other_hits = sorted(set(OTHER_PATTERN.findall(folded)))
+        invoice_score = sum(INVOICE_KEYWORDS[k] for k in invoice_hits)
+        other_score = sum(OTHER_KEYWORDS[k] for k in other_hits)
+
+        if invoice_score >= self.min_invoice_score and invoice_score >= other_score:
+            label = "invoice"
+        elif len(text.strip()) >= self.min_text_chars:
+            label = "other"
+        else:
+            label = "unknown"
+
+        with self._lock:
+            self.counts[label] += 1
+            self.sources[source] += 1
+        return {
+            "label": label,
+            "run_ocr": label != "other",
+            "source": source,
+            "invoice_score": invoice_score,
+            "other_score": other_score,
+            "keywords": invoice_hits + other_hits,
+            "page_count": page_count
+        }
+
+    def usage(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "classified": dict(self.counts),
+                "sources": dict(self.sources),
+                "min_invoice_score": self.min_invoice_score
+            }
@@ -0,0 +1,502 @@
+"""
+Lexicon-based Polish post-correction of OCR text.
+
+Words are looked up in a SymSpell-style index: every lexicon word is stored
+under the hashes of its deletes (up to ``max_distance`` characters removed
+from its first ``prefix_length`` letters), so a misread token finds its
+candidates with a few hash lookups instead of an edit-distance scan over the
+lexicon. The index is one flat file (sorted uint32 keys, postings, words)
+that is memory-mapped, so every process serving OCR shares the same pages.
+
+    python app/polish_lexicon.py --wordlist pl_freq.txt --output lexicon/polish.lex
+
+The Docker image builds it from a Polish frequency list; product names from
+the catalog index are added at startup as a small in-memory lexicon, so a
+catalog update needs no rebuild.
+"""
+
+import os
+import re
+import sys
+import json
+import mmap
+import time
+import zlib
+import struct
+import logging
+import argparse
+import threading
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from collections import Counter
+from typing import Optional, Dict, Any, List, Tuple, Iterator
+
+import numpy as np
+
+from ocr_index import fold_text
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'OCRLEX01'
+ALIGNMENT = 8
+HEADER_SIZE = 4096
+
+# Key prefixes that keep exact and diacritic-folded lookups apart from deletes
+EXACT_PREFIX = '\x01'
+FOLDED_PREFIX = '\x00'
+
+# Letter runs are corrected; digits, punctuation and whitespace stay as they are
+WORD_PATTERN = re.compile(r"[^\W\d_]+")
+
+# Letters OCR most often misreads, and the cost of an edit producing one
+POLISH_LETTERS = set('ąćęłńóśźż')
+DIACRITIC_COST = 0.5
+
+# Frequency of built-in and catalog words relative to word-list counts
+SEED_FREQUENCY = 1000
+
+# Invoice vocabulary available without a word list (lowercase, inflected forms where common)
+SEED_WORDS = """
+faktura faktury fakturze fakturą vat proforma korekta korygująca duplikat oryginał kopia paragon rachunek
+sprzedawca sprzedawcy nabywca nabywcy odbiorca odbiorcy wystawca płatnik
+data daty wystawienia sprzedaży dostawy wykonania usługi miejsce termin terminie płatności płatność
+forma sposób przelew przelewem gotówka gotówką karta kartą zapłaty zapłacono zapłacić pozostało
+do na w z ze i o od po za przy dla lub oraz nr numer numeru konta rachunku bank banku bankowy bankowego
+nip regon krs pesel adres ulica ul al aleja plac os osiedle kod pocztowy miasto kraj polska
+spółka spółki spółką sp jawna komandytowa akcyjna cywilna zoo firma firmy przedsiębiorstwo handlowe usługowe
+lp nazwa towaru towaru towarów usługi usług ilość jm jednostka miary cena ceny jednostkowa jednostkowe
+netto brutto wartość wartości stawka stawki podatek podatku kwota kwoty razem suma ogółem słownie
+złotych złote złoty zł gr groszy grosze pln eur euro usd waluta kurs
+rabat rabatu upust zniżka transport dostawa dostawy montaż montażu usługa robocizna materiał materiały
+szt sztuk sztuki sztuka kpl komplet komplety opak opakowanie paczka paczki paczek mb metr metry metrów kg litr
+podpis podpisy osoby osoba upoważniona upoważnionej wystawienia odbioru pieczęć uwagi informacje
+parkiet parkietu parkiety panel panele paneli podłoga podłogi podłogę podłogowe podłogowy deska deski
+dębowy dębowa dębowe jesionowy jesionowa orzech buk klon sosna modrzew egzotyczny winylowe winylowy laminowane
+listwa listwy listew przypodłogowa przypodłogowe cokół profil profile próg progi łącznik łączniki narożnik
+klej kleju lakier lakieru olej oleju wosk grunt podkład podkładu fuga fugi płytka płytki gres terakota
+cyklinowanie szlifowanie lakierowanie olejowanie układanie wylewka wylewki izolacja folia pianka
+fazowana fazowane matowy matowa lakierowana olejowana szczotkowana surowa klasa grubość szerokość długość
+kraków krakowie warszawa warszawie gdańsk wrocław poznań łódź katowice lublin szczecin żurawia długa
+spółka łączyło łączenie łącznie razem wpłata zaliczka zaliczki saldo należność należności zobowiązanie
+""".split()
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def key_hash(key: str) -> int:
+    return zlib.crc32(key.encode('utf-8'))
+
+
+def delete_levels(word: str, max_distance: int, prefix_length: int) -> List[set]:
+    """The word's prefix, then the strings made by removing 1, 2, ... of its letters (one set per count)."""
+    levels = [{word[:prefix_length]}]
+    for _ in range(max_distance):
+        levels.append({item[:i] + item[i + 1:] for item in levels[-1] if len(item) > 1 for i in range(len(item))})
+    return levels
+
+
+def deletes(word: str, max_distance: int, prefix_length: int) -> set:
+    """The word's prefix and every string made by removing up to ``max_distance`` of its letters."""
+    return set().union(*delete_levels(word, max_distance, prefix_length))
+
+
+def edit_distance(token: str, word: str, limit: float) -> float:
+    """
+    Optimal string alignment distance from an OCR token to a lexicon word.
+
+    Substituting or inserting one of the word's Polish letters (ą, ł, ó, ...)
+    costs half an edit, since OCR mangles exactly those: "Spaaka" is 1.0 away
+    from "spółka" but 2.0 from "paczka". Returns ``limit + 1`` when over ``limit``.
+    """
+    if abs(len(token) - len(word)) > limit:
+        return limit + 1
+    costs = [DIACRITIC_COST if char in POLISH_LETTERS else 1.0 for char in word]
+    previous2: List[float] = []
+    previous = [0.0]
+    for cost in costs:
+        previous.append(previous[-1] + cost)
+    for i in range(1, len(token) + 1):
+        current = [float(i)]
+        for j in range(1, len(word) + 1):
+            substitution = 0.0 if token[i - 1] == word[j - 1] else costs[j - 1]
+            value = min(previous[j] + 1.0, current[j - 1] + costs[j - 1], previous[j - 1] + substitution)
+            if i > 1 and j > 1 and token[i - 1] == word[j - 2] and token[i - 2] == word[j - 1]:
+                value = min(value, previous2[j - 2] + 1.0)
+            current.append(value)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def iter_wordlist(path: Path) -> Iterator[Tuple[str, int]]:
+    """(word, count) from a word list: one word per line, optionally followed by a count,
+    or comma-separated inflected forms per line (the sjp.pl "odm" format)."""
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            for item in line.split(','):
+                parts = item.split()
+                if not parts:
+                    continue
+                count = int(parts[-1]) if len(parts) > 1 and parts[-1].isdigit() else 1
+                yield parts[0], count
+
+
+def catalog_words(index) -> Counter:
+    """Word counts of the product and unofficial names in an open CatalogIndex."""
+    counts: Counter = Counter()
+    for record_id in range(len(index)):
+        record = index.record(record_id)
+        for field in ('product_name', 'unofficial_product_name'):
+            counts.update(word.lower() for word in WORD_PATTERN.findall(record.get(field) or ''))
+    return counts
+
+
+def build_lexicon(words: Dict[str, int], max_distance: int = 2, prefix_length: int = 7,
+                  sources: Optional[List[str]] = None, word_lists: Optional[List[str]] = None) -> bytes:
+    """Serialize a lexicon (lowercase word -> frequency) with its delete index.
+
+    ``word_lists`` names the general word lists among the sources; only a
+    lexicon built from one is complete enough for edit-distance corrections.
+    """
+    ordered = sorted(word for word in words if WORD_PATTERN.fullmatch(word))
+    word_offsets = array('I', [0])
+    blob = bytearray()
+    frequencies = array('I')
+    word_lengths = array('B')
+    pairs = array('Q')
+    for word_id, word in enumerate(ordered):
+        blob += word.encode('utf-8')
+        word_offsets.append(len(blob))
+        frequencies.append(min(words[word], 0xFFFFFFFF))
+        word_lengths.append(min(len(word), 255))
+        keys = {EXACT_PREFIX + word, FOLDED_PREFIX + fold_text(word)}
+        keys.update(deletes(word, max_distance, prefix_length))
+        pairs.extend((key_hash(key) << 32) | word_id for key in keys)
+
+    # One sort groups the postings of every key
+    packed = np.unique(np.frombuffer(pairs, dtype=np.uint64))
+    hashes = (packed >> np.uint64(32)).astype(np.uint32)
+    postings = (packed & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+    keys, starts = np.unique(hashes, return_index=True)
+    key_offsets = np.append(starts, len(postings)).astype(np.uint32)
+
+    sections = [
+        ('word_offsets', 'I', word_offsets.tobytes()),
+        ('words', 'B', bytes(blob)),
+        ('frequencies', 'I', frequencies.tobytes()),
+        ('word_lengths', 'B', word_lengths.tobytes()),
+        ('keys', 'I', keys.astype(np.uint32).tobytes()),
+        ('key_offsets', 'I', key_offsets.tobytes()),
+        ('postings', 'I', postings.tobytes()),
+    ]
+    toc = {
+        'count': len(ordered),
+        'max_distance': max_distance,
+        'prefix_length': prefix_length,
+        'sources': sources or [],
+        'word_lists': word_lists or [],
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'sections': {}
+    }
+    offset = _align(len(MAGIC) + 4 + HEADER_SIZE)
+    for name, typecode, data in sections:
+        toc['sections'][name] = [offset, len(data), typecode]
+        offset = _align(offset + len(data))
+    header = json.dumps(toc).encode('utf-8')
+    if len(header) > HEADER_SIZE:
+        raise ValueError("Lexicon header too large")
+
+    output = bytearray(offset)
+    output[:len(MAGIC) + 4 + len(header)] = MAGIC + struct.pack('<I', len(header)) + header
+    for name, typecode, data in sections:
+        start = toc['sections'][name][0]
+        output[start:start + len(data)] = data
+    return bytes(output)
+
+
+class Lexicon:
+    """Read-only lexicon over a memory-mapped file (or bytes built in memory)."""
+
+    def __init__(self, buffer, path: Optional[Path] = None):
+        self.path = path
+        self.buffer = buffer
+        if bytes(buffer[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"Not a lexicon file: {path}")
+        header_length = struct.unpack_from('<I', buffer, len(MAGIC))[0]
+        start = len(MAGIC) + 4
+        self.toc = json.loads(bytes(buffer[start:start + header_length]))
+        self.count = self.toc['count']
+        self.max_distance = self.toc['max_distance']
+        self.prefix_length = self.toc['prefix_length']
+        view = memoryview(buffer)
+        sections = {}
+        for name, (offset, length, typecode) in self.toc['sections'].items():
+            section = view[offset:offset + length]
+            sections[name] = section.cast(typecode) if typecode != 'B' else section
+        self.word_offsets = sections['word_offsets']
+        self.words = sections['words']
+        self.frequencies = sections['frequencies']
+        self.word_lengths = np.frombuffer(sections['word_lengths'], dtype=np.uint8)
+        self.keys = sections['keys']
+        self.key_offsets = sections['key_offsets']
+        self.postings = sections['postings']
+        self.posting_ids = np.frombuffer(self.postings, dtype=np.uint32)
+
+    @classmethod
+    def open(cls, path: Path) -> "Lexicon":
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mapped, Path(path))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def word(self, word_id: int) -> str:
+        return bytes(self.words[self.word_offsets[word_id]:self.word_offsets[word_id + 1]]).decode('utf-8')
+
+    def postings_range(self, key: str) -> Tuple[int, int]:
+        hashed = key_hash(key)
+        position = bisect_left(self.keys, hashed)
+        if position == len(self.keys) or self.keys[position] != hashed:
+            return 0, 0
+        return self.key_offsets[position], self.key_offsets[position + 1]
+
+    def lookup(self, key: str) -> memoryview:
+        """Word ids stored under a key (hash collisions included; callers verify)."""
+        start, end = self.postings_range(key)
+        return self.postings[start:end]
+
+    def contains(self, word: str) -> bool:
+        return any(self.word(word_id) == word for word_id in self.lookup(EXACT_PREFIX + word))
+
+    def restore_diacritics(self, word: str) -> Optional[Tuple[int, str]]:
+        """(frequency, word) of the most frequent lexicon word that folds to the same letters, or None."""
+        folded = fold_text(word)
+        best = None
+        for word_id in self.lookup(FOLDED_PREFIX + folded):
+            candidate = self.word(word_id)
+            if fold_text(candidate) == folded and (best is None or self.frequencies[word_id] > best[0]):
+                best = (self.frequencies[word_id], candidate)
+        return best
+
+    def suggest(self, word: str, max_distance: int) -> List[Tuple[float, int, str]]:
+        """(distance, -frequency, word) of lexicon words within ``max_distance`` edits, best first."""
+        max_distance = min(max_distance, self.max_distance)
+        seen: set = set()
+        found = []
+        for level, keys in enumerate(delete_levels(word, max_distance, self.prefix_length)):
+            slices = [self.posting_ids[start:end] for start, end in map(self.postings_range, keys) if end > start]
+            if slices:
+                ids = np.unique(np.concatenate(slices))
+                # Words whose length alone puts them out of reach are never decoded
+                ids = ids[np.abs(self.word_lengths[ids].astype(np.int16) - len(word)) <= max_distance]
+                for word_id in ids.tolist():
+                    if word_id in seen:
+                        continue
+                    seen.add(word_id)
+                    candidate = self.word(word_id)
+                    distance = edit_distance(word, candidate, max_distance)
+                    if distance <= max_distance:
+                        found.append((distance, -self.frequencies[word_id], candidate))
+            # Words first reached one level deeper are at least that many (diacritic) edits away
+            if found and min(found)[0] <= (level + 1) * DIACRITIC_COST:
+                break
+        found.sort()
+        return found
+
+    def close(self) -> None:
+        if isinstance(self.buffer, mmap.mmap):
+            self.word_offsets = self.words = self.frequencies = self.word_lengths = None
+            self.keys = self.key_offsets = self.postings = self.posting_ids = None
+            self.buffer.close()
+
+
+class PolishCorrector:
+    """
+    Post-corrects OCR tokens against a Polish lexicon.
+
+    Tokens are letter runs (numbers and punctuation are never touched); one
+    is left alone when it is in the lexicon or an unknown short acronym.
+    Otherwise lost diacritics are restored first ("zaplaty" -> "zapłaty",
+    "zl" -> "zł"), then the closest lexicon word is taken: within one edit
+    (or two misread Polish letters) for tokens of 4-11 letters, two edits
+    from 12 letters ("Kraktw" -> "Kraków", "Spaaka" -> "Spółka"). A tie
+    between equally close and equally frequent words leaves the token
+    unchanged. Case is carried over from the token.
+
+    The word list lexicon is a memory-mapped file shared by every process;
+    catalog product names are kept in a small in-memory lexicon next to it.
+    Without the file only the built-in invoice vocabulary is known, which is
+    far too small to tell a misread word from a valid one, so then only
+    diacritics are restored.
+
+    Corrections are memoized per token, so repeated words on dense pages
+    cost one dict lookup.
+    """
+
+    def __init__(self, lexicon_path: Optional[Path] = None, catalog_matcher=None, cache_size: int = 100_000):
+        self.lexicon_path = Path(lexicon_path) if lexicon_path else None
+        self.catalog_matcher = catalog_matcher
+        self.cache_size = cache_size
+        self.lexicons: Optional[List[Lexicon]] = None
+        self.fuzzy = False
+        self.cache: Dict[str, str] = {}
+        self.corrections = 0
+        self.tokens = 0
+        self.load_seconds = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, catalog_matcher=None) -> "PolishCorrector":
+        path = os.getenv("OCR_LEXICON_PATH", "lexicon/polish.lex")
+        return cls(
+            lexicon_path=Path(path) if path else None,
+            catalog_matcher=catalog_matcher,
+            cache_size=int(os.getenv("OCR_LEXICON_CACHE_SIZE", "100000"))
+        )
+
+    def load(self) -> List[Lexicon]:
+        """Map the prebuilt lexicon file and add the catalog vocabulary (or fall back to the seed words)."""
+        with self._lock:
+            if self.lexicons is not None:
+                return self.lexicons
+            started = time.perf_counter()
+            index = self.catalog_matcher.current() if self.catalog_matcher is not None else None
+            catalog = catalog_words(index) if index is not None else Counter()
+            lexicons = []
+            if self.lexicon_path is not None and self.lexicon_path.is_file():
+                lexicons.append(Lexicon.open(self.lexicon_path))
+                if catalog:
+                    # Brand and series names missing from the word list must not be "corrected"
+                    lexicons.append(Lexicon(build_lexicon(catalog, sources=["catalog"])))
+            else:
+                logger.warning(f"No lexicon file at {self.lexicon_path}: only restoring diacritics "
+                               f"(build one with app/polish_lexicon.py --wordlist ...)")
+                words = Counter({word: SEED_FREQUENCY for word in SEED_WORDS})
+                words.update(catalog)
+                lexicons.append(Lexicon(build_lexicon(words, sources=["seed"] + (["catalog"] if catalog else []))))
+
+            self.fuzzy = any(lexicon.toc.get("word_lists") for lexicon in lexicons)
+            self.lexicons = lexicons
+            self.load_seconds = time.perf_counter() - started
+            logger.info(f"Polish lexicon: {sum(len(lexicon) for lexicon in lexicons)} words from "
+                        f"{', '.join(self.sources())} in {self.load_seconds:.2f}s "
+                        f"({'edit-distance corrections' if self.fuzzy else 'diacritics only'})")
+            return lexicons
+
+    def sources(self) -> List[str]:
+        return [source for lexicon in self.lexicons or [] for source in lexicon.toc.get("sources", [])]
+
+    def correct_word(self, token: str) -> str:
+        cached = self.cache.get(token)
+        if cached is not None:
+            return cached
+        corrected = self._correct(token)
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[token] = corrected
+        return corrected
+
+    def _correct(self, token: str) -> str:
+        lexicons = self.lexicons if self.lexicons is not None else self.load()
+        lower = token.lower()
+        if len(lower) < 2 or any(lexicon.contains(lower) for lexicon in lexicons):
+            return token
+        if token.isupper() and len(token) <= 4:
+            return token  # acronyms (NIP, KRS, ...) that the lexicon does not know
+
+        restored = [found for found in (lexicon.restore_diacritics(lower) for lexicon in lexicons) if found]
+        candidate = max(restored)[1] if restored else None
+        if candidate is None and self.fuzzy and len(lower) >= 4:
+            # Two full edits only for long words: shorter ones would turn into other words ("znaków" -> "kraków")
+            limit = 2.0 if len(lower) >= 12 else 1.0
+            suggestions = sorted(item for lexicon in lexicons
+                                 for item in lexicon.suggest(lower, 1 if len(lower) < 6 else 2) if item[0] <= limit)
+            if suggestions and (len(suggestions) == 1 or suggestions[0][:2] != suggestions[1][:2]):
+                candidate = suggestions[0][2]
+        if candidate is None:
+            return token
+
+        if token.isupper():
+            return candidate.upper()
+        if token[0].isupper():
+            return candidate[0].upper() + candidate[1:]
+        return candidate
+
+    def correct_text(self, text: str) -> str:
+        """Text with every letter run corrected; everything else is kept byte for byte."""
+        result = []
+        position = 0
+        for match in WORD_PATTERN.finditer(text):
+            token = match.group()
+            corrected = self.correct_word(token)
+            self.tokens += 1
+            if corrected != token:
+                self.corrections += 1
+                result.append(text[position:match.start()])
+                result.append(corrected)
+                position = match.end()
+        if not result:
+            return text
+        result.append(text[position:])
+        return ''.join(result)
+
+    def usage(self) -> Dict[str, Any]:
+        lexicons = self.lexicons
+        return {
+            "loaded": lexicons is not None,
+            "path": next((str(lexicon.path) for lexicon in lexicons or [] if lexicon.path), None),
+            "words": sum(len(lexicon) for lexicon in lexicons or []),
+            "sources": self.sources(),
+            "edit_distance_corrections": self.fuzzy,
+            "load_seconds": round(self.load_seconds, 3),
+            "tokens": self.tokens,
+            "corrections": self.corrections,
+            "cached_tokens": len(self.cache)
+        }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Build the Polish OCR post-correction lexicon")
+    parser.add_argument("--wordlist", type=Path, action="append", default=[],
+                        help="Word list: 'word [count]' per line or comma-separated forms (repeatable)")
+    parser.add_argument("--catalog-index", type=Path, help="Catalog index (scripts/catalog_index.py) for product vocabulary")
+    parser.add_argument("--min-count", type=int, default=1, help="Drop word-list entries rarer than this")
+    parser.add_argument("--max-distance", type=int, default=2, help="Edits covered by the delete index")
+    parser.add_argument("--prefix-length", type=int, default=7, help="Letters of each word the deletes are taken from")
+    parser.add_argument("--output", type=Path, default=Path("lexicon/polish.lex"), help="Lexicon file to write")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    started = time.perf_counter()
+    words = Counter({word: SEED_FREQUENCY for word in SEED_WORDS})
+    sources = ["seed"]
+    for path in args.wordlist:
+        listed: Counter = Counter()
+        for word, count in iter_wordlist(path):
+            listed[word.lower()] += count
+        words.update({word: count for word, count in listed.items() if count >= args.min_count})
+        sources.append(path.name)
+    if args.catalog_index:
+        from catalog_index import CatalogIndex
+        with CatalogIndex(args.catalog_index) as index:
+            words.update(catalog_words(index))
+        sources.append(args.catalog_index.name)
+
+    data = build_lexicon(words, args.max_distance, args.prefix_length, sources,
+                         word_lists=[path.name for path in args.wordlist])
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = args.output.with_suffix(args.output.suffix + ".tmp")
+    tmp_path.write_bytes(data)
+    tmp_path.replace(args.output)
+    logger.info(f"Wrote {len(Lexicon(data))} words to {args.output} ({len(data) / 1e6:.1f} MB) "
+                f"in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,392 @@
+import os
+import hmac
+import time
+import hashlib
+import asyncio
+import threading
+import logging
+from collections import deque
+from typing import Optional, Dict, Any, List, Callable
+
+logger = logging.getLogger(__name__)
+
+# JWT claims identifying the tenant, in order of preference
+TENANT_CLAIMS = ("tenant_id", "org_id", "organization_id")
+
+
+class SchedulerRejected(Exception):
+    """Admission control refused a job; maps to an HTTP error with Retry-After."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int = 1):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class TenantQuota:
+    """Scheduling limits of one tenant, read from JWT claims with service-wide defaults."""
+
+    def __init__(self, tenant: str, weight: float = 1.0, max_concurrent_jobs: int = 2,
+                 pages_per_minute: int = 120):
+        self.tenant = tenant
+        self.weight = max(weight, 0.01)
+        self.max_concurrent_jobs = max(max_concurrent_jobs, 1)
+        self.pages_per_minute = max(pages_per_minute, 1)
+
+    @classmethod
+    def from_claims(cls, claims: Dict[str, Any], defaults: "TenantQuota") -> "TenantQuota":
+        tenant = next((str(claims[c]) for c in TENANT_CLAIMS if claims.get(c)), None)
+        if tenant is None:
+            user_id = claims.get("sub") or claims.get("user_id") or claims.get("id")
+            tenant = f"user:{user_id}" if user_id else "anonymous"
+
+        def claim(name: str, default, cast):
+            try:
+                return cast(claims[name]) if claims.get(name) is not None else default
+            except (TypeError, ValueError):
+                return default
+
+        return cls(
+            tenant=tenant,
+            weight=claim("ocr_weight", defaults.weight, float),
+            max_concurrent_jobs=claim("ocr_max_concurrent_jobs", defaults.max_concurrent_jobs, int),
+            pages_per_minute=claim("ocr_pages_per_minute", defaults.pages_per_minute, int)
+        )
+
+
+class OcrJob:
+    """One document: a list of page tasks whose results are collected in order."""
+
+    def __init__(self, quota: TenantQuota, page_tasks: List[Callable[[], Any]], interactive: bool,
+                 loop: asyncio.AbstractEventLoop, on_page: Optional[Callable[[int, Any], None]] = None,
+                 on_finished: Optional[Callable[[], None]] = None):
+        self.quota = quota
+        self.page_tasks = page_tasks
+        self.interactive = interactive
+        self.loop = loop
+        # Called on the event loop with (page_index, result) as each page finishes
+        self.on_page = on_page
+        # Called on an engine thread once no page task is running or left to run
+        self.on_finished = on_finished
+        self.future = loop.create_future()
+        self.results: List[Any] = [None] * len(page_tasks)
+        self.next_page = 0
+        self.pending_pages = len(page_tasks)
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.failed = False
+
+    @property
+    def has_pages(self) -> bool:
+        return not self.failed and self.next_page < len(self.page_tasks)
+
+
+class TenantState:
+    def __init__(self, quota: TenantQuota):
+        self.quota = quota
+        self.jobs: deque = deque()
+        self.virtual_time = 0.0
+        self.tokens = float(self.burst)
+        self.refilled_at = time.monotonic()
+        self.running_pages = 0
+        self.wait_seconds_sum = 0.0
+        self.wait_seconds_max = 0.0
+        self.jobs_started = 0
+        self.pages_done = 0
+
+    @property
+    def burst(self) -> int:
+        # Roughly ten seconds worth of pages
+        return max(1, self.quota.pages_per_minute // 6)
+
+    def refill(self, now: float) -> None:
+        rate = self.quota.pages_per_minute / 60.0
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * rate)
+        self.refilled_at = now
+
+    def seconds_until_token(self) -> float:
+        return max(0.0, (1.0 - self.tokens) * 60.0 / self.quota.pages_per_minute)
+
+    def next_job(self) -> Optional[OcrJob]:
+        """First job with pages left, preferring interactive ones."""
+        fallback = None
+        for job in self.jobs:
+            if job.has_pages:
+                if job.interactive:
+                    return job
+                fallback = fallback or job
+        return fallback
+
+
+class OcrScheduler:
+    """
+    Page-granular weighted fair scheduler in front of the OCR engine.
+
+    Each tenant has its own job queue and a virtual clock advanced by
+    ``1 / weight`` per dispatched page; the engine threads always take the next
+    page of the eligible tenant with the smallest clock, so a 300-page upload
+    only gets its fair share while other tenants have work queued. Pages of
+    interactive (short) documents go first; bulk pages that have waited longer
+    than ``bulk_max_wait_seconds`` are treated as interactive so they are never
+    starved. Each tenant is limited to ``max_concurrent_jobs`` queued/running
+    documents (admission control) and ``pages_per_minute`` (token bucket).
+
+    /health and /metrics are unauthenticated, so tenant ids never appear
+    there: /health gets totals only and metric labels are keyed hashes
+    (``tenant_label``) that an operator holding ``label_key`` can recompute.
+    A tenant's state is dropped once it has no jobs and a full token bucket
+    (it would start from the same state again), so it does not outlive the
+    tenant's activity; its counters are kept in the service-wide totals.
+    """
+
+    def __init__(self, engine_slots: int = 1, interactive_max_pages: int = 3,
+                 bulk_max_wait_seconds: float = 30.0, max_queued_pages: int = 5000,
+                 default_quota: Optional[TenantQuota] = None, label_key: str = ""):
+        self.engine_slots = max(engine_slots, 1)
+        self.interactive_max_pages = interactive_max_pages
+        self.bulk_max_wait_seconds = bulk_max_wait_seconds
+        self.max_queued_pages = max_queued_pages
+        self.default_quota = default_quota or TenantQuota("default")
+        self.label_key = label_key.encode("utf-8")
+        self.tenants: Dict[str, TenantState] = {}
+        self.queued_pages = 0
+        # Counters of evicted tenants, so /health totals do not go backwards
+        self.evicted = {"tenants": 0, "pages_done": 0, "jobs_started": 0,
+                        "wait_seconds_sum": 0.0, "wait_seconds_max": 0.0}
+        self._condition = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+
+    @classmethod
+    def from_env(cls) -> "OcrScheduler":
+        return cls(
+            engine_slots=int(os.getenv("OCR_ENGINE_SLOTS", "1")),
+            interactive_max_pages=int(os.getenv("OCR_INTERACTIVE_MAX_PAGES", "3")),
+            bulk_max_wait_seconds=float(os.getenv("OCR_BULK_MAX_WAIT_SECONDS", "30")),
+            max_queued_pages=int(os.getenv("OCR_MAX_QUEUED_PAGES", "5000")),
+            default_quota=TenantQuota(
+                "default",
+                weight=float(os.getenv("OCR_DEFAULT_WEIGHT", "1")),
+                max_concurrent_jobs=int(os.getenv("OCR_DEFAULT_MAX_CONCURRENT_JOBS", "2")),
+                pages_per_minute=int(os.getenv("OCR_DEFAULT_PAGES_PER_MINUTE", "120"))
+            ),
+            label_key=os.getenv("OCR_METRICS_LABEL_KEY", os.getenv("JWT_SECRET", ""))
+        )
+
+    def quota_for(self, claims: Dict[str, Any]) -> TenantQuota:
+        return TenantQuota.from_claims(claims, self.default_quota)
+
+    def start(self) -> None:
+        """Start one engine thread per slot."""
+        if self._threads:
+            return
+        self._stopping = False
+        for slot in range(self.engine_slots):
+            thread = threading.Thread(target=self._engine_loop, name=f"ocr-engine-{slot}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def submit(self, quota: TenantQuota, page_tasks: List[Callable[[], Any]],
+               on_page: Optional[Callable[[int, Any], None]] = None,
+               on_finished: Optional[Callable[[], None]] = None) -> OcrJob:
+        """
+        Queue a document; raises SchedulerRejected if the tenant or service is at capacity.
+
+        ``on_finished`` runs after the last page task has returned or been
+        skipped, which can be later than the future failing on the first error.
+        """
+        loop = asyncio.get_running_loop()
+        job = OcrJob(quota, page_tasks, len(page_tasks) <= self.interactive_max_pages, loop, on_page, on_finished)
+        if not page_tasks:
+            job.future.set_result([])
+            if on_finished is not None:
+                on_finished()
+            return job
+
+        with self._condition:
+            self._evict_idle(time.monotonic())
+            state = self.tenants.get(quota.tenant)
+            if state is None:
+                state = self.tenants[quota.tenant] = TenantState(quota)
+            state.quota = quota
+
+            active_jobs = sum(1 for queued in state.jobs if queued.pending_pages)
+            if active_jobs >= quota.max_concurrent_jobs:
+                raise SchedulerRejected(429, f"Too many concurrent OCR jobs (limit {quota.max_concurrent_jobs})", 5)
+            if self.queued_pages + len(page_tasks) > self.max_queued_pages:
+                raise SchedulerRejected(503, "OCR queue is full, try again later", 30)
+
+            if not active_jobs:
+                # Returning tenants start at the current fair-share clock, not behind it
+                state.virtual_time = max(state.virtual_time, self._min_virtual_time(exclude=state))
+            state.jobs.append(job)
+            self.queued_pages += len(page_tasks)
+            self._condition.notify_all()
+        return job
+
+    async def run(self, quota: TenantQuota, page_tasks: List[Callable[[], Any]]) -> List[Any]:
+        """Submit a document and wait for all page results (in page order)."""
+        job = self.submit(quota, page_tasks)
+        return await job.future
+
+    def _evict_idle(self, now: float) -> None:
+        """Drop tenants without jobs whose token bucket has refilled (called with the lock held)."""
+        for tenant, state in list(self.tenants.items()):
+            if state.jobs or state.running_pages:
+                continue
+            state.refill(now)
+            if state.tokens < state.burst:
+                continue
+            del self.tenants[tenant]
+            self.evicted["tenants"] += 1
+            self.evicted["pages_done"] += state.pages_done
+            self.evicted["jobs_started"] += state.jobs_started
+            self.evicted["wait_seconds_sum"] += state.wait_seconds_sum
+            self.evicted["wait_seconds_max"] = max(self.evicted["wait_seconds_max"], state.wait_seconds_max)
+
+    def _min_virtual_time(self, exclude: Optional[TenantState] = None) -> float:
+        clocks = [s.virtual_time for s in self.tenants.values() if s is not exclude and s.next_job() is not None]
+        return min(clocks) if clocks else 0.0
+
+    def _pick(self, now: float):
+        """Return (tenant_state, job) to run next, or (None, seconds_to_wait)."""
+        best = None
+        wait = None
+        for state in self.tenants.values():
+            job = state.next_job()
+            if job is None:
+                continue
+            state.refill(now)
+            if state.tokens < 1.0:
+                delay = state.seconds_until_token()
+                wait = delay if wait is None else min(wait, delay)
+                continue
+            urgent = job.interactive or now - job.enqueued_at >= self.bulk_max_wait_seconds
+            key = (0 if urgent else 1, state.virtual_time, job.enqueued_at)
+            if best is None or key < best[0]:
+                best = (key, state, job)
+        if best is None:
+            return None, wait
+        return (best[1], best[2]), None
+
+    def _engine_loop(self) -> None:
+        while True:
+            with self._condition:
+                while True:
+                    if self._stopping:
+                        return
+                    picked, wait = self._pick(time.monotonic())
+                    if picked is not None:
+                        break
+                    self._condition.wait(timeout=wait)
+                state, job = picked
+                page_index = job.next_page
+                job.next_page += 1
+                state.tokens -= 1.0
+                state.virtual_time += 1.0 / state.quota.weight
+                state.running_pages += 1
+                self.queued_pages -= 1
+                if job.started_at is None:
+                    job.started_at = time.monotonic()
+                    waited = job.started_at - job.enqueued_at
+                    state.wait_seconds_sum += waited
+                    state.wait_seconds_max = max(state.wait_seconds_max, waited)
+                    state.jobs_started += 1
+
+            try:
+                result, error = job.page_tasks[page_index](), None
+            except BaseException as e:
+                result, error = None, e
+
+            with self._condition:
+                state.running_pages -= 1
+                state.pages_done += 1
+                job.pending_pages -= 1
+                if error is not None and not job.failed:
+                    # Skip the rest of the document
+                    job.failed = True
+                    skipped = len(job.page_tasks) - job.next_page
+                    job.pending_pages -= skipped
+                    self.queued_pages -= skipped
+                    job.loop.call_soon_threadsafe(self._set_exception, job.future, error)
+                elif error is None:
+                    job.results[page_index] = result
+                    if job.on_page is not None:
+                        job.loop.call_soon_threadsafe(job.on_page, page_index, result)
+                finished = job.pending_pages == 0
+                if finished:
+                    state.jobs.remove(job)
+                    if not job.failed:
+                        job.loop.call_soon_threadsafe(self._set_result, job.future, job.results)
+                self._condition.notify_all()
+
+            if finished and job.on_finished is not None:
+                try:
+                    job.on_finished()
+                except Exception as e:
+                    logger.error(f"OCR job cleanup failed: {str(e)}")
+
+    @staticmethod
+    def _set_result(future: asyncio.Future, results: List[Any]) -> None:
+        if not future.done():
+            future.set_result(results)
+
+    @staticmethod
+    def _set_exception(future: asyncio.Future, error: BaseException) -> None:
+        if not future.done():
+            future.set_exception(error)
+
+    def tenant_label(self, tenant: str) -> str:
+        """Stable pseudonym of a tenant for metric labels (HMAC-SHA256 with ``label_key``)."""
+        return "t" + hmac.new(self.label_key, tenant.encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+
+    def usage(self) -> Dict[str, Any]:
+        """Queue state summed over tenants, for /health."""
+        with self._condition:
+            self._evict_idle(time.monotonic())
+            states = list(self.tenants.values())
+            evicted = self.evicted
+            jobs_started = evicted["jobs_started"] + sum(state.jobs_started for state in states)
+            wait_seconds_sum = evicted["wait_seconds_sum"] + sum(state.wait_seconds_sum for state in states)
+            return {
+                "engine_slots": self.engine_slots,
+                "queued_pages": self.queued_pages,
+                "tenants": len(states),
+                "evicted_tenants": evicted["tenants"],
+                "active_tenants": sum(1 for state in states if state.jobs),
+                "queued_jobs": sum(1 for state in states for job in state.jobs if job.has_pages),
+                "running_pages": sum(state.running_pages for state in states),
+                "pages_done": evicted["pages_done"] + sum(state.pages_done for state in states),
+                "avg_queue_wait_seconds": round(wait_seconds_sum / jobs_started, 3) if jobs_started else 0.0,
+                "max_queue_wait_seconds": round(max([evicted["wait_seconds_max"]]
+                                                    + [state.wait_seconds_max for state in states]), 3)
+            }
+
+    def prometheus_metrics(self) -> List[str]:
+        with self._condition:
+            self._evict_idle(time.monotonic())
+            lines = [
+                "# HELP ocr_queued_pages Pages waiting for an OCR engine",
+                "# TYPE ocr_queued_pages gauge",
+                f"ocr_queued_pages {self.queued_pages}",
+                "# HELP ocr_queue_wait_seconds Time from submission to the first page reaching an engine",
+                "# TYPE ocr_queue_wait_seconds summary",
+            ]
+            labels = {tenant: self.tenant_label(tenant) for tenant in self.tenants}
+            for tenant, state in self.tenants.items():
+                lines.append(f'ocr_queue_wait_seconds_sum{{tenant="{labels[tenant]}"}} {state.wait_seconds_sum:.6f}')
+                lines.append(f'ocr_queue_wait_seconds_count{{tenant="{labels[tenant]}"}} {state.jobs_started}')
+            lines.append("# HELP ocr_pages_processed_total Pages processed per tenant (hashed tenant label)")
+            lines.append("# TYPE ocr_pages_processed_total counter")
+            for tenant, state in self.tenants.items():
+                lines.append(f'ocr_pages_processed_total{{tenant="{labels[tenant]}"}} {state.pages_done}')
+            return lines
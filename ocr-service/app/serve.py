@@ -0,0 +1,20 @@
+"""
+Entry point of the OCR service: python app/serve.py
+
+Engine processes are started with "spawn", which re-imports the __main__
+module in every child. This module has no module-level state, so the
+children do not rebuild the service's singletons (storage, scheduler,
+caches, search index, lexicon) the way they would if main.py were run
+directly.
+"""
+
+import uvicorn
+
+if __name__ == "__main__":
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        reload=True,
+        log_level="info"
+    )
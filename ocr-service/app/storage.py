@@ -0,0 +1,392 @@
+import os
+import time
+import uuid
+import shutil
+import threading
+import logging
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple, Callable
+
+logger = logging.getLogger(__name__)
+
+# Where small documents are kept instead of the sharded upload directory
+SMALL_FILE_MODES = {'disk', 'memory', 'tmpfs'}
+
+
+class StoredUpload:
+    """Handle to an uploaded document held on disk, on tmpfs or in memory."""
+
+    def __init__(self, storage: "UploadStorage", name: str, size: int,
+                 location: str, path: Optional[Path] = None, data: Optional[bytes] = None):
+        self.storage = storage
+        self.name = name
+        self.size = size
+        self.location = location
+        self.path = path
+        self.data = data
+        # Disk/tmpfs uploads are pinned from save() until released or discarded
+        self.pinned = path is not None
+
+    @property
+    def display_name(self) -> str:
+        """Name reported back to clients (relative to the storage root)."""
+        if self.location == 'disk' and self.path is not None:
+            return f"{self.storage.root.name}/{self.path.relative_to(self.storage.root).as_posix()}"
+        return f"{self.location}/{self.name}"
+
+    def read_bytes(self) -> bytes:
+        """Return the document contents regardless of where they are kept."""
+        if self.data is not None:
+            return self.data
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def release(self) -> None:
+        """Done with the document; it is kept until the retention policy removes it."""
+        self.storage.release(self)
+
+    def discard(self) -> None:
+        """Drop the document immediately instead of waiting for the sweeper."""
+        self.storage.discard(self)
+
+    def __enter__(self) -> "StoredUpload":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.discard()
+
+
+class UploadStorage:
+    """
+    Lifecycle manager for uploaded documents.
+
+    Files are written into sharded subdirectories (``uploads/ab/cd/ocr_<uuid>.pdf``)
+    so that no single directory grows unbounded, and a background sweeper enforces
+    the retention policy: files older than ``ttl_seconds`` are removed first, then the
+    oldest remaining files until the total size fits in ``max_total_bytes``.
+    Uploads still being processed are pinned (from ``save`` until ``release``
+    or ``discard``) and skipped by the sweeper; their bytes still count
+    towards the size limit. Documents below ``small_file_threshold`` can be kept in RAM or on tmpfs instead.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        ttl_seconds: int = 24 * 3600,
+        max_total_bytes: int = 1024 * 1024 * 1024,
+        sweep_interval_seconds: int = 300,
+        shard_depth: int = 2,
+        small_file_mode: str = 'disk',
+        small_file_threshold: int = 0,
+        tmpfs_dir: Optional[Path] = None,
+    ):
+        if small_file_mode not in SMALL_FILE_MODES:
+            raise ValueError(f"Unsupported small file mode: {small_file_mode}")
+
+        self.root = Path(root)
+        self.ttl_seconds = ttl_seconds
+        self.max_total_bytes = max_total_bytes
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self.shard_depth = max(0, min(shard_depth, 4))
+        self.small_file_mode = small_file_mode
+        self.small_file_threshold = small_file_threshold
+        self.tmpfs_dir = Path(tmpfs_dir) if tmpfs_dir else None
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        if self.tmpfs_dir is not None:
+            self.tmpfs_dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # Pin count per path of uploads still in use
+        self._pinned: Dict[Path, int] = {}
+        # Run after every background sweep, e.g. to expire data derived from uploads
+        self.sweep_hooks: List[Callable[[], Any]] = []
+        self._stop_event = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+
+        self.stats = {
+            'disk_bytes': 0,
+            'disk_files': 0,
+            'tmpfs_bytes': 0,
+            'tmpfs_files': 0,
+            'memory_bytes': 0,
+            'memory_files': 0,
+            'stored_files_total': 0,
+            'swept_files_total': 0,
+            'swept_bytes_total': 0,
+            'sweeps_total': 0,
+            'last_sweep_at': None,
+            'last_sweep_duration_seconds': None,
+        }
+        self._recount()
+
+    @classmethod
+    def from_env(cls, default_root: str = "uploads") -> "UploadStorage":
+        """Build a storage manager from ``UPLOAD_*`` environment variables."""
+        tmpfs_dir = os.getenv("UPLOAD_TMPFS_DIR")
+        return cls(
+            root=Path(os.getenv("UPLOAD_DIR", default_root)),
+            ttl_seconds=int(os.getenv("UPLOAD_TTL_SECONDS", 24 * 3600)),
+            max_total_bytes=int(os.getenv("UPLOAD_MAX_TOTAL_BYTES", 1024 * 1024 * 1024)),
+            sweep_interval_seconds=int(os.getenv("UPLOAD_SWEEP_INTERVAL_SECONDS", 300)),
+            shard_depth=int(os.getenv("UPLOAD_SHARD_DEPTH", 2)),
+            small_file_mode=os.getenv("UPLOAD_SMALL_FILE_MODE", "disk"),
+            small_file_threshold=int(os.getenv("UPLOAD_SMALL_FILE_THRESHOLD", 0)),
+            tmpfs_dir=Path(tmpfs_dir) if tmpfs_dir else None,
+        )
+
+    # ------------------------------------------------------------------
+    # Storing and discarding documents
+    # ------------------------------------------------------------------
+
+    def _shard_dir(self, base: Path, unique_id: str) -> Path:
+        """Return the sharded subdirectory for a uuid hex string."""
+        parts = [unique_id[i * 2:i * 2 + 2] for i in range(self.shard_depth)]
+        return base.joinpath(*parts) if parts else base
+
+    def _small_file_location(self, size: int) -> str:
+        if self.small_file_mode == 'disk' or size > self.small_file_threshold:
+            return 'disk'
+        if self.small_file_mode == 'tmpfs' and self.tmpfs_dir is None:
+            return 'disk'
+        return self.small_file_mode
+
+    def save(self, contents: bytes, extension: str, prefix: str = "ocr") -> StoredUpload:
+        """Store an uploaded document and return a handle to it."""
+        unique_id = uuid.uuid4().hex
+        name = f"{prefix}_{unique_id}{extension}"
+        size = len(contents)
+        location = self._small_file_location(size)
+
+        if location == 'memory':
+            with self._lock:
+                self.stats['memory_bytes'] += size
+                self.stats['memory_files'] += 1
+                self.stats['stored_files_total'] += 1
+            return StoredUpload(self, name, size, 'memory', data=contents)
+
+        base = self.tmpfs_dir if location == 'tmpfs' else self.root
+        directory = self._shard_dir(base, unique_id)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / name
+        with open(path, "wb") as f:
+            f.write(contents)
+
+        with self._lock:
+            self.stats[f'{location}_bytes'] += size
+            self.stats[f'{location}_files'] += 1
+            self.stats['stored_files_total'] += 1
+            self._pinned[path] = self._pinned.get(path, 0) + 1
+
+        return StoredUpload(self, name, size, location, path=path)
+
+    def release(self, upload: StoredUpload) -> None:
+        """Unpin an upload so the sweeper may remove it (idempotent)."""
+        if not upload.pinned:
+            return
+        upload.pinned = False
+        with self._lock:
+            count = self._pinned.get(upload.path, 0) - 1
+            if count > 0:
+                self._pinned[upload.path] = count
+            else:
+                self._pinned.pop(upload.path, None)
+
+    def discard(self, upload: StoredUpload) -> None:
+        """Release an upload's storage (idempotent)."""
+        self.release(upload)
+        if upload.location == 'memory':
+            if upload.data is not None:
+                upload.data = None
+                with self._lock:
+                    self.stats['memory_bytes'] -= upload.size
+                    self.stats['memory_files'] -= 1
+            return
+
+        if upload.path is not None and self._unlink(upload.path, upload.size, upload.location):
+            upload.path = None
+
+    def _unlink(self, path: Path, size: int, location: str) -> bool:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            return False
+        with self._lock:
+            self.stats[f'{location}_bytes'] = max(0, self.stats[f'{location}_bytes'] - size)
+            self.stats[f'{location}_files'] = max(0, self.stats[f'{location}_files'] - 1)
+        return True
+
+    # ------------------------------------------------------------------
+    # Retention policy
+    # ------------------------------------------------------------------
+
+    def _scan(self, base: Optional[Path]) -> List[Tuple[float, int, Path]]:
+        """Return (mtime, size, path) for every file below ``base``."""
+        entries = []
+        if base is None or not base.exists():
+            return entries
+        stack = [base]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(Path(entry.path))
+                        elif entry.is_file(follow_symlinks=False):
+                            st = entry.stat(follow_symlinks=False)
+                            entries.append((st.st_mtime, st.st_size, Path(entry.path)))
+            except FileNotFoundError:
+                continue
+        return entries
+
+    def _recount(self) -> None:
+        for location, base in (('disk', self.root), ('tmpfs', self.tmpfs_dir)):
+            entries = self._scan(base)
+            with self._lock:
+                self.stats[f'{location}_bytes'] = sum(size for _, size, _ in entries)
+                self.stats[f'{location}_files'] = len(entries)
+
+    def _remove_empty_shards(self, base: Optional[Path]) -> None:
+        if base is None or not base.exists():
+            return
+        for directory in sorted((p for p in base.rglob('*') if p.is_dir()), reverse=True):
+            try:
+                directory.rmdir()
+            except OSError:
+                pass
+
+    def sweep(self) -> Dict[str, Any]:
+        """Apply the TTL and size limits once and return what was removed."""
+        started = time.monotonic()
+        cutoff = time.time() - self.ttl_seconds
+        removed_files = 0
+        removed_bytes = 0
+
+        for location, base in (('disk', self.root), ('tmpfs', self.tmpfs_dir)):
+            entries = self._scan(base)
+            with self._lock:
+                pinned = set(self._pinned)
+            remaining = []
+            for mtime, size, path in entries:
+                if path in pinned:
+                    remaining.append((mtime, size, path))
+                elif mtime < cutoff:
+                    if self._unlink(path, size, location):
+                        removed_files += 1
+                        removed_bytes += size
+                else:
+                    remaining.append((mtime, size, path))
+
+            total = sum(size for _, size, _ in remaining)
+            if total > self.max_total_bytes:
+                for mtime, size, path in sorted(remaining, key=lambda e: e[0]):
+                    if total <= self.max_total_bytes:
+                        break
+                    if path in pinned:
+                        continue
+                    if self._unlink(path, size, location):
+                        removed_files += 1
+                        removed_bytes += size
+                    total -= size
+
+            self._remove_empty_shards(base)
+
+        self._recount()
+        duration = time.monotonic() - started
+        with self._lock:
+            self.stats['sweeps_total'] += 1
+            self.stats['swept_files_total'] += removed_files
+            self.stats['swept_bytes_total'] += removed_bytes
+            self.stats['last_sweep_at'] = time.time()
+            self.stats['last_sweep_duration_seconds'] = round(duration, 4)
+
+        if removed_files:
+            logger.info(f"Upload sweep removed {removed_files} files ({removed_bytes} bytes)")
+
+        return {"removed_files": removed_files, "removed_bytes": removed_bytes, "duration_seconds": duration}
+
+    def _sweep_loop(self) -> None:
+        while not self._stop_event.wait(self.sweep_interval_seconds):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Upload sweep failed: {str(e)}")
+            for hook in self.sweep_hooks:
+                try:
+                    hook()
+                except Exception as e:
+                    logger.error(f"Upload sweep hook failed: {str(e)}")
+
+    def start_sweeper(self) -> None:
+        """Start the background sweeper thread (no-op if already running)."""
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+        self._stop_event.clear()
+        self._sweeper = threading.Thread(target=self._sweep_loop, name="upload-sweeper", daemon=True)
+        self._sweeper.start()
+        logger.info(
+            f"Upload sweeper started (ttl={self.ttl_seconds}s, max={self.max_total_bytes} bytes, "
+            f"interval={self.sweep_interval_seconds}s)"
+        )
+
+    def stop_sweeper(self) -> None:
+        """Signal the background sweeper to stop and wait for it."""
+        self._stop_event.set()
+        if self._sweeper is not None:
+            self._sweeper.join(timeout=5)
+            self._sweeper = None
+
+    # ------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------
+
+    def usage(self) -> Dict[str, Any]:
+        """Snapshot of storage usage and sweeper activity."""
+        with self._lock:
+            snapshot = dict(self.stats)
+            snapshot['pinned_files'] = len(self._pinned)
+        snapshot['max_total_bytes'] = self.max_total_bytes
+        snapshot['ttl_seconds'] = self.ttl_seconds
+        snapshot['small_file_mode'] = self.small_file_mode
+        try:
+            disk = shutil.disk_usage(self.root)
+            snapshot['filesystem_free_bytes'] = disk.free
+            snapshot['filesystem_total_bytes'] = disk.total
+        except OSError:
+            pass
+        return snapshot
+
+    def prometheus_metrics(self) -> List[str]:
+        """Render usage as Prometheus exposition lines."""
+        usage = self.usage()
+        lines = [
+            "# HELP ocr_upload_storage_bytes Bytes currently held by stored uploads.",
+            "# TYPE ocr_upload_storage_bytes gauge",
+        ]
+        for location in ('disk', 'tmpfs', 'memory'):
+            lines.append(f'ocr_upload_storage_bytes{{location="{location}"}} {usage[f"{location}_bytes"]}')
+        lines += [
+            "# HELP ocr_upload_storage_files Number of uploads currently stored.",
+            "# TYPE ocr_upload_storage_files gauge",
+        ]
+        for location in ('disk', 'tmpfs', 'memory'):
+            lines.append(f'ocr_upload_storage_files{{location="{location}"}} {usage[f"{location}_files"]}')
+        lines += [
+            "# HELP ocr_upload_storage_limit_bytes Configured maximum total upload size.",
+            "# TYPE ocr_upload_storage_limit_bytes gauge",
+            f"ocr_upload_storage_limit_bytes {usage['max_total_bytes']}",
+            "# HELP ocr_upload_swept_files_total Uploads removed by the retention sweeper.",
+            "# TYPE ocr_upload_swept_files_total counter",
+            f"ocr_upload_swept_files_total {usage['swept_files_total']}",
+            "# HELP ocr_upload_swept_bytes_total Bytes removed by the retention sweeper.",
+            "# TYPE ocr_upload_swept_bytes_total counter",
+            f"ocr_upload_swept_bytes_total {usage['swept_bytes_total']}",
+        ]
+        if 'filesystem_free_bytes' in usage:
+            lines += [
+                "# HELP ocr_upload_filesystem_free_bytes Free space on the upload filesystem.",
+                "# TYPE ocr_upload_filesystem_free_bytes gauge",
+                f"ocr_upload_filesystem_free_bytes {usage['filesystem_free_bytes']}",
+            ]
+        return lines
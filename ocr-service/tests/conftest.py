@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The service runs with app/ on the path (python app/main.py); tests import its modules the same way
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
@@ -0,0 +1,30 @@
+import time
+from datetime import datetime
+
+from ocr_index import OcrSearchIndex
+
+PAGE = {"page": 1, "text": "Faktura VAT nr 12", "text_blocks": []}
+
+
+def indexed(path, retention_seconds):
+    index = OcrSearchIndex(path, retention_seconds=retention_seconds)
+    old = datetime.utcfromtimestamp(time.time() - 90 * 24 * 3600).isoformat() + "Z"
+    index.add_document("acme", None, "old.pdf", [PAGE], old)
+    index.add_document("acme", None, "new.pdf", [PAGE], datetime.utcnow().isoformat() + "Z")
+    return index
+
+
+def test_search_index_keeps_documents_without_retention(tmp_path):
+    index = indexed(tmp_path / "index.sqlite", retention_seconds=0)
+    assert index.prune() == 0
+    results = index.search("acme", "faktura")["results"]
+    assert sorted(result["filename"] for result in results) == ["new.pdf", "old.pdf"]
+
+
+def test_search_index_expires_documents_past_retention(tmp_path):
+    index = indexed(tmp_path / "index.sqlite", retention_seconds=30 * 24 * 3600)
+    assert index.prune() == 1
+    results = index.search("acme", "faktura")["results"]
+    assert [result["filename"] for result in results] == ["new.pdf"]
+    assert index.usage()["pages"] == 1
+    assert index.conn.execute("SELECT COUNT(*) FROM pages_fts").fetchone() == (1,)
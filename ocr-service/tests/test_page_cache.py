@@ -0,0 +1,44 @@
+import fitz
+
+from page_cache import page_content_key
+
+
+def text_page(text: str = "Ogólne warunki sprzedaży") -> fitz.Document:
+    document = fitz.open()
+    page = document.new_page()
+    page.insert_text((72, 72), text)
+    return document
+
+
+def test_identical_pages_share_a_key():
+    first, second = text_page(), text_page()
+    # Extra objects shift the xref numbers of the second file
+    second.new_page()
+    second.move_page(1, 0)
+    assert page_content_key(first, 0) == page_content_key(second, 1)
+
+
+def test_text_change_changes_key():
+    assert page_content_key(text_page("Do zapłaty: 100 zł"), 0) != page_content_key(text_page("Do zapłaty: 900 zł"), 0)
+
+
+def test_annotation_changes_key():
+    plain, annotated = text_page(), text_page()
+    annotated[0].add_freetext_annot(fitz.Rect(100, 100, 300, 150), "Zapłacono")
+    assert page_content_key(plain, 0) != page_content_key(annotated, 0)
+
+    first, second = text_page(), text_page()
+    first[0].add_freetext_annot(fitz.Rect(100, 100, 300, 150), "Zapłacono")
+    second[0].add_freetext_annot(fitz.Rect(100, 100, 300, 150), "Do zapłaty")
+    assert page_content_key(first, 0) != page_content_key(second, 0)
+
+
+def test_form_xobject_content_changes_key():
+    keys = []
+    for text in ("Faktura nr 1/2024", "Faktura nr 2/2024"):
+        document = fitz.open()
+        page = document.new_page()
+        page.show_pdf_page(page.rect, text_page(text), 0)
+        keys.append(page_content_key(document, 0))
+    assert None not in keys
+    assert keys[0] != keys[1]
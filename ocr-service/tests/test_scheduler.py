@@ -0,0 +1,81 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from scheduler import OcrScheduler, TenantQuota
+
+
+def run_job(scheduler: OcrScheduler, quota: TenantQuota, page_tasks, on_finished):
+    async def submit_and_wait():
+        job = scheduler.submit(quota, page_tasks, on_finished=on_finished)
+        return await job.future
+    scheduler.start()
+    try:
+        return asyncio.run(submit_and_wait())
+    finally:
+        scheduler.stop()
+
+
+def test_job_finishes_after_sibling_pages_when_one_fails():
+    slow_page_started, release_slow_page = threading.Event(), threading.Event()
+    finished = threading.Event()
+    events = []
+
+    def slow_page():
+        slow_page_started.set()
+        release_slow_page.wait(5)
+        events.append("slow page done")
+        return "slow"
+
+    def failing_page():
+        slow_page_started.wait(5)
+        raise RuntimeError("page failed")
+
+    def on_finished():
+        events.append("finished")
+        finished.set()
+
+    def release_later():
+        # The future has already failed here; the slow page is still rendering
+        assert not finished.wait(0.2)
+        release_slow_page.set()
+
+    threading.Thread(target=release_later, daemon=True).start()
+    scheduler = OcrScheduler(engine_slots=2, default_quota=TenantQuota("default", max_concurrent_jobs=1))
+    with pytest.raises(RuntimeError, match="page failed"):
+        run_job(scheduler, scheduler.default_quota, [slow_page, failing_page], on_finished)
+    assert finished.wait(5)
+    assert events == ["slow page done", "finished"]
+
+
+def test_health_and_metrics_do_not_name_tenants():
+    scheduler = OcrScheduler(label_key="secret")
+    quota = TenantQuota("acme-sp-z-oo")
+    run_job(scheduler, quota, [lambda: "page"], None)
+
+    usage = scheduler.usage()
+    assert usage["tenants"] == 1 and usage["pages_done"] == 1
+    assert "acme" not in str(usage)
+    metrics = "\n".join(scheduler.prometheus_metrics())
+    assert "acme" not in metrics
+    assert f'tenant="{scheduler.tenant_label("acme-sp-z-oo")}"' in metrics
+    assert OcrScheduler(label_key="other").tenant_label("acme-sp-z-oo") != scheduler.tenant_label("acme-sp-z-oo")
+
+
+def test_idle_tenants_are_evicted():
+    scheduler = OcrScheduler(label_key="secret")
+    # A fast token bucket refills right after the job, making the tenant idle
+    quota = TenantQuota("acme-sp-z-oo", pages_per_minute=60000)
+    run_job(scheduler, quota, [lambda: "page"], None)
+    time.sleep(0.05)
+
+    usage = scheduler.usage()
+    assert usage["tenants"] == 0 and usage["evicted_tenants"] == 1
+    assert usage["pages_done"] == 1
+    assert scheduler.tenant_label("acme-sp-z-oo") not in "\n".join(scheduler.prometheus_metrics())
+
+    # A returning tenant starts afresh
+    assert run_job(scheduler, quota, [lambda: "again"], None) == ["again"]
+    assert scheduler.usage()["pages_done"] == 2
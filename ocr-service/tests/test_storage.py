@@ -0,0 +1,35 @@
+import os
+import time
+
+from storage import UploadStorage
+
+
+def age(upload, seconds: float) -> None:
+    old = time.time() - seconds
+    os.utime(upload.path, (old, old))
+
+
+def test_sweep_skips_uploads_in_use(tmp_path):
+    storage = UploadStorage(tmp_path, ttl_seconds=60, max_total_bytes=10)
+    in_use, done = storage.save(b"x" * 8, ".pdf"), storage.save(b"y" * 8, ".pdf")
+    done.release()
+    age(in_use, 120)
+    age(done, 30)
+
+    # Over both limits: only the released upload may go
+    assert storage.sweep()["removed_files"] == 1
+    assert in_use.path.exists() and not done.path.exists()
+    assert storage.usage()["pinned_files"] == 1
+
+    in_use.release()
+    assert storage.sweep()["removed_files"] == 1
+    assert not in_use.path.exists()
+    assert storage.usage()["pinned_files"] == 0
+
+
+def test_discard_unpins(tmp_path):
+    storage = UploadStorage(tmp_path)
+    upload = storage.save(b"data", ".png")
+    upload.discard()
+    upload.release()
+    assert storage.usage()["pinned_files"] == 0
@@ -4,24 +4,56 @@ Mass Import Script for SPS Enterprise Products
 Processes 2000+ JSON files and imports into PostgreSQL with exact column names
 """
 
+import argparse
 import json
 import os
 import sys
 import re
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from queue import Empty, Full
 from pathlib import Path
 from datetime import datetime
 
+from field_mapper import FieldMapper
+from json_stream import iter_json_products
+
+# Counters produced per file and summed into ProductBatchImporter.stats
+FILE_STAT_KEYS = ('total_records', 'successful_transforms', 'skipped_records', 'errors')
+
 class ProductBatchImporter:
-    def __init__(self, data_directory):
+    def __init__(self, data_directory, workers=1, manifest=None, batch_rows=10000,
+                 checkpoint=None, dead_letters=None, validator=None, rejects=None, deduplicator=None):
         self.data_directory = Path(data_directory)
+        self.workers = max(1, workers or 1)
+        self.manifest = manifest
+        self.batch_rows = max(1, batch_rows)
+        self.checkpoint = checkpoint
+        self.dead_letters = dead_letters
+        self.validator = validator
+        self.rejects = rejects
+        self.deduplicator = deduplicator
+        # Fast path for transform_to_exact_columns, compiled per input key-set
+        self.mapper = FieldMapper(self.extract_pricing_unit)
         self.stats = {
             'total_files': 0,
             'total_records': 0,
             'successful_transforms': 0,
             'skipped_records': 0,
             'errors': 0,
+            'failed_loads': 0,
+            'rejected_records': 0,
             'start_time': datetime.now()
         }
+    
+    def merge_file_stats(self, file_stats, file_path=None):
+        """Add one file's counters to the run totals and record its dead letters"""
+        for key in FILE_STAT_KEYS:
+            self.stats[key] += file_stats.get(key, 0)
+        if self.dead_letters is not None:
+            for stage, error, record in file_stats.get('dead_letters', []):
+                self.dead_letters.write(stage, error, record, source_file=file_path)
         
     def clean_decimal(self, value):
         """Convert Polish decimal format to PostgreSQL format"""
@@ -38,11 +70,10 @@ class ProductBatchImporter:
             return None
     
     def clean_string(self, value):
-        """Clean string for SQL insertion"""
+        """Clean string value (SQL escaping happens in generate_sql_insert)"""
         if not value or value == '':
             return None
-        # Escape single quotes for SQL
-        return str(value).replace("'", "''")
+        return str(value)
     
     def extract_pricing_unit(self, data):
         """Extract pricing unit from field names"""
@@ -115,7 +146,7 @@ class ProductBatchImporter:
             'original_scraped_data': json.dumps(scraped_data, ensure_ascii=False)
         }
     
-    def generate_sql_insert(self, product_data):
+    def generate_sql_insert(self, product_data, table='products_complete'):
         """Generate SQL INSERT statement with your exact column names"""
         
         def sql_value(value):
@@ -126,10 +157,12 @@ class ProductBatchImporter:
             elif isinstance(value, (int, float)):
                 return str(value)
             else:
-                return f"'{value}'"
+                # Escape single quotes for SQL
+                escaped = str(value).replace("'", "''")
+                return f"'{escaped}'"
         
         sql = f"""
-INSERT INTO products_complete (
+INSERT INTO {table} (
     product_code, product_name, measure_unit, base_unit_for_pricing, selling_unit,
     measurement_units_per_selling_unit, unofficial_product_name, type_of_finish,
     surface, bevel, thickness_mm, width_mm, length_mm, package_m2,
@@ -169,131 +202,344 @@ ON CONFLICT (product_code) DO UPDATE SET
 """
         return sql.strip()
     
-    def process_json_file(self, file_path):
-        """Process a single JSON file"""
+    def iter_file_rows(self, file_path, file_stats):
+        """Stream transformed rows from one file, updating file_stats as it goes.
+        
+        Products are parsed incrementally (see json_stream), so memory use does
+        not depend on the size of the file.
+        """
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                json_data = json.load(f)
-            
-            # Handle different JSON structures
-            products = []
-            if isinstance(json_data, list):
-                products = json_data
-            elif isinstance(json_data, dict):
-                if 'mergedData' in json_data:
-                    if isinstance(json_data['mergedData'], list):
-                        products = json_data['mergedData']
-                    else:
-                        products = [json_data['mergedData']]
-                else:
-                    products = [json_data]
-            
-            sql_statements = []
-            file_success_count = 0
-            
-            for product in products:
-                # Skip if no product code or name
-                if not product.get('kod_produktu') or not product.get('nazwa_produktu'):
-                    self.stats['skipped_records'] += 1
+            for product in iter_json_products(file_path):
+                # Skip if not a product or no product code or name
+                if not isinstance(product, dict) or not product.get('kod_produktu') or not product.get('nazwa_produktu'):
+                    file_stats['skipped_records'] += 1
                     continue
                 
                 try:
-                    transformed_product = self.transform_to_exact_columns(product)
-                    sql_statement = self.generate_sql_insert(transformed_product)
-                    sql_statements.append(sql_statement)
-                    file_success_count += 1
-                    self.stats['successful_transforms'] += 1
+                    row = self.mapper.transform(product)
                 except Exception as e:
                     print(f"❌ Error transforming product from {file_path}: {e}")
-                    self.stats['errors'] += 1
+                    file_stats['errors'] += 1
+                    file_stats['total_records'] += 1
+                    file_stats.setdefault('dead_letters', []).append(('transform', str(e), product))
+                    continue
                 
-                self.stats['total_records'] += 1
-            
-            return sql_statements, file_success_count
+                file_stats['successful_transforms'] += 1
+                file_stats['total_records'] += 1
+                yield row
             
         except Exception as e:
             print(f"❌ Error processing file {file_path}: {e}")
-            self.stats['errors'] += 1
-            return [], 0
+            file_stats['errors'] += 1
+            file_stats.setdefault('dead_letters', []).append(('parse', str(e), None))
+    
+    def transform_json_file(self, file_path):
+        """Transform a single JSON file into rows, returning (rows, file_stats).
+        
+        Does not touch self.stats, so it can run inside a worker process.
+        """
+        file_stats = dict.fromkeys(FILE_STAT_KEYS, 0)
+        rows = list(self.iter_file_rows(file_path, file_stats))
+        return rows, file_stats
+    
+    def stream_json_file(self, file_path, batches, abort):
+        """Transform one file in a worker process, sending it through a queue in pieces.
+        
+        Puts ('rows', [...]) messages of at most batch_rows rows, then
+        ('done', file_stats). The queue is bounded, so a worker never holds
+        more than one batch of a file the importer has not caught up with.
+        Gives up as soon as the importer sets abort.
+        """
+        def send(message):
+            while not abort.is_set():
+                try:
+                    batches.put(message, timeout=1)
+                    return True
+                except Full:
+                    continue
+            return False
+        
+        if abort.is_set():
+            return
+        file_stats = dict.fromkeys(FILE_STAT_KEYS, 0)
+        rows = []
+        for row in self.iter_file_rows(file_path, file_stats):
+            rows.append(row)
+            if len(rows) >= self.batch_rows:
+                if not send(('rows', rows)):
+                    return
+                rows = []
+        if rows and not send(('rows', rows)):
+            return
+        send(('done', file_stats))
+    
+    @staticmethod
+    def iter_streamed_rows(batches, future, file_stats):
+        """Rows sent by stream_json_file; file_stats is filled in once they are exhausted"""
+        while True:
+            try:
+                kind, payload = batches.get(timeout=1)
+            except Empty:
+                if future.done():
+                    # Re-raises a worker failure; a finished worker has queued everything
+                    future.result()
+                continue
+            if kind == 'done':
+                file_stats.update(payload)
+                return
+            yield from payload
+    
+    def process_json_file(self, file_path):
+        """Process a single JSON file"""
+        rows, file_stats = self.transform_json_file(file_path)
+        self.merge_file_stats(file_stats)
+        sql_statements = [self.generate_sql_insert(row) for row in rows]
+        return sql_statements, len(sql_statements)
+    
+    def iter_transformed_files(self, json_files):
+        """Yield (file_path, rows, file_stats) in input order.
+        
+        rows is a generator that must be exhausted before the next file is
+        taken; file_stats is complete once it is. With workers > 1 the files
+        are transformed in a process pool and streamed back in batches of
+        batch_rows rows through one small bounded queue per file (see
+        stream_json_file), with at most two files per worker in flight, so
+        neither side holds a whole file. Files are still yielded in input
+        order, so the output is deterministic.
+        """
+        if self.workers == 1:
+            for file_path in json_files:
+                file_stats = dict.fromkeys(FILE_STAT_KEYS, 0)
+                yield file_path, self.iter_file_rows(file_path, file_stats), file_stats
+            return
+        
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(str(self.data_directory), self.batch_rows)
+        ) as pool, multiprocessing.Manager() as manager:
+            files = iter(json_files)
+            in_flight = deque()
+            submitted = []
+            abort = manager.Event()
+            
+            def submit_next():
+                file_path = next(files, None)
+                if file_path is not None:
+                    batches = manager.Queue(maxsize=2)
+                    future = pool.submit(_stream_file_in_worker, file_path, batches, abort)
+                    in_flight.append((file_path, batches, future))
+                    submitted.append(future)
+            
+            for _ in range(self.workers * 2):
+                submit_next()
+            try:
+                while in_flight:
+                    file_path, batches, future = in_flight.popleft()
+                    submit_next()
+                    file_stats = dict.fromkeys(FILE_STAT_KEYS, 0)
+                    yield file_path, self.iter_streamed_rows(batches, future, file_stats), file_stats
+            finally:
+                # Stopped early (error or interrupt): workers must be done with the
+                # manager's queues before it shuts down
+                abort.set()
+                for future in submitted:
+                    future.cancel()
+                wait(submitted)
+    
+    def commit_batch(self, writer, batch_number, rows, isolating=False):
+        """Write and commit rows, isolating failing rows by bisection.
+        
+        Only used with --checkpoint, i.e. with a writer that commits to the
+        database (CopyLoader, BatchUpsertLoader). Rows that fail on their own
+        go to the dead-letter file instead of aborting the run. Returns the
+        committed rows.
+        """
+        try:
+            writer.write_batch(batch_number, rows)
+            writer.checkpoint()
+            return rows
+        except Exception as e:
+            if len(rows) <= 1:
+                self.stats['failed_loads'] += len(rows)
+                if rows and self.dead_letters is not None:
+                    self.dead_letters.write('load', e, rows[0])
+                print(f"❌ Failed to load product {rows[0]['product_code'] if rows else '?'}: {e}")
+                return []
+            if not isolating:
+                print(f"⚠️  Batch {batch_number} failed ({e}), isolating bad rows...")
+            middle = len(rows) // 2
+            return (self.commit_batch(writer, batch_number, rows[:middle], isolating=True) +
+                    self.commit_batch(writer, batch_number, rows[middle:], isolating=True))
+    
+    def validate_batch(self, rows):
+        """Drop rows that violate the target table's constraints, writing them to the reject file"""
+        if self.validator is None or not rows:
+            return rows
+        valid, rejects = self.validator.split(rows)
+        for row, reasons in rejects:
+            self.stats['rejected_records'] += 1
+            if self.rejects is not None:
+                self.rejects.write('validate', '; '.join(reasons), row)
+        return valid
+    
+    def flush_batch(self, writer, batch_number, rows, completed_files):
+        """Hand a batch to the writer; with checkpointing commit it and record progress"""
+        rows = self.validate_batch(rows)
+        if self.checkpoint is None:
+            writer.write_batch(batch_number, rows)
+            self.mark_written(rows)
+            return
+        committed = self.commit_batch(writer, batch_number, rows) if rows else []
+        self.mark_written(committed)
+        self.checkpoint.record_batch(completed_files, len(committed))
     
-    def process_all_files(self, max_files=None):
-        """Process all JSON files and generate SQL import script"""
+    def mark_written(self, rows):
+        """Tell the manifest which rows reached the writer (rejected and failed rows never do)"""
+        if self.manifest is not None:
+            self.manifest.mark_written(rows, collapsed=self.deduplicator is not None)
+    
+    def process_all_files(self, max_files=None, writer=None):
+        """Process all JSON files and hand each batch to the writer (SQL script by default)"""
         print("Starting mass import of 2000+ products with your exact column names...")
         print(f"Processing directory: {self.data_directory}")
         
-        # Get all JSON files
-        json_files = list(self.data_directory.glob('*.json'))
+        # Get all JSON / NDJSON files
+        json_files = [
+            path for pattern in ('*.json', '*.ndjson', '*.jsonl')
+            for path in self.data_directory.glob(pattern)
+        ]
         json_files.sort()
         
         if max_files:
             json_files = json_files[:max_files]
         
+        if self.manifest is not None:
+            found_files = len(json_files)
+            json_files = self.manifest.filter_changed_files(json_files)
+            print(f"Incremental mode: {found_files - len(json_files)} unchanged files skipped")
+        
+        if self.checkpoint is not None and self.checkpoint.resumed:
+            found_files = len(json_files)
+            json_files = self.checkpoint.filter_pending_files(json_files)
+            print(f"Resuming: {found_files - len(json_files)} files already committed, "
+                  f"{self.checkpoint.state['committed_rows']} rows in {self.checkpoint.state['completed_batches']} batches")
+        
         self.stats['total_files'] = len(json_files)
         print(f"Found {len(json_files)} JSON files to process\n")
+        if self.workers > 1:
+            print(f"Transforming with {self.workers} worker processes\n")
         
-        # Create output file
-        output_file = Path(__file__).parent / 'mass_import.sql'
+        if writer is None:
+            writer = SqlFileWriter(self, Path(__file__).parent / 'mass_import.sql')
         
-        with open(output_file, 'w', encoding='utf-8') as sql_file:
-            # Write header
-            sql_file.write("-- ========================================\n")
-            sql_file.write("-- MASS IMPORT OF SPS ENTERPRISE PRODUCTS\n")
-            sql_file.write("-- Generated from 2000+ scraped JSON files\n")
-            sql_file.write(f"-- Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            sql_file.write("-- ========================================\n\n")
-            sql_file.write("BEGIN;\n\n")
-            
-            # Process files in batches
+        writer.begin()
+        try:
+            # Process files in batches; rows are flushed to the writer every
+            # batch_rows rows so one huge file never accumulates in memory
             batch_size = 50
             processed_files = 0
+            batch_number = 0
+            batch_rows = []
+            completed_files = []
+            transformed_files = self.iter_transformed_files(json_files)
             
             for i in range(0, len(json_files), batch_size):
                 batch = json_files[i:i + batch_size]
                 
                 print(f"Processing batch {i//batch_size + 1}/{(len(json_files)-1)//batch_size + 1}...")
                 
-                batch_statements = []
-                batch_success_count = 0
-                
-                for file_path in batch:
-                    sql_statements, file_count = self.process_json_file(file_path)
-                    batch_statements.extend(sql_statements)
-                    batch_success_count += file_count
+                for _ in batch:
+                    file_path, rows, file_stats = next(transformed_files)
+                    if self.manifest is not None:
+                        rows = self.manifest.filter_changed_rows(rows, file_path)
+                    if self.deduplicator is not None:
+                        # Held back until every file is seen; emitted once per product below
+                        self.deduplicator.add_rows(rows)
+                        rows = ()
+                    for row in rows:
+                        batch_rows.append(row)
+                        if len(batch_rows) >= self.batch_rows:
+                            batch_number += 1
+                            self.flush_batch(writer, batch_number, batch_rows, completed_files)
+                            batch_rows, completed_files = [], []
+                    self.merge_file_stats(file_stats, file_path)
+                    completed_files.append(file_path)
                     processed_files += 1
                 
-                # Write batch to file
-                if batch_statements:
-                    sql_file.write(f"-- Batch {i//batch_size + 1}: {len(batch_statements)} products\n")
-                    for statement in batch_statements:
-                        sql_file.write(statement + ";\n\n")
+                # Write batch (deduplicated runs write once all files are read)
+                if self.deduplicator is None and (batch_rows or (self.checkpoint is not None and completed_files)):
+                    batch_number += 1
+                    self.flush_batch(writer, batch_number, batch_rows, completed_files)
+                    batch_rows, completed_files = [], []
                 
                 # Progress update
                 progress = (processed_files / len(json_files)) * 100
                 print(f"Progress: {progress:.1f}% ({processed_files}/{len(json_files)} files)")
                 print(f"   Products: {self.stats['successful_transforms']} transformed, {self.stats['errors']} errors\n")
             
-            # Write footer
-            sql_file.write("COMMIT;\n\n")
-            sql_file.write("-- ========================================\n")
-            sql_file.write("-- IMPORT STATISTICS\n")
-            sql_file.write("-- ========================================\n")
-            sql_file.write(f"-- Files processed: {self.stats['total_files']}\n")
-            sql_file.write(f"-- Records processed: {self.stats['total_records']}\n")
-            sql_file.write(f"-- Successful transforms: {self.stats['successful_transforms']}\n")
-            sql_file.write(f"-- Skipped records: {self.stats['skipped_records']}\n")
-            sql_file.write(f"-- Errors: {self.stats['errors']}\n")
+            if self.manifest is not None:
+                # Unchanged files that now hold the winning row of a code whose written row disappeared
+                for file_path, codes in self.manifest.fallback_files().items():
+                    rows = self.manifest.filter_fallback_rows(
+                        self.iter_file_rows(file_path, dict.fromkeys(FILE_STAT_KEYS, 0)), file_path, codes
+                    )
+                    if self.deduplicator is not None:
+                        self.deduplicator.add_rows(rows)
+                        continue
+                    for row in rows:
+                        batch_rows.append(row)
+                        if len(batch_rows) >= self.batch_rows:
+                            batch_number += 1
+                            self.flush_batch(writer, batch_number, batch_rows, completed_files)
+                            batch_rows, completed_files = [], []
+                if self.deduplicator is None and batch_rows:
+                    batch_number += 1
+                    self.flush_batch(writer, batch_number, batch_rows, completed_files)
+                    batch_rows, completed_files = [], []
+            
+            if self.deduplicator is not None:
+                for row in self.deduplicator.iter_rows():
+                    batch_rows.append(row)
+                    if len(batch_rows) >= self.batch_rows:
+                        batch_number += 1
+                        self.flush_batch(writer, batch_number, batch_rows, [])
+                        batch_rows = []
+                # Source files count as completed with the last deduplicated batch
+                if batch_rows or (self.checkpoint is not None and completed_files):
+                    batch_number += 1
+                    self.flush_batch(writer, batch_number, batch_rows, completed_files)
+                    batch_rows, completed_files = [], []
             
-            # Final verification query
-            sql_file.write("\n-- Verification queries\n")
-            sql_file.write("SELECT COUNT(*) as total_products FROM products_complete;\n")
-            sql_file.write("SELECT selling_unit, COUNT(*) as count FROM products_complete GROUP BY selling_unit;\n")
-            sql_file.write("SELECT COUNT(*) as products_with_pricing FROM products_complete WHERE selling_price_per_unit IS NOT NULL;\n")
+            output = writer.finish(self.stats)
+        except BaseException:
+            writer.abort()
+            if self.manifest is not None:
+                self.manifest.rollback()
+            raise
+        finally:
+            if self.dead_letters is not None:
+                self.dead_letters.close()
+            if self.rejects is not None:
+                self.rejects.close()
+            if self.deduplicator is not None:
+                self.deduplicator.close()
+        
+        if self.checkpoint is not None:
+            self.checkpoint.mark_completed()
+        deleted_codes = []
+        if self.manifest is not None:
+            # Rows in a script or export file are only imported once it is loaded
+            if getattr(writer, 'commits_to_database', False):
+                deleted_codes = self.manifest.commit()
+            else:
+                deleted_codes = self.manifest.stage()
         
         self.stats['end_time'] = datetime.now()
         duration = (self.stats['end_time'] - self.stats['start_time']).total_seconds()
         
         print("=" * 60)
-        print("MASS IMPORT SQL GENERATION COMPLETED!")
+        print(f"MASS IMPORT {writer.label} COMPLETED!")
         print("=" * 60)
         print(f"Duration: {int(duration//60)}m {int(duration%60)}s")
         print(f"Files processed: {self.stats['total_files']}")
@@ -301,31 +547,230 @@ ON CONFLICT (product_code) DO UPDATE SET
         print(f"Successful transforms: {self.stats['successful_transforms']}")
         print(f"Skipped records: {self.stats['skipped_records']}")
         print(f"Errors: {self.stats['errors']}")
-        print(f"Success rate: {(self.stats['successful_transforms']/self.stats['total_records']*100):.1f}%")
-        print(f"Output file: {output_file}")
+        print(f"Success rate: {(self.stats['successful_transforms']/max(self.stats['total_records'], 1)*100):.1f}%")
+        if self.checkpoint is not None:
+            print(f"Failed loads: {self.stats['failed_loads']}")
+        if self.deduplicator is not None:
+            dedup_stats = self.deduplicator.stats
+            print(f"Duplicates collapsed ({self.deduplicator.policy}): {dedup_stats['duplicates_collapsed']} rows "
+                  f"across {dedup_stats['duplicated_codes']} product codes, "
+                  f"{dedup_stats['unique_products']} unique products")
+        if self.validator is not None:
+            for line in self.validator.summary_lines():
+                print(line)
+            if self.rejects is not None and self.rejects.count:
+                print(f"   Rejected rows written to {self.rejects.path}")
+        if self.dead_letters is not None and self.dead_letters.count:
+            print(f"Dead letters: {self.dead_letters.count} records in {self.dead_letters.path}")
+        if self.manifest is not None:
+            manifest_stats = self.manifest.stats
+            print(f"Unchanged files skipped: {manifest_stats['skipped_files']}")
+            print(f"Changed/new records: {manifest_stats['changed_records']}")
+            print(f"Unchanged records skipped: {manifest_stats['unchanged_records']}")
+            print(f"Records held by a later file: {manifest_stats['shadowed_records']}")
+            print(f"Records re-read from unchanged files: {manifest_stats['fallback_records']}")
+            print(f"Deleted records: {manifest_stats['deleted_records']}")
+            if deleted_codes:
+                print(f"   Deleted product codes: {', '.join(deleted_codes[:20])}"
+                      f"{' ...' if len(deleted_codes) > 20 else ''}")
+            if not getattr(writer, 'commits_to_database', False):
+                print(f"   Manifest staged in {self.manifest.pending_path}; once the output is loaded run: "
+                      f"python import_manifest.py confirm --manifest {self.manifest.manifest_path}")
+        print(f"Output: {output}")
         print("=" * 60)
         
-        return output_file
+        return output
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python batch-import.py <data_directory> [max_files]")
-        print("Example: python batch-import.py ../data/scraped/json")
-        print("Example: python batch-import.py ../data/scraped/json 100")
-        sys.exit(1)
+class SqlFileWriter:
+    """Writes transformed rows as the mass_import.sql script for psql -f"""
+    
+    label = 'SQL GENERATION'
+    
+    def __init__(self, importer, output_file, table='products_complete'):
+        self.importer = importer
+        self.output_file = Path(output_file)
+        self.table = table
+        self.sql_file = None
     
-    data_directory = sys.argv[1]
-    max_files = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    def begin(self):
+        self.sql_file = open(self.output_file, 'w', encoding='utf-8')
+        # Write header
+        self.sql_file.write("-- ========================================\n")
+        self.sql_file.write("-- MASS IMPORT OF SPS ENTERPRISE PRODUCTS\n")
+        self.sql_file.write("-- Generated from 2000+ scraped JSON files\n")
+        self.sql_file.write(f"-- Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        self.sql_file.write("-- ========================================\n\n")
+        self.sql_file.write("BEGIN;\n\n")
+    
+    def write_batch(self, batch_number, rows):
+        if rows:
+            self.sql_file.write(f"-- Batch {batch_number}: {len(rows)} products\n")
+            for row in rows:
+                self.sql_file.write(self.importer.generate_sql_insert(row, self.table) + ";\n\n")
+    
+    def finish(self, stats):
+        # Write footer
+        self.sql_file.write("COMMIT;\n\n")
+        self.sql_file.write("-- ========================================\n")
+        self.sql_file.write("-- IMPORT STATISTICS\n")
+        self.sql_file.write("-- ========================================\n")
+        self.sql_file.write(f"-- Files processed: {stats['total_files']}\n")
+        self.sql_file.write(f"-- Records processed: {stats['total_records']}\n")
+        self.sql_file.write(f"-- Successful transforms: {stats['successful_transforms']}\n")
+        self.sql_file.write(f"-- Skipped records: {stats['skipped_records']}\n")
+        self.sql_file.write(f"-- Errors: {stats['errors']}\n")
+        
+        # Final verification query
+        self.sql_file.write("\n-- Verification queries\n")
+        self.sql_file.write(f"SELECT COUNT(*) as total_products FROM {self.table};\n")
+        self.sql_file.write(f"SELECT selling_unit, COUNT(*) as count FROM {self.table} GROUP BY selling_unit;\n")
+        self.sql_file.write(f"SELECT COUNT(*) as products_with_pricing FROM {self.table} WHERE selling_price_per_unit IS NOT NULL;\n")
+        self.sql_file.close()
+        return self.output_file
+    
+    def abort(self):
+        if self.sql_file is not None and not self.sql_file.closed:
+            self.sql_file.close()
+
+# Per-process importer used by the --workers pool
+_worker_importer = None
+
+def _init_worker(data_directory, batch_rows):
+    global _worker_importer
+    _worker_importer = ProductBatchImporter(data_directory, batch_rows=batch_rows)
+
+def _stream_file_in_worker(file_path, batches, abort):
+    _worker_importer.stream_json_file(file_path, batches, abort)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate a mass import for scraped SPS Enterprise products",
+        epilog="Example: python batch-import.py ../data/scraped/json 100 --workers 8"
+    )
+    parser.add_argument('data_directory', help="Directory with scraped JSON files")
+    parser.add_argument('max_files', nargs='?', type=int, default=None,
+                        help="Only process the first N files")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Transform files in N worker processes (0 = all CPU cores)")
+    parser.add_argument('--mode', choices=('sql', 'copy', 'upsert', 'parquet', 'arrow', 'ndjson'), default='sql',
+                        help="sql: write mass_import.sql; copy: COPY into PostgreSQL via a staging table; "
+                             "upsert: parameterized batched upserts over a connection pool; "
+                             "parquet/arrow/ndjson: typed columnar intermediate file")
+    parser.add_argument('--output', default=None,
+                        help="Output file for parquet/arrow/ndjson modes (default: scripts/products_import.<ext>)")
+    parser.add_argument('--dsn', default=None,
+                        help="PostgreSQL DSN for direct loading (default: $DATABASE_URL)")
+    parser.add_argument('--table', choices=('products_complete', 'products'), default='products_complete',
+                        help="Target table: loaded by copy/upsert, written to by the sql script, "
+                             "recorded in columnar metadata (and checked by --validate)")
+    parser.add_argument('--batch-rows', type=int, default=10000,
+                        help="Flush transformed rows to the output every N rows")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only emit new or changed products (tracked in the manifest)")
+    parser.add_argument('--manifest', default=str(Path(__file__).parent / 'import_manifest.sqlite'),
+                        help="Manifest file used by --incremental")
+    parser.add_argument('--checkpoint', action='store_true',
+                        help="Commit per batch and record completed files in the state file (--mode copy/upsert)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted --checkpoint run (implies --checkpoint)")
+    parser.add_argument('--state-file', default=str(Path(__file__).parent / 'import_state.json'),
+                        help="Checkpoint state file")
+    parser.add_argument('--dead-letter', default=str(Path(__file__).parent / 'import_dead_letter.ndjson'),
+                        help="NDJSON file receiving records that failed to transform or load")
+    parser.add_argument('--batch-size', type=int, default=500,
+                        help="Rows per upsert batch (--mode upsert)")
+    parser.add_argument('--pool-size', type=int, default=4,
+                        help="Parallel connections for --mode upsert")
+    parser.add_argument('--dedup', choices=('latest', 'most_complete', 'coalesce'), default=None,
+                        help="Collapse duplicate product codes across files before loading: "
+                             "latest: last occurrence wins; most_complete: row with most filled columns; "
+                             "coalesce: per column, the last non-empty value")
+    parser.add_argument('--dedup-memory-rows', type=int, default=500000,
+                        help="Products kept in memory by --dedup before spilling to a temporary SQLite file")
+    parser.add_argument('--validate', action='store_true',
+                        help="Check rows against the target table's schema constraints before loading")
+    parser.add_argument('--schema', default=None,
+                        help="Schema file with the CREATE TABLE for --table (default: the repo's schema file)")
+    parser.add_argument('--reject-file', default=str(Path(__file__).parent / 'import_rejects.ndjson'),
+                        help="NDJSON file for rows failing --validate, with reasons")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    data_directory = args.data_directory
+    max_files = args.max_files
+    workers = args.workers if args.workers > 0 else os.cpu_count()
     
     if not os.path.exists(data_directory):
         print(f"❌ Directory not found: {data_directory}")
         sys.exit(1)
     
-    importer = ProductBatchImporter(data_directory)
-    output_file = importer.process_all_files(max_files)
+    manifest = None
+    if args.incremental:
+        from import_manifest import ImportManifest
+        manifest = ImportManifest(args.manifest)
+    
+    checkpoint = None
+    if (args.checkpoint or args.resume) and args.mode not in ('copy', 'upsert'):
+        # Files are only "committed" once a database commit confirms them; a script or
+        # export file applied later cannot be resumed from
+        print(f"❌ --checkpoint/--resume need a mode that commits to PostgreSQL (copy or upsert), not --mode {args.mode}")
+        sys.exit(1)
+    if args.checkpoint or args.resume:
+        from import_checkpoint import ImportCheckpoint
+        checkpoint = ImportCheckpoint(args.state_file, args.mode, resume=args.resume)
+    
+    from import_checkpoint import DeadLetterWriter
+    dead_letters = DeadLetterWriter(args.dead_letter, append=checkpoint is not None and checkpoint.resumed)
+    
+    validator = rejects = None
+    if args.validate:
+        from row_validator import RowValidator
+        validator = RowValidator(args.table, args.schema)
+        rejects = DeadLetterWriter(args.reject_file, append=checkpoint is not None and checkpoint.resumed)
+    
+    deduplicator = None
+    if args.dedup:
+        from product_dedup import ProductDeduplicator
+        deduplicator = ProductDeduplicator(args.dedup, max_in_memory=args.dedup_memory_rows,
+                                           spill_dir=Path(__file__).parent)
+    
+    importer = ProductBatchImporter(
+        data_directory,
+        workers=workers,
+        manifest=manifest,
+        batch_rows=args.batch_rows,
+        checkpoint=checkpoint,
+        dead_letters=dead_letters,
+        validator=validator,
+        rejects=rejects,
+        deduplicator=deduplicator
+    )
+    
+    if args.mode == 'copy':
+        from pg_loader import CopyLoader
+        importer.process_all_files(max_files, writer=CopyLoader(args.dsn, table=args.table))
+        return
+    
+    if args.mode in ('parquet', 'arrow', 'ndjson'):
+        from columnar_writer import ColumnarWriter
+        output = args.output or str(Path(__file__).parent / f"products_import.{args.mode}")
+        importer.process_all_files(max_files, writer=ColumnarWriter(output, args.mode, table=args.table))
+        return
+    
+    if args.mode == 'upsert':
+        from pg_loader import BatchUpsertLoader
+        loader = BatchUpsertLoader(args.dsn, table=args.table, batch_size=args.batch_size, pool_size=args.pool_size)
+        importer.process_all_files(max_files, writer=loader)
+        return
+    
+    output_file = importer.process_all_files(
+        max_files, writer=SqlFileWriter(importer, Path(__file__).parent / 'mass_import.sql', table=args.table))
     
     print(f"\nNext step: Execute the SQL file in PostgreSQL:")
-    print(f"docker-compose exec postgres psql -U crm_user -d crm_db -f /tmp/mass_import.sql")
+    print(f"docker-compose exec postgres psql -U crm_user -d crm_db -v ON_ERROR_STOP=1 -f /tmp/mass_import.sql")
+    if manifest is not None:
+        print(f"Then mark the incremental run as imported: python scripts/import_manifest.py confirm --manifest {args.manifest}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
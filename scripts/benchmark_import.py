@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Benchmark and profiling harness for the product import pipeline
+Generates synthetic scrape files and times each import stage separately
+"""
+
+import argparse
+import cProfile
+import importlib.util
+import io
+import json
+import os
+import pstats
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from json_stream import iter_json_products
+from pg_loader import csv_line
+
+SCRIPTS_DIR = Path(__file__).parent
+SAMPLE_DIR = SCRIPTS_DIR / 'extracted_products'
+STAGES = ('parse', 'transform', 'generate', 'load')
+
+# Used when scripts/extracted_products is not available
+FALLBACK_TEMPLATE = {
+    "kod_produktu": "54045",
+    "nazwa_produktu": "[S] Tarkett Listwa Foliowana Biała",
+    "jednostka_sprzedażowa": "mb",
+    "nieoficjalna_nazwa_produktu": "Tarkett Listwa Foliowana Biała | 16x60x2400 | 8791740",
+    "grubość_[mm]": "16.0",
+    "długość_[mm]": "2400.0",
+    "cena_detaliczna_netto_1mb_[zł]": "28.75",
+    "cena_sprzedaży_netto_1mb_[zł]": "23.0",
+    "cena_zakupu_netto_1mb_[zł]": "14.26",
+    "potencjalny_zysk_1mb_[zł]": "8.74",
+    "długość_sprzedażowa_[mb]": "2.5"
+}
+
+
+def load_importer_module():
+    """Import batch-import.py (its file name is not a valid module name)"""
+    spec = importlib.util.spec_from_file_location('batch_import', SCRIPTS_DIR / 'batch-import.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def parse_size(text):
+    """'10k' -> 10000, '1m' -> 1000000"""
+    text = text.strip().lower()
+    multiplier = {'k': 1000, 'm': 1000000}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * multiplier)
+
+
+def load_templates(limit=500):
+    """Real scraped products used as shapes for synthetic records"""
+    templates = []
+    for file_path in sorted(SAMPLE_DIR.glob('*.json')):
+        for product in iter_json_products(file_path):
+            if isinstance(product, dict) and product.get('kod_produktu'):
+                templates.append(product)
+            if len(templates) >= limit:
+                return templates
+    return templates or [FALLBACK_TEMPLATE]
+
+
+def synthetic_product(template, number, rng):
+    """Copy of a template with a unique code and jittered prices"""
+    product = dict(template)
+    product['kod_produktu'] = f"B{number:08d}"
+    if product.get('nazwa_produktu'):
+        product['nazwa_produktu'] = f"{product['nazwa_produktu']} #{number}"
+    for key, value in template.items():
+        if key.startswith(('cena_', 'potencjalny_zysk')) and value:
+            try:
+                product[key] = f"{float(str(value).replace(',', '.')) * rng.uniform(0.9, 1.1):.2f}"
+            except ValueError:
+                pass
+    return product
+
+
+def generate_dataset(output_dir, total, products_per_file=100, seed=42):
+    """Write total synthetic products as products_batch_NNNN.json files (reused if present)"""
+    output_dir = Path(output_dir)
+    marker = output_dir / '.complete'
+    if marker.exists() and marker.read_text().strip() == str(total):
+        return sorted(output_dir.glob('products_batch_*.json'))
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for stale in output_dir.glob('products_batch_*.json'):
+        stale.unlink()
+
+    rng = random.Random(seed)
+    templates = load_templates()
+    print(f"🧪 Generating {total} synthetic products in {output_dir}/")
+    for file_number, start in enumerate(range(0, total, products_per_file), 1):
+        batch = [synthetic_product(rng.choice(templates), n, rng)
+                 for n in range(start, min(start + products_per_file, total))]
+        with open(output_dir / f"products_batch_{file_number:04d}.json", 'w', encoding='utf-8') as f:
+            json.dump(batch, f, indent=2, ensure_ascii=False)
+
+    marker.write_text(str(total))
+    return sorted(output_dir.glob('products_batch_*.json'))
+
+
+class StageTimer:
+    """Accumulates wall time, optional traced peak memory and an optional cProfile per stage"""
+
+    def __init__(self, trace_memory=False, profile=False):
+        self.trace_memory = trace_memory
+        self.seconds = {stage: 0.0 for stage in STAGES}
+        self.peak_bytes = {stage: 0 for stage in STAGES}
+        self.profiles = {stage: cProfile.Profile() for stage in STAGES} if profile else None
+
+    def run(self, stage, func, *args):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        profile = self.profiles[stage] if self.profiles else None
+        if profile:
+            profile.enable()
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.seconds[stage] += time.perf_counter() - started
+            if profile:
+                profile.disable()
+            if self.trace_memory:
+                self.peak_bytes[stage] = max(self.peak_bytes[stage], tracemalloc.get_traced_memory()[1])
+
+
+def run_benchmark(files, importer, timer, target='sql', dsn=None, table='products_complete',
+                  batch_rows=10000, output=None):
+    """Run parse -> transform -> SQL/COPY generation -> (optional) DB load over files"""
+    mapper = importer.mapper
+    sink = open(output, 'w', encoding='utf-8') if output else open(os.devnull, 'w', encoding='utf-8')
+    counts = {'records': 0, 'rows': 0, 'bytes_generated': 0}
+
+    loader = None
+    if dsn:
+        from pg_loader import CopyLoader
+        loader = CopyLoader(dsn, table=table)
+        timer.run('load', loader.begin)
+
+    def parse(file_path):
+        return list(iter_json_products(file_path))
+
+    def transform(products):
+        return [mapper.transform(p) for p in products
+                if isinstance(p, dict) and p.get('kod_produktu') and p.get('nazwa_produktu')]
+
+    def generate(rows):
+        if target == 'copy':
+            text = ''.join(csv_line(row) for row in rows)
+        else:
+            text = ''.join(importer.generate_sql_insert(row) for row in rows)
+        sink.write(text)
+        return len(text)
+
+    pending = []
+    batch_number = 0
+    try:
+        for file_path in files:
+            products = timer.run('parse', parse, file_path)
+            rows = timer.run('transform', transform, products)
+            counts['bytes_generated'] += timer.run('generate', generate, rows)
+            counts['records'] += len(products)
+            counts['rows'] += len(rows)
+
+            if loader:
+                pending.extend(rows)
+                if len(pending) >= batch_rows:
+                    batch_number += 1
+                    timer.run('load', loader.write_batch, batch_number, pending)
+                    pending = []
+
+        if loader:
+            if pending:
+                timer.run('load', loader.write_batch, batch_number + 1, pending)
+            timer.run('load', loader.finish)
+    except Exception:
+        if loader:
+            loader.abort()
+        raise
+    finally:
+        sink.close()
+
+    return counts
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process (ru_maxrss is KiB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def format_bytes(value):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if value < 1024 or unit == 'GiB':
+            return f"{value:.1f} {unit}"
+        value /= 1024
+
+
+def print_report(size, counts, timer, wall_seconds):
+    print(f"\n📊 {size} products ({counts['rows']} rows, {format_bytes(counts['bytes_generated'])} generated)")
+    print(f"{'stage':<10} {'seconds':>9} {'records/s':>12} {'peak traced':>13}")
+    for stage in STAGES:
+        seconds = timer.seconds[stage]
+        if seconds == 0:
+            continue
+        rate = counts['records'] / seconds
+        peak = format_bytes(timer.peak_bytes[stage]) if timer.trace_memory else '-'
+        print(f"{stage:<10} {seconds:>9.3f} {rate:>12,.0f} {peak:>13}")
+    print(f"{'total':<10} {wall_seconds:>9.3f} {counts['records'] / wall_seconds:>12,.0f}")
+    print(f"Peak RSS: {format_bytes(peak_rss_bytes())}")
+
+
+def dump_profiles(timer, profile_dir, size, top=15):
+    profile_dir = Path(profile_dir)
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    for stage, profile in timer.profiles.items():
+        if timer.seconds[stage] == 0:
+            continue
+        path = profile_dir / f"{size}_{stage}.prof"
+        profile.dump_stats(str(path))
+        summary = io.StringIO()
+        pstats.Stats(profile, stream=summary).sort_stats('cumulative').print_stats(top)
+        print(f"\n🔬 {stage} profile ({path}):")
+        print(summary.getvalue().split('\n\n', 1)[-1].rstrip())
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the product import pipeline on synthetic scrape files",
+        epilog="Flame graphs: py-spy record -o import.svg -- python benchmark_import.py --sizes 100k"
+    )
+    parser.add_argument('--sizes', default='10k,100k,1m',
+                        help="Comma-separated dataset sizes (e.g. 10k,100k,1m)")
+    parser.add_argument('--data-dir', default=str(SCRIPTS_DIR / 'benchmark_data'),
+                        help="Where synthetic datasets are generated and cached")
+    parser.add_argument('--products-per-file', type=int, default=100,
+                        help="Products per synthetic file (extracted_products uses 100)")
+    parser.add_argument('--target', choices=('sql', 'copy'), default='sql',
+                        help="Generation stage: SQL INSERT text or COPY CSV")
+    parser.add_argument('--dsn', default=None,
+                        help="Also load into PostgreSQL with COPY (e.g. a local scratch database)")
+    parser.add_argument('--table', choices=('products_complete', 'products'), default='products_complete',
+                        help="Target table for the load stage")
+    parser.add_argument('--batch-rows', type=int, default=10000,
+                        help="Rows per COPY batch in the load stage")
+    parser.add_argument('--output', default=None,
+                        help="Keep the generated SQL/CSV in this file instead of discarding it")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Report peak Python heap per stage with tracemalloc (slower)")
+    parser.add_argument('--profile', default=None, metavar='DIR',
+                        help="Write a cProfile .prof file per stage to DIR")
+    parser.add_argument('--json', default=None, metavar='FILE',
+                        help="Also write the results as JSON")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    importer_module = load_importer_module()
+    results = []
+
+    if args.trace_memory:
+        tracemalloc.start()
+
+    for size_text in args.sizes.split(','):
+        size = parse_size(size_text)
+        files = generate_dataset(Path(args.data_dir) / size_text.strip().lower(), size, args.products_per_file)
+        importer = importer_module.ProductBatchImporter(Path(args.data_dir))
+        timer = StageTimer(trace_memory=args.trace_memory, profile=bool(args.profile))
+
+        started = time.perf_counter()
+        counts = run_benchmark(files, importer, timer, target=args.target, dsn=args.dsn, table=args.table,
+                               batch_rows=args.batch_rows, output=args.output)
+        wall_seconds = time.perf_counter() - started
+
+        print_report(size, counts, timer, wall_seconds)
+        if args.profile:
+            dump_profiles(timer, args.profile, size_text.strip().lower())
+
+        results.append({
+            'size': size,
+            'records': counts['records'],
+            'rows': counts['rows'],
+            'wall_seconds': wall_seconds,
+            'stages': {
+                stage: {
+                    'seconds': timer.seconds[stage],
+                    'records_per_second': counts['records'] / timer.seconds[stage] if timer.seconds[stage] else None,
+                    'peak_traced_bytes': timer.peak_bytes[stage] if args.trace_memory else None
+                }
+                for stage in STAGES
+            },
+            'peak_rss_bytes': peak_rss_bytes()
+        })
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'target': args.target, 'results': results}, f, indent=2)
+        print(f"\n📄 Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Compact, memory-mappable product catalog index built from importer output
+Exact lookup by product_code and top-k fuzzy trigram search on product names
+"""
+
+import argparse
+import heapq
+import json
+import mmap
+import struct
+import sys
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import chain
+from pathlib import Path
+
+MAGIC = b'SPSCIDX1'
+ALIGNMENT = 8
+
+# Fields kept per product, in record order
+RECORD_FIELDS = (
+    'product_code',
+    'product_name',
+    'unofficial_product_name',
+    'selling_unit',
+    'base_unit_for_pricing',
+    'selling_price_per_unit',
+    'retail_price_per_unit',
+)
+NAME_FIELDS = ('product_name', 'unofficial_product_name')
+
+# Words marking the next token as a product code ("kod 2000", "symbol: 2000")
+CODE_MARKERS = {'kod', 'symbol', 'indeks', 'index', 'art', 'code', 'sku'}
+# A number next to one of these is a dimension, quantity or amount, not a product code
+UNIT_WORDS = {'mm', 'cm', 'm', 'm2', 'm²', 'mb', 'szt', 'kpl', 'kg', 'g', 'l', 'x', '×', 'zł', 'pln'}
+
+POLISH_FOLD = str.maketrans('ąćęłńóśźżĄĆĘŁŃÓŚŹŻ', 'acelnoszzACELNOSZZ')
+
+
+def fold_text(text):
+    """Lowercase, strip Polish diacritics and reduce punctuation to single spaces"""
+    if not text:
+        return ''
+    folded = str(text).translate(POLISH_FOLD).lower()
+    return ' '.join(''.join(c if c.isalnum() else ' ' for c in folded).split())
+
+
+def trigrams(text):
+    """pg_trgm style trigram keys of a text: each word padded as '  word '"""
+    keys = set()
+    for word in fold_text(text).split():
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            keys.add(zlib.crc32(padded[i:i + 3].encode('utf-8')))
+    return keys
+
+
+def code_hash(code):
+    return zlib.crc32(str(code).encode('utf-8'))
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def build_index(rows, output_path):
+    """Write an index file for rows (dicts with RECORD_FIELDS); returns product count.
+
+    Later rows win for duplicate product codes, like the importer's upserts.
+    """
+    latest = {}
+    for row in rows:
+        code = row.get('product_code')
+        if code:
+            latest[str(code)] = row
+
+    records = array('Q', [0])
+    blob = bytearray()
+    record_gram_offsets = array('Q', [0])
+    record_grams = array('I')
+    postings_by_gram = {}
+
+    for record_id, (code, row) in enumerate(latest.items()):
+        values = [row.get(field) for field in RECORD_FIELDS]
+        values[0] = code
+        blob += json.dumps(values, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        records.append(len(blob))
+
+        grams = set()
+        for field in NAME_FIELDS:
+            grams |= trigrams(row.get(field))
+        record_grams.extend(grams)
+        record_gram_offsets.append(len(record_grams))
+        for gram in grams:
+            postings_by_gram.setdefault(gram, []).append(record_id)
+
+    count = len(latest)
+
+    # Open-addressing hash table on product_code: slot holds record_id + 1 (0 = empty)
+    slots = 1
+    while slots < count * 2:
+        slots *= 2
+    code_slots = array('I', bytes(4 * slots))
+    for record_id, code in enumerate(latest):
+        slot = code_hash(code) & (slots - 1)
+        while code_slots[slot]:
+            slot = (slot + 1) & (slots - 1)
+        code_slots[slot] = record_id + 1
+
+    gram_keys = array('I', sorted(postings_by_gram))
+    gram_offsets = array('I', [0])
+    postings = array('I')
+    for gram in gram_keys:
+        postings.extend(postings_by_gram[gram])
+        gram_offsets.append(len(postings))
+
+    sections = [
+        ('record_offsets', 'Q', records.tobytes()),
+        ('records', 'B', bytes(blob)),
+        ('record_gram_offsets', 'Q', record_gram_offsets.tobytes()),
+        ('record_grams', 'I', record_grams.tobytes()),
+        ('code_slots', 'I', code_slots.tobytes()),
+        ('gram_keys', 'I', gram_keys.tobytes()),
+        ('gram_offsets', 'I', gram_offsets.tobytes()),
+        ('postings', 'I', postings.tobytes()),
+    ]
+
+    # Header: magic, uint32 header length, JSON table of contents, aligned sections
+    toc = {'count': count, 'fields': list(RECORD_FIELDS), 'sections': {}}
+    header_size = len(MAGIC) + 4 + 4096
+    offset = _align(header_size)
+    for name, typecode, data in sections:
+        toc['sections'][name] = [offset, len(data), typecode]
+        offset = _align(offset + len(data))
+    header = json.dumps(toc).encode('utf-8')
+    if len(header) > 4096:
+        raise ValueError("Catalog index header too large")
+
+    output_path = Path(output_path)
+    tmp_path = output_path.with_suffix(output_path.suffix + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(header)) + header)
+        for name, typecode, data in sections:
+            f.seek(toc['sections'][name][0])
+            f.write(data)
+        f.truncate(offset)
+    tmp_path.replace(output_path)
+    return count
+
+
+def code_tokens(text):
+    """Tokens of text that may stand for a product code.
+
+    Codes are short numbers that also occur as dimensions ("2000 mm") or
+    quantities, so a token counts only when it is marked ("kod 2000",
+    "#2000") or stands alone: not followed by a unit and not the second
+    number of "60 x 2000".
+    """
+    tokens = str(text or '').split()
+    for position, token in enumerate(tokens):
+        previous = tokens[position - 1].strip('.:').lower() if position else ''
+        following = tokens[position + 1].strip(',.;:').lower() if position + 1 < len(tokens) else ''
+        marked = token.startswith('#') or previous in CODE_MARKERS
+        if marked or (following not in UNIT_WORDS and previous not in ('x', '×')):
+            yield token.lstrip('#').strip(',.;:')
+
+
+class CatalogIndex:
+    """Read-only view of an index file; all arrays are memoryviews over one mmap.
+
+    Opening is O(1) regardless of catalog size and several processes mapping the
+    same file share its pages.
+    """
+
+    # Trigrams found in more than this share of products don't generate candidates
+    COMMON_GRAM_RATIO = 0.05
+    # Candidates scored exactly per query
+    CANDIDATE_LIMIT = 64
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.file = open(self.path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"Not a catalog index: {self.path}")
+        header_length = struct.unpack_from('<I', self.map, len(MAGIC))[0]
+        start = len(MAGIC) + 4
+        toc = json.loads(self.map[start:start + header_length])
+
+        self.count = toc['count']
+        self.fields = tuple(toc['fields'])
+        view = memoryview(self.map)
+        self.sections = {}
+        for name, (offset, length, typecode) in toc['sections'].items():
+            section = view[offset:offset + length]
+            self.sections[name] = section.cast(typecode) if typecode != 'B' else section
+        self.record_offsets = self.sections['record_offsets']
+        self.records = self.sections['records']
+        self.record_gram_offsets = self.sections['record_gram_offsets']
+        self.record_grams = self.sections['record_grams']
+        self.code_slots = self.sections['code_slots']
+        self.gram_keys = self.sections['gram_keys']
+        self.gram_offsets = self.sections['gram_offsets']
+        self.postings = self.sections['postings']
+        self.common_limit = max(32, int(self.count * self.COMMON_GRAM_RATIO))
+
+    def __len__(self):
+        return self.count
+
+    def record(self, record_id):
+        """Product dict for a record id"""
+        start, end = self.record_offsets[record_id], self.record_offsets[record_id + 1]
+        return dict(zip(self.fields, json.loads(bytes(self.records[start:end]))))
+
+    def get(self, product_code):
+        """Exact lookup by product_code, or None"""
+        code = str(product_code)
+        mask = len(self.code_slots) - 1
+        slot = code_hash(code) & mask
+        while True:
+            entry = self.code_slots[slot]
+            if not entry:
+                return None
+            product = self.record(entry - 1)
+            if product['product_code'] == code:
+                return product
+            slot = (slot + 1) & mask
+
+    def postings_for(self, gram):
+        position = bisect_left(self.gram_keys, gram)
+        if position == len(self.gram_keys) or self.gram_keys[position] != gram:
+            return ()
+        return self.postings[self.gram_offsets[position]:self.gram_offsets[position + 1]]
+
+    def search(self, text, k=5, min_score=0.0):
+        """Top-k products by trigram similarity to text: [(score, product), ...].
+
+        Score is the Dice coefficient of query and record trigram sets, so 1.0
+        means the same trigrams; a product code in the text (see code_tokens)
+        scores 1.0.
+        """
+        results = []
+        seen = set()
+        for token in code_tokens(text):
+            product = self.get(token)
+            if product is not None and product['product_code'] not in seen:
+                seen.add(product['product_code'])
+                results.append((1.0, product))
+
+        query = trigrams(text)
+        if query:
+            # Candidates come from the selective trigrams (counted in C by Counter);
+            # only the best of them are scored exactly against their own trigrams
+            postings = [p for p in (self.postings_for(gram) for gram in query) if len(p)]
+            selective = [p for p in postings if len(p) <= self.common_limit] or postings
+            hits = Counter(chain.from_iterable(selective))
+            candidates = heapq.nlargest(max(self.CANDIDATE_LIMIT, k * 4), hits, key=hits.__getitem__)
+
+            scored = []
+            for record_id in candidates:
+                start, end = self.record_gram_offsets[record_id], self.record_gram_offsets[record_id + 1]
+                shared = len(query.intersection(self.record_grams[start:end]))
+                scored.append((2.0 * shared / (len(query) + end - start), record_id))
+
+            for score, record_id in heapq.nlargest(k + len(results), scored):
+                if score < min_score:
+                    break
+                product = self.record(record_id)
+                if product['product_code'] not in seen:
+                    seen.add(product['product_code'])
+                    results.append((round(score, 4), product))
+
+        return results[:k]
+
+    def search_many(self, texts, k=5, min_score=0.0):
+        """search() for a batch of texts, e.g. all item lines of one invoice"""
+        return [self.search(text, k=k, min_score=min_score) for text in texts]
+
+    def close(self):
+        for section in self.sections.values():
+            section.release()
+        self.sections = {}
+        self.record_offsets = self.records = self.record_gram_offsets = self.record_grams = None
+        self.code_slots = self.gram_keys = self.gram_offsets = self.postings = None
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_source_rows(path):
+    """Rows from importer output: a Parquet/Arrow/NDJSON file or a directory of scrape files"""
+    path = Path(path)
+    if path.is_dir():
+        from field_mapper import FieldMapper
+        from json_stream import iter_json_products
+        mapper = FieldMapper(lambda data: data.get('jednostka_sprzedażowa', 'szt'))
+        for file_path in sorted(path.glob('*.json')) + sorted(path.glob('*.ndjson')):
+            for product in iter_json_products(file_path):
+                if isinstance(product, dict) and product.get('kod_produktu') and product.get('nazwa_produktu'):
+                    yield mapper.transform(product)
+        return
+
+    from columnar_writer import iter_columnar_rows
+    yield from iter_columnar_rows(path)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the product catalog index")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="Build an index from importer output")
+    build.add_argument('source', help="products_import.parquet/.arrow/.ndjson or a scrape JSON directory")
+    build.add_argument('output', nargs='?', default=str(Path(__file__).parent / 'catalog.idx'),
+                       help="Index file to write (default: scripts/catalog.idx)")
+
+    query = commands.add_parser('query', help="Fuzzy search an index")
+    query.add_argument('index', help="Index file")
+    query.add_argument('text', nargs='+', help="Product code or (OCR) product name")
+    query.add_argument('-k', type=int, default=5, help="Number of matches")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+
+    if args.command == 'build':
+        started = time.perf_counter()
+        count = build_index(iter_source_rows(args.source), args.output)
+        size = Path(args.output).stat().st_size
+        print(f"✅ Indexed {count} products into {args.output} ({size / 1024:.0f} KiB) "
+              f"in {time.perf_counter() - started:.2f}s")
+        return
+
+    with CatalogIndex(args.index) as index:
+        text = ' '.join(args.text)
+        started = time.perf_counter()
+        matches = index.search(text, k=args.k)
+        elapsed = (time.perf_counter() - started) * 1e6
+        print(f"🔎 {len(matches)} matches for '{text}' in {elapsed:.0f} µs")
+        for score, product in matches:
+            print(f"  {score:.3f}  {product['product_code']:<12} {product['product_name']}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Typed columnar intermediate output for ProductBatchImporter
+Writes Parquet or Arrow IPC row groups while streaming (NDJSON when pyarrow is missing)
+"""
+
+import json
+from pathlib import Path
+
+from pg_loader import PRODUCT_COLUMNS, COLUMN_TYPES
+
+COLUMNAR_FORMATS = ('parquet', 'arrow', 'ndjson')
+
+
+def load_pyarrow():
+    """Return (pyarrow, pyarrow.parquet) or None if pyarrow is not installed"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow, pyarrow.parquet
+
+
+def arrow_schema(pa, table='products_complete'):
+    """Arrow schema matching the target table's columns"""
+    type_map = {
+        'numeric': pa.float64(),
+        'boolean': pa.bool_(),
+        'jsonb': pa.string(),
+    }
+    fields = [pa.field(column, type_map.get(COLUMN_TYPES.get(column), pa.string())) for column in PRODUCT_COLUMNS]
+    return pa.schema(fields, metadata={b'source': b'batch-import.py', b'table': table.encode('utf-8')})
+
+
+class ColumnarWriter:
+    """Importer writer producing one row group (record batch) per flushed batch"""
+
+    def __init__(self, output_file, output_format='parquet', compression='zstd', table='products_complete'):
+        if output_format not in COLUMNAR_FORMATS:
+            raise ValueError(f"Unsupported columnar format: {output_format}")
+
+        arrow = load_pyarrow() if output_format != 'ndjson' else None
+        if output_format != 'ndjson' and arrow is None:
+            print("⚠️  pyarrow not installed, falling back to NDJSON output")
+            output_format = 'ndjson'
+            output_file = Path(output_file).with_suffix('.ndjson')
+
+        self.output_file = Path(output_file)
+        self.output_format = output_format
+        self.compression = compression
+        self.label = f"{output_format.upper()} EXPORT"
+        self.pa, self.pq = arrow if arrow else (None, None)
+        self.schema = arrow_schema(self.pa, table) if self.pa else None
+        self.writer = None
+        self.rows_written = 0
+
+    def begin(self):
+        if self.output_format == 'parquet':
+            self.writer = self.pq.ParquetWriter(str(self.output_file), self.schema, compression=self.compression)
+        elif self.output_format == 'arrow':
+            self.sink = self.pa.OSFile(str(self.output_file), 'wb')
+            self.writer = self.pa.ipc.new_file(self.sink, self.schema)
+        else:
+            self.writer = open(self.output_file, 'w', encoding='utf-8')
+
+    def write_batch(self, batch_number, rows):
+        if not rows:
+            return
+        if self.output_format == 'ndjson':
+            for row in rows:
+                self.writer.write(json.dumps({c: row[c] for c in PRODUCT_COLUMNS}, ensure_ascii=False) + '\n')
+        else:
+            columns = [self.pa.array([row[c] for row in rows], type=field.type)
+                       for c, field in zip(PRODUCT_COLUMNS, self.schema)]
+            batch = self.pa.record_batch(columns, schema=self.schema)
+            if self.output_format == 'parquet':
+                self.writer.write_batch(batch)
+            else:
+                self.writer.write(batch)
+        self.rows_written += len(rows)
+
+    def finish(self, import_stats=None):
+        self.close()
+        return f"{self.output_file} ({self.rows_written} rows, {self.output_format})"
+
+    def abort(self):
+        self.close()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if self.output_format == 'arrow' and getattr(self, 'sink', None) is not None:
+            self.sink.close()
+            self.sink = None
+
+
+def iter_columnar_rows(path, batch_size=10000):
+    """Read product rows back from a Parquet, Arrow IPC or NDJSON file.
+
+    Arrow IPC files are memory-mapped, so columns are read without copying.
+    """
+    path = Path(path)
+    if path.suffix.lower() in ('.ndjson', '.jsonl'):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+
+    arrow = load_pyarrow()
+    if arrow is None:
+        raise RuntimeError("pyarrow is required to read Parquet/Arrow files: pip install -r scripts/requirements.txt")
+    pa, pq = arrow
+
+    if path.suffix.lower() == '.parquet':
+        for batch in pq.ParquetFile(str(path)).iter_batches(batch_size=batch_size):
+            yield from batch.to_pylist()
+        return
+
+    with pa.memory_map(str(path), 'r') as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            yield from reader.get_batch(i).to_pylist()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Precompiled field mapping for scraped product records
+Learns the key layout of each distinct input key-set once and reuses the plan
+"""
+
+import json
+
+# Output columns in the order produced by transform_to_exact_columns
+ROW_TEMPLATE = {
+    'product_code': None,
+    'product_name': None,
+    'measure_unit': None,
+    'base_unit_for_pricing': None,
+    'selling_unit': None,
+    'measurement_units_per_selling_unit': None,
+    'unofficial_product_name': None,
+    'type_of_finish': None,
+    'surface': None,
+    'bevel': None,
+    'thickness_mm': None,
+    'width_mm': None,
+    'length_mm': None,
+    'package_m2': None,
+    'additional_item_description': None,
+    'retail_price_per_unit': None,
+    'selling_price_per_unit': None,
+    'purchase_price_per_unit': None,
+    'potential_profit': None,
+    'installation_allowance': 0.0,
+    'currency': 'PLN',
+    'status': 'active',
+    'is_active': True,
+    'original_scraped_data': None,
+}
+
+SELLING_UNIT_KEY = 'jednostka_sprzedażowa'
+
+STRING_FIELDS = (
+    ('product_code', 'kod_produktu'),
+    ('unofficial_product_name', 'nieoficjalna_nazwa_produktu'),
+    ('type_of_finish', 'rodzaj_wykończenia'),
+    ('surface', 'powierzchnia'),
+    ('bevel', 'fazowanie'),
+    ('additional_item_description', 'dodatkowy_opis_przedmiotu'),
+)
+
+DECIMAL_FIELDS = (
+    ('thickness_mm', 'grubość_[mm]'),
+    ('width_mm', 'szerokość_[mm]'),
+    ('length_mm', 'długość_[mm]'),
+    ('package_m2', 'paczka_[m²]'),
+)
+
+# Price columns and their alternative source keys, in priority order
+PRICE_FIELDS = tuple(
+    (column, tuple(f"{prefix}_1{unit}_[zł]" for unit in ('mb', 'm²', 'szt')))
+    for column, prefix in (
+        ('retail_price_per_unit', 'cena_detaliczna_netto'),
+        ('selling_price_per_unit', 'cena_sprzedaży_netto'),
+        ('purchase_price_per_unit', 'cena_zakupu_netto'),
+        ('potential_profit', 'potencjalny_zysk'),
+    )
+)
+
+
+def to_decimal(value):
+    """Same result as ProductBatchImporter.clean_decimal, without the replace() on clean input"""
+    if not value:
+        return None
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            value = value.replace(',', '.').strip()
+            try:
+                return float(value)
+            except ValueError:
+                return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(',', '.').strip())
+    except (ValueError, TypeError):
+        return None
+
+
+def to_string(value):
+    """Same result as ProductBatchImporter.clean_string"""
+    if not value:
+        return None
+    return str(value)
+
+
+def pricing_unit_of_field(key):
+    """Pricing unit encoded in a price field name, or None"""
+    if 'cena_' not in key or '[zł]' not in key:
+        return None
+    if '1mb' in key:
+        return 'mb'
+    if '1m²' in key or '1m2' in key:
+        return 'm²'
+    if '1szt' in key:
+        return 'szt'
+    return None
+
+
+class FieldMapper:
+    """Schema-driven transform equivalent to transform_to_exact_columns.
+
+    The first record of every distinct key-set compiles an extraction plan
+    (which source key feeds which column, with which converter); later records
+    with the same shape skip all key scanning and alternative-key probing.
+    """
+
+    def __init__(self, fallback_pricing_unit):
+        # Used when one key-set carries price fields for several units, where the
+        # answer depends on key order and cannot be cached per key-set
+        self.fallback_pricing_unit = fallback_pricing_unit
+        self.plans = {}
+
+    def transform(self, scraped_data):
+        plan = self.plans.get(frozenset(scraped_data))
+        if plan is None:
+            plan = self.compile(scraped_data)
+        return plan(scraped_data)
+
+    def compile(self, sample):
+        keys = frozenset(sample)
+        has_selling_unit = SELLING_UNIT_KEY in keys
+        has_name = 'nazwa_produktu' in keys
+        has_selling_length = 'długość_sprzedażowa_[mb]' in keys
+        strings = tuple((column, key) for column, key in STRING_FIELDS if key in keys)
+        decimals = tuple((column, key) for column, key in DECIMAL_FIELDS if key in keys)
+        prices = tuple(
+            (column, tuple(key for key in candidates if key in keys))
+            for column, candidates in PRICE_FIELDS
+        )
+        prices = tuple((column, present) for column, present in prices if present)
+
+        units = {pricing_unit_of_field(key) for key in sample} - {None}
+        static_unit = units.pop() if len(units) == 1 else None
+        dynamic_unit = len(units) > 1
+        fallback_pricing_unit = self.fallback_pricing_unit
+        template = ROW_TEMPLATE
+        dumps = json.dumps
+
+        def apply(data):
+            row = template.copy()
+            selling_unit = data[SELLING_UNIT_KEY] if has_selling_unit else 'szt'
+            if dynamic_unit:
+                pricing_unit = fallback_pricing_unit(data)
+            else:
+                pricing_unit = static_unit or selling_unit
+
+            for column, key in strings:
+                value = data[key]
+                row[column] = str(value) if value else None
+            row['product_name'] = to_string(data['nazwa_produktu'] if has_name else 'Unknown Product')
+            row['measure_unit'] = selling_unit
+            row['base_unit_for_pricing'] = pricing_unit
+            row['selling_unit'] = selling_unit
+            row['measurement_units_per_selling_unit'] = (
+                to_decimal(data['długość_sprzedażowa_[mb]']) if has_selling_length else None
+            ) or 1.0
+            for column, key in decimals:
+                row[column] = to_decimal(data[key])
+            for column, present in prices:
+                value = None
+                for key in present:
+                    value = value or data[key]
+                row[column] = to_decimal(value)
+            row['original_scraped_data'] = dumps(data, ensure_ascii=False)
+            return row
+
+        self.plans[keys] = apply
+        return apply
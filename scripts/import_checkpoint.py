@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Checkpoint state and dead-letter output for resumable product imports
+"""
+
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+from import_manifest import file_sha256
+
+
+class ImportCheckpoint:
+    """JSON state file listing the source files whose rows are committed.
+
+    The file is rewritten atomically after every committed batch, so a crash
+    leaves either the previous or the new checkpoint on disk.
+    """
+
+    def __init__(self, state_path, mode, resume=False):
+        self.state_path = Path(state_path)
+        self.mode = mode
+        self.state = None
+
+        if resume and self.state_path.exists():
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                previous = json.load(f)
+            if previous.get('status') == 'running' and previous.get('mode') == mode:
+                self.state = previous
+            elif previous.get('status') == 'running':
+                print(f"⚠️  Checkpoint was written by --mode {previous.get('mode')}, starting from scratch")
+
+        self.resumed = self.state is not None
+        if self.state is None:
+            self.state = {
+                'status': 'running',
+                'mode': mode,
+                'started_at': datetime.now().isoformat(),
+                'updated_at': None,
+                'completed_batches': 0,
+                'committed_rows': 0,
+                'completed_files': {}
+            }
+            self.save()
+
+    def save(self):
+        self.state['updated_at'] = datetime.now().isoformat()
+        tmp_path = self.state_path.with_suffix(self.state_path.suffix + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def filter_pending_files(self, json_files):
+        """Drop files completed by the interrupted run (same content hash)"""
+        if not self.resumed:
+            return json_files
+        completed = self.state['completed_files']
+        pending = []
+        for file_path in json_files:
+            digest = completed.get(str(Path(file_path).resolve()))
+            if digest is None or digest != file_sha256(file_path):
+                pending.append(file_path)
+        return pending
+
+    def record_batch(self, completed_files, committed_rows):
+        """Checkpoint after a batch was committed"""
+        for file_path in completed_files:
+            self.state['completed_files'][str(Path(file_path).resolve())] = file_sha256(file_path)
+        self.state['completed_batches'] += 1
+        self.state['committed_rows'] += committed_rows
+        self.save()
+
+    def mark_completed(self):
+        self.state['status'] = 'completed'
+        self.save()
+
+
+class DeadLetterWriter:
+    """Appends records that could not be transformed or loaded to an NDJSON file"""
+
+    def __init__(self, path, append=False):
+        self.path = Path(path)
+        self.append = append
+        self.count = 0
+        self.file = None
+
+    def write(self, stage, error, record=None, source_file=None):
+        if self.file is None:
+            self.file = open(self.path, 'a' if self.append else 'w', encoding='utf-8')
+        self.file.write(json.dumps({
+            'stage': stage,
+            'error': str(error),
+            'source_file': str(source_file) if source_file else None,
+            'record': record,
+            'failed_at': datetime.now().isoformat()
+        }, ensure_ascii=False, default=str) + '\n')
+        self.file.flush()
+        self.count += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
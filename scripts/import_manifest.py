@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Change-detection manifest for incremental product imports
+Remembers file fingerprints and per-product row hashes between runs (SQLite)
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+from collections import Counter
+from pathlib import Path
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """Content hash of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def row_hash(row):
+    """Stable hash of a transformed row (independent of dict ordering)"""
+    encoded = json.dumps(row, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+
+class ImportManifest:
+    """SQLite manifest of source files and product rows.
+
+    Every occurrence of a product is kept per (product_code, source_file), so
+    a code found in several files has one entry per file. The row that wins
+    is the one from the last file in path order, as in a full run. An
+    unchanged file that wins a code blocks rows for it from earlier files.
+    When the written row of a code disappears, the next file that still has
+    the code is re-read (fallback_files()).
+
+    Nothing is recorded while a run is in progress. Only rows reported by
+    mark_written() count as imported. A changed file whose rows were not all
+    written (load failures, validation rejects) keeps its old fingerprint,
+    so the next run processes it again. commit() applies the run for
+    loaders that commit to the database themselves. stage() writes the
+    result to a pending copy of the manifest instead, and confirm() makes
+    it current once the SQL script or export file has been loaded.
+    """
+
+    def __init__(self, manifest_path):
+        self.manifest_path = Path(manifest_path)
+        self.pending_path = pending_path(self.manifest_path)
+        self.conn = sqlite3.connect(str(self.manifest_path))
+        has_rows = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_rows'"
+        ).fetchone()
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT NOT NULL
+            );
+            -- Row last written to the database per product
+            CREATE TABLE IF NOT EXISTS products (
+                product_code TEXT PRIMARY KEY,
+                row_hash TEXT NOT NULL,
+                source_file TEXT NOT NULL
+            );
+            -- Every occurrence of a product in the source files
+            CREATE TABLE IF NOT EXISTS product_rows (
+                product_code TEXT NOT NULL,
+                source_file TEXT NOT NULL,
+                row_hash TEXT NOT NULL,
+                PRIMARY KEY (product_code, source_file)
+            );
+        """)
+        if not has_rows:
+            # Manifests from before product_rows: the written rows are the only known occurrences
+            self.conn.execute("INSERT INTO product_rows SELECT product_code, source_file, row_hash FROM products")
+        self.conn.commit()
+        self.reset()
+
+    def reset(self):
+        """Forget everything recorded by the current run"""
+        self.file_updates = {}
+        self.processed_files = set()
+        self.seen_rows = {}
+        self.emitted = {}
+        self.emitted_codes = set()
+        self.unwritten = Counter()
+        self.written = {}
+        self.stats = {'skipped_files': 0, 'unchanged_records': 0, 'changed_records': 0,
+                      'shadowed_records': 0, 'fallback_records': 0, 'deleted_records': 0}
+
+    def file_unchanged(self, file_path):
+        """True if the file matches the manifest (mtime/size first, then content hash)"""
+        key = str(Path(file_path).resolve())
+        st = Path(file_path).stat()
+        known = self.conn.execute("SELECT size, mtime_ns, sha256 FROM files WHERE path = ?", (key,)).fetchone()
+
+        if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+            return True
+
+        digest = file_sha256(file_path)
+        self.file_updates[key] = (st.st_size, st.st_mtime_ns, digest)
+        # Touched but identical content (e.g. re-downloaded scrape)
+        return bool(known and known[2] == digest)
+
+    def filter_changed_files(self, json_files):
+        """Drop files whose content is unchanged since the last committed run"""
+        changed = []
+        for file_path in json_files:
+            if self.file_unchanged(file_path):
+                self.stats['skipped_files'] += 1
+            else:
+                changed.append(file_path)
+                self.processed_files.add(str(Path(file_path).resolve()))
+        return changed
+
+    def shadowed(self, code, source):
+        """True if an unchanged later file holds the code, so its row wins over source's"""
+        for (later,) in self.conn.execute(
+            "SELECT source_file FROM product_rows WHERE product_code = ? AND source_file > ?", (code, source)
+        ):
+            if later not in self.processed_files and Path(later).exists():
+                return True
+        return False
+
+    def emit(self, code, digest, source):
+        self.emitted.setdefault(code, []).append((digest, source))
+        self.emitted_codes.add(code)
+        self.unwritten[source] += 1
+
+    def filter_changed_rows(self, rows, source_file):
+        """Yield the rows of a processed file that change what the database holds"""
+        source = str(Path(source_file).resolve())
+        seen = self.seen_rows.setdefault(source, {})
+        for row in rows:
+            code = row['product_code']
+            digest = row_hash(row)
+            seen[code] = digest
+            if self.shadowed(code, source):
+                self.stats['shadowed_records'] += 1
+                continue
+            written = self.conn.execute(
+                "SELECT source_file, row_hash FROM products WHERE product_code = ?", (code,)
+            ).fetchone()
+            # A row emitted for the code earlier in this run has replaced the written one
+            if written == (source, digest) and code not in self.emitted_codes:
+                self.stats['unchanged_records'] += 1
+                continue
+            self.stats['changed_records'] += 1
+            self.emit(code, digest, source)
+            yield row
+
+    def fallback_files(self):
+        """{file: codes} of unchanged files to re-read for codes whose written row disappeared"""
+        fallbacks = {}
+        for code, source in self.conn.execute("SELECT product_code, source_file FROM products").fetchall():
+            if code in self.emitted_codes:
+                continue
+            if source in self.processed_files:
+                if code in self.seen_rows.get(source, {}):
+                    continue
+            elif Path(source).exists():
+                continue
+            for (other,) in self.conn.execute(
+                "SELECT source_file FROM product_rows WHERE product_code = ? ORDER BY source_file DESC", (code,)
+            ):
+                if other not in self.processed_files and Path(other).exists():
+                    fallbacks.setdefault(other, set()).add(code)
+                    break
+        return fallbacks
+
+    def filter_fallback_rows(self, rows, source_file, codes):
+        """Rows of a re-read unchanged file for the given codes (the last occurrence wins)"""
+        source = str(Path(source_file).resolve())
+        latest = {row['product_code']: row for row in rows if row['product_code'] in codes}
+        for code, row in latest.items():
+            self.stats['fallback_records'] += 1
+            self.emit(code, row_hash(row), source)
+            yield row
+
+    def mark_written(self, rows, collapsed=False):
+        """Record rows the writer has written (or committed).
+
+        With ``collapsed`` (deduplicated runs) a written row stands for every
+        row emitted for its product code.
+        """
+        for row in rows:
+            code = row['product_code']
+            digest = row_hash(row)
+            entries = self.emitted.get(code)
+            if not entries:
+                continue
+            if collapsed:
+                matched, remaining = entries, []
+            else:
+                position = next((i for i, (emitted, _) in enumerate(entries) if emitted == digest), None)
+                if position is None:
+                    continue
+                matched, remaining = [entries[position]], entries[:position] + entries[position + 1:]
+            for _, source in matched:
+                self.unwritten[source] -= 1
+            if remaining:
+                self.emitted[code] = remaining
+            else:
+                del self.emitted[code]
+            self.written[code] = (matched[-1][1], digest)
+
+    def apply(self, conn):
+        """Write this run's outcome into a manifest connection; returns product codes reported as deleted"""
+        confirmed = {source for source in self.processed_files if self.unwritten[source] <= 0}
+        for path, (size, mtime_ns, digest) in self.file_updates.items():
+            if path in confirmed or path not in self.processed_files:
+                conn.execute(
+                    "INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                    (path, size, mtime_ns, digest)
+                )
+        for source in confirmed:
+            conn.execute("DELETE FROM product_rows WHERE source_file = ?", (source,))
+            conn.executemany(
+                "INSERT INTO product_rows (product_code, source_file, row_hash) VALUES (?, ?, ?)",
+                ((code, source, digest) for code, digest in self.seen_rows.get(source, {}).items())
+            )
+        for (path,) in conn.execute("SELECT DISTINCT source_file FROM product_rows").fetchall():
+            if not Path(path).exists():
+                conn.execute("DELETE FROM product_rows WHERE source_file = ?", (path,))
+        for (path,) in conn.execute("SELECT path FROM files").fetchall():
+            if not Path(path).exists():
+                conn.execute("DELETE FROM files WHERE path = ?", (path,))
+        conn.executemany(
+            "INSERT OR REPLACE INTO products (product_code, row_hash, source_file) VALUES (?, ?, ?)",
+            ((code, digest, source) for code, (source, digest) in self.written.items())
+        )
+
+        # Codes still in a file that has to be processed again are not gone
+        pending = set(self.written)
+        for source in self.processed_files - confirmed:
+            pending.update(self.seen_rows.get(source, {}))
+        deleted = [
+            code for (code,) in conn.execute(
+                "SELECT product_code FROM products "
+                "WHERE product_code NOT IN (SELECT product_code FROM product_rows) ORDER BY product_code"
+            ).fetchall()
+            if code not in pending
+        ]
+        conn.executemany("DELETE FROM products WHERE product_code = ?", ((code,) for code in deleted))
+        conn.commit()
+        self.stats['deleted_records'] = len(deleted)
+        return deleted
+
+    def commit(self):
+        """Persist this run (the loader has committed its rows); returns product codes reported as deleted"""
+        deleted = self.apply(self.conn)
+        # A run staged earlier and never confirmed is superseded
+        if self.pending_path.exists():
+            self.pending_path.unlink()
+        return deleted
+
+    def stage(self):
+        """Write this run to the pending manifest until its output is loaded; returns deleted codes"""
+        tmp_path = self.pending_path.with_name(self.pending_path.name + '.tmp')
+        pending = sqlite3.connect(str(tmp_path))
+        try:
+            self.conn.backup(pending)
+            deleted = self.apply(pending)
+        finally:
+            pending.close()
+        os.replace(tmp_path, self.pending_path)
+        return deleted
+
+    @staticmethod
+    def confirm(manifest_path):
+        """Make the staged run current; False if there is none"""
+        staged = pending_path(manifest_path)
+        if not staged.exists():
+            return False
+        os.replace(staged, manifest_path)
+        return True
+
+    def rollback(self):
+        self.reset()
+
+    def close(self):
+        self.conn.close()
+
+
+def pending_path(manifest_path):
+    """Staged manifest of a run whose output has not been loaded yet"""
+    manifest_path = Path(manifest_path)
+    return manifest_path.with_name(manifest_path.name + '.pending')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental import manifest")
+    commands = parser.add_subparsers(dest='command', required=True)
+    confirm = commands.add_parser(
+        'confirm', help="Mark the staged run as imported once mass_import.sql (or the export file) is loaded"
+    )
+    confirm.add_argument('--manifest', default=str(Path(__file__).parent / 'import_manifest.sqlite'),
+                         help="Manifest file used by batch-import.py --incremental")
+    args = parser.parse_args()
+
+    if not ImportManifest.confirm(args.manifest):
+        print(f"❌ No staged run for {args.manifest}")
+        sys.exit(1)
+    print(f"✅ Staged run confirmed, {args.manifest} updated")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Incremental reader for scraped product JSON files
+Yields products one by one from a list, a mergedData wrapper, a bare object or NDJSON
+"""
+
+import json
+from pathlib import Path
+
+NDJSON_SUFFIXES = ('.ndjson', '.jsonl')
+WHITESPACE = ' \t\r\n'
+
+_decoder = json.JSONDecoder()
+
+
+class _StreamReader:
+    """Chunked text buffer with JSON value decoding at the current position"""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Drop consumed text and append the next chunk"""
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self):
+        """Next non-whitespace character ('' at end of input)"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos] if self.pos < len(self.buf) else ''
+            self.fill()
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' but found '{found or 'end of file'}'")
+        self.pos += 1
+
+    def decode_value(self):
+        """Decode one JSON value, reading more input until it is complete"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+                # A value ending exactly at the buffer end may be a truncated number
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    def iter_array(self):
+        """Yield the items of the array starting at the current position"""
+        self.expect('[')
+        while True:
+            char = self.peek()
+            if char == ']':
+                self.pos += 1
+                return
+            if char == ',':
+                self.pos += 1
+                continue
+            if char == '':
+                raise ValueError("Unterminated JSON array")
+            yield self.decode_value()
+
+
+def _iter_document(reader):
+    char = reader.peek()
+    if char == '[':
+        yield from reader.iter_array()
+        return
+    if char != '{':
+        raise ValueError(f"Unsupported JSON document starting with '{char or 'end of file'}'")
+
+    # Object: either a {"mergedData": ...} wrapper or a single product
+    reader.pos += 1
+    product = {}
+    merged_found = False
+    while True:
+        char = reader.peek()
+        if char == '}':
+            reader.pos += 1
+            break
+        if char == ',':
+            reader.pos += 1
+            continue
+        if char == '':
+            raise ValueError("Unterminated JSON object")
+        key = reader.decode_value()
+        reader.expect(':')
+        if key == 'mergedData':
+            merged_found = True
+            if reader.peek() == '[':
+                yield from reader.iter_array()
+            else:
+                yield reader.decode_value()
+        else:
+            value = reader.decode_value()
+            if not merged_found:
+                product[key] = value
+
+    if not merged_found:
+        yield product
+
+
+def iter_json_products(file_path, chunk_size=64 * 1024):
+    """Yield products from a scrape file without loading the whole document"""
+    file_path = Path(file_path)
+    with open(file_path, 'r', encoding='utf-8') as f:
+        if file_path.suffix.lower() in NDJSON_SUFFIXES:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+            return
+
+        yield from _iter_document(_StreamReader(f, chunk_size))
@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+"""
+Client for ocr-service (sync and async)
+
+Keeps pooled keep-alive connections, caches the JWT until shortly before it
+expires, retries 429/503 (honouring Retry-After) and connection errors with
+exponential backoff, and submits many files concurrently under a limit:
+
+    tokens = TokenCache.from_secret(os.environ['JWT_SECRET'], {'sub': 'batch', 'tenant_id': 'acme'})
+    with OcrClient('http://localhost:8000', tokens) as client:
+        for path, result, error in client.ocr_many(paths, concurrency=8):
+            ...
+
+Per-page results can be streamed (ocr_stream) and long documents queued as
+jobs and polled (submit_job / wait_job).
+
+Usage: python ocr_client.py FILE... [--url URL] [--concurrency N] [--output results.ndjson]
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import random
+import asyncio
+import argparse
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+DEFAULT_URL = os.getenv('OCR_SERVICE_URL', 'http://localhost:8000')
+
+# Admission control (per-tenant limit) and a full queue; both send Retry-After
+RETRY_STATUSES = (429, 503)
+
+CONTENT_TYPES = {
+    '.pdf': 'application/pdf', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png',
+    '.bmp': 'image/bmp', '.tiff': 'image/tiff', '.tif': 'image/tiff',
+}
+
+
+def _httpx():
+    try:
+        import httpx
+    except ImportError:
+        raise RuntimeError("httpx is required for the OCR client: pip install -r scripts/requirements.txt")
+    return httpx
+
+
+class OcrServiceError(Exception):
+    """Error response from ocr-service (after retries)"""
+
+    def __init__(self, status_code, detail):
+        super().__init__(f"{status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+def token_expiry(token):
+    """exp claim of a JWT (unverified), or None"""
+    try:
+        payload = token.split('.')[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        return float(claims['exp']) if 'exp' in claims else None
+    except (IndexError, ValueError, TypeError, KeyError):
+        return None
+
+
+class TokenCache:
+    """
+    JWT for ocr-service, reused until ``refresh_margin`` seconds before its exp claim
+
+    ``fetch`` returns a new token (login, refresh or minting); a token rejected
+    with 401 is dropped and fetched again once.
+    """
+
+    def __init__(self, token=None, fetch=None, refresh_margin=60):
+        self.token = token
+        self.fetch = fetch
+        self.refresh_margin = refresh_margin
+        self.expires_at = token_expiry(token) if token else None
+        self.refreshes = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_secret(cls, secret, claims, ttl=3600, refresh_margin=60):
+        """Mint HS256 tokens locally (internal scripts that share JWT_SECRET with the service)"""
+        try:
+            import jwt
+        except ImportError:
+            raise RuntimeError("PyJWT is required to mint tokens: pip install PyJWT")
+
+        def mint():
+            now = int(time.time())
+            return jwt.encode(dict(claims, iat=now, exp=now + ttl), secret, algorithm='HS256')
+        return cls(fetch=mint, refresh_margin=refresh_margin)
+
+    @classmethod
+    def from_login(cls, gateway_url, email, password, refresh_margin=60):
+        """Log in through the API gateway (POST /auth/login) whenever a new token is needed"""
+        httpx = _httpx()
+
+        def login():
+            response = httpx.post(f"{gateway_url.rstrip('/')}/auth/login",
+                                  json={'email': email, 'password': password}, timeout=30)
+            if response.status_code >= 400:
+                raise OcrServiceError(response.status_code, f"Login failed: {response.text[:200]}")
+            return response.json()['access_token']
+        return cls(fetch=login, refresh_margin=refresh_margin)
+
+    def valid_token(self):
+        """Cached token if it is not about to expire, without fetching"""
+        token, expires_at = self.token, self.expires_at
+        if token and (expires_at is None or expires_at - time.time() > self.refresh_margin):
+            return token
+        return None
+
+    def get(self):
+        token = self.valid_token()
+        if token:
+            return token
+        with self._lock:
+            token = self.valid_token()
+            if token:
+                return token
+            if self.fetch is None:
+                if self.token:
+                    return self.token  # static token: let the service decide
+                raise RuntimeError("No JWT configured for the OCR client")
+            self.token = self.fetch()
+            self.expires_at = token_expiry(self.token)
+            self.refreshes += 1
+            return self.token
+
+    def invalidate(self, token):
+        """Forget a token the service rejected (unless it was already replaced)"""
+        with self._lock:
+            if self.token == token and self.fetch is not None:
+                self.token = None
+                self.expires_at = None
+
+
+def _tokens(tokens):
+    if tokens is None:
+        token = os.getenv('OCR_SERVICE_TOKEN')
+        return TokenCache(token) if token else None
+    return TokenCache(tokens) if isinstance(tokens, str) else tokens
+
+
+def _upload(file, filename=None):
+    """(filename, bytes, content type) of a path or raw bytes, read once so retries can resend it"""
+    if isinstance(file, (bytes, bytearray)):
+        if not filename:
+            raise ValueError("filename is required when uploading bytes")
+        data = bytes(file)
+    else:
+        path = Path(file)
+        filename = filename or path.name
+        data = path.read_bytes()
+    return filename, data, CONTENT_TYPES.get(Path(filename).suffix.lower(), 'application/octet-stream')
+
+
+def _error(response, body=None):
+    try:
+        detail = json.loads(body if body is not None else response.text).get('detail')
+    except (ValueError, AttributeError):
+        detail = None
+    return OcrServiceError(response.status_code, detail or response.reason_phrase)
+
+
+def _ocr_params(pages=None, classify=False, **params):
+    """Query parameters of /ocr and /ocr/jobs (pages: e.g. 'first', '1-3'; classify: skip non-invoices)"""
+    if pages:
+        params['pages'] = pages
+    if classify:
+        params['classify'] = 'true'
+    return params
+
+
+def _page_event(line):
+    """Parsed NDJSON line of a streamed /ocr response; raises on an error line"""
+    event = json.loads(line)
+    if event.get('type') == 'error':
+        raise OcrServiceError(event.get('status_code', 500), event.get('detail'))
+    return event
+
+
+class _RetryPolicy:
+    def __init__(self, max_retries=5, backoff=0.5, max_backoff=30.0):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def delay(self, attempt, response=None):
+        """Retry-After if the service sent one, else exponential backoff with full jitter"""
+        if response is not None:
+            try:
+                return min(float(response.headers['Retry-After']), self.max_backoff)
+            except (KeyError, ValueError):
+                pass
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+class OcrClient:
+    """Synchronous client; thread-safe, so one instance can serve a whole thread pool"""
+
+    def __init__(self, base_url=DEFAULT_URL, tokens=None, timeout=300.0, max_connections=16,
+                 max_retries=5, backoff=0.5, max_backoff=30.0):
+        httpx = _httpx()
+        self.httpx = httpx
+        self.tokens = _tokens(tokens)
+        self.retry = _RetryPolicy(max_retries, backoff, max_backoff)
+        self.retries = 0
+        self.http = httpx.Client(
+            base_url=base_url.rstrip('/'), timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.http.close()
+
+    def _send(self, method, path, stream=False, **kwargs):
+        """Send with auth and retries; returns a successful response (open if ``stream``)"""
+        refreshed = False
+        attempt = 0
+        while True:
+            token = self.tokens.get() if self.tokens else None
+            headers = {'Authorization': f"Bearer {token}"} if token else {}
+            request = self.http.build_request(method, path, headers=headers, **kwargs)
+            try:
+                response = self.http.send(request, stream=stream)
+            except self.httpx.TransportError:
+                if attempt >= self.retry.max_retries:
+                    raise
+                time.sleep(self.retry.delay(attempt))
+                attempt += 1
+                self.retries += 1
+                continue
+
+            if response.status_code < 400:
+                return response
+            body = response.read().decode('utf-8', 'replace')
+            response.close()
+            if response.status_code == 401 and token and not refreshed and self.tokens.fetch is not None:
+                self.tokens.invalidate(token)
+                refreshed = True
+                continue
+            if response.status_code in RETRY_STATUSES and attempt < self.retry.max_retries:
+                time.sleep(self.retry.delay(attempt, response))
+                attempt += 1
+                self.retries += 1
+                continue
+            raise _error(response, body)
+
+    def health(self):
+        return self._send('GET', '/health').json()
+
+    def ocr(self, file, filename=None, pages=None, classify=False):
+        """OCR a file (path or bytes) and return the /ocr response"""
+        return self._send('POST', '/ocr', params=_ocr_params(pages, classify),
+                          files={'file': _upload(file, filename)}).json()
+
+    def ocr_stream(self, file, filename=None, pages=None, classify=False):
+        """Yield page events as the service finishes them, then the {'type': 'done'} summary"""
+        response = self._send('POST', '/ocr', stream=True, params=_ocr_params(pages, classify, stream='true'),
+                              files={'file': _upload(file, filename)})
+        try:
+            for line in response.iter_lines():
+                if line.strip():
+                    yield _page_event(line)
+        finally:
+            response.close()
+
+    def submit_job(self, file, filename=None, pages=None, classify=False):
+        """Queue a file for OCR; returns {'job_id', 'status', 'page_count', ...}"""
+        return self._send('POST', '/ocr/jobs', params=_ocr_params(pages, classify),
+                          files={'file': _upload(file, filename)}).json()
+
+    def job(self, job_id):
+        return self._send('GET', f"/ocr/jobs/{job_id}").json()
+
+    def wait_job(self, job_id, poll_interval=1.0, max_poll_interval=10.0, timeout=None):
+        """Poll a job until it finishes; returns its /ocr response or raises OcrServiceError"""
+        deadline = time.monotonic() + timeout if timeout else None
+        while True:
+            job = self.job(job_id)
+            if job['status'] == 'done':
+                return job['result']
+            if job['status'] == 'failed':
+                raise OcrServiceError(job['error']['status_code'], job['error']['detail'])
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"OCR job {job_id} still {job['status']} after {timeout}s")
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 1.5, max_poll_interval)
+
+    def search(self, q, **params):
+        """Full-text search over the tenant's OCR results (GET /ocr/search)"""
+        return self._send('GET', '/ocr/search', params=dict(params, q=q)).json()
+
+    def ocr_many(self, files, concurrency=4, pages=None, classify=False):
+        """
+        OCR many files with at most ``concurrency`` requests in flight
+
+        Yields (file, result, error) in completion order; files are read only
+        when their request starts, so long lists do not sit in memory.
+        """
+        files = iter(files)
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            in_flight = {}
+
+            def fill():
+                while len(in_flight) < concurrency:
+                    file = next(files, None)
+                    if file is None:
+                        return
+                    in_flight[pool.submit(self.ocr, file, None, pages, classify)] = file
+
+            fill()
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file = in_flight.pop(future)
+                    error = future.exception()
+                    yield file, (future.result() if error is None else None), error
+                fill()
+
+
+class AsyncOcrClient:
+    """asyncio client with the same API (coroutines; ocr_stream and ocr_many are async iterators)"""
+
+    def __init__(self, base_url=DEFAULT_URL, tokens=None, timeout=300.0, max_connections=16,
+                 max_retries=5, backoff=0.5, max_backoff=30.0):
+        httpx = _httpx()
+        self.httpx = httpx
+        self.tokens = _tokens(tokens)
+        self.retry = _RetryPolicy(max_retries, backoff, max_backoff)
+        self.retries = 0
+        self.http = httpx.AsyncClient(
+            base_url=base_url.rstrip('/'), timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        await self.http.aclose()
+
+    async def _token(self):
+        if self.tokens is None:
+            return None
+        # Fetching (e.g. a login request) blocks, keep it off the event loop
+        return self.tokens.valid_token() or await asyncio.to_thread(self.tokens.get)
+
+    async def _send(self, method, path, stream=False, **kwargs):
+        refreshed = False
+        attempt = 0
+        while True:
+            token = await self._token()
+            headers = {'Authorization': f"Bearer {token}"} if token else {}
+            request = self.http.build_request(method, path, headers=headers, **kwargs)
+            try:
+                response = await self.http.send(request, stream=stream)
+            except self.httpx.TransportError:
+                if attempt >= self.retry.max_retries:
+                    raise
+                await asyncio.sleep(self.retry.delay(attempt))
+                attempt += 1
+                self.retries += 1
+                continue
+
+            if response.status_code < 400:
+                return response
+            body = (await response.aread()).decode('utf-8', 'replace')
+            await response.aclose()
+            if response.status_code == 401 and token and not refreshed and self.tokens.fetch is not None:
+                self.tokens.invalidate(token)
+                refreshed = True
+                continue
+            if response.status_code in RETRY_STATUSES and attempt < self.retry.max_retries:
+                await asyncio.sleep(self.retry.delay(attempt, response))
+                attempt += 1
+                self.retries += 1
+                continue
+            raise _error(response, body)
+
+    async def health(self):
+        return (await self._send('GET', '/health')).json()
+
+    async def ocr(self, file, filename=None, pages=None, classify=False):
+        upload = await asyncio.to_thread(_upload, file, filename)
+        return (await self._send('POST', '/ocr', params=_ocr_params(pages, classify), files={'file': upload})).json()
+
+    async def ocr_stream(self, file, filename=None, pages=None, classify=False):
+        upload = await asyncio.to_thread(_upload, file, filename)
+        response = await self._send('POST', '/ocr', stream=True, params=_ocr_params(pages, classify, stream='true'),
+                                    files={'file': upload})
+        try:
+            async for line in response.aiter_lines():
+                if line.strip():
+                    yield _page_event(line)
+        finally:
+            await response.aclose()
+
+    async def submit_job(self, file, filename=None, pages=None, classify=False):
+        upload = await asyncio.to_thread(_upload, file, filename)
+        return (await self._send('POST', '/ocr/jobs', params=_ocr_params(pages, classify), files={'file': upload})).json()
+
+    async def job(self, job_id):
+        return (await self._send('GET', f"/ocr/jobs/{job_id}")).json()
+
+    async def wait_job(self, job_id, poll_interval=1.0, max_poll_interval=10.0, timeout=None):
+        deadline = time.monotonic() + timeout if timeout else None
+        while True:
+            job = await self.job(job_id)
+            if job['status'] == 'done':
+                return job['result']
+            if job['status'] == 'failed':
+                raise OcrServiceError(job['error']['status_code'], job['error']['detail'])
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"OCR job {job_id} still {job['status']} after {timeout}s")
+            await asyncio.sleep(poll_interval)
+            poll_interval = min(poll_interval * 1.5, max_poll_interval)
+
+    async def search(self, q, **params):
+        return (await self._send('GET', '/ocr/search', params=dict(params, q=q))).json()
+
+    async def ocr_many(self, files, concurrency=4, pages=None, classify=False):
+        """Async iterator of (file, result, error) in completion order, at most ``concurrency`` in flight"""
+        files = iter(files)
+        in_flight = {}
+
+        def fill():
+            while len(in_flight) < concurrency:
+                file = next(files, None)
+                if file is None:
+                    return
+                in_flight[asyncio.ensure_future(self.ocr(file, None, pages, classify))] = file
+
+        fill()
+        try:
+            while in_flight:
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    file = in_flight.pop(task)
+                    error = task.exception()
+                    yield file, (task.result() if error is None else None), error
+                fill()
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR files through ocr-service")
+    parser.add_argument('files', nargs='+', type=Path, help="PDF or image files")
+    parser.add_argument('--url', default=DEFAULT_URL, help="ocr-service URL (default $OCR_SERVICE_URL)")
+    parser.add_argument('--concurrency', type=int, default=4, help="Requests in flight")
+    parser.add_argument('--output', type=Path, help="Write results as NDJSON (default: summary only)")
+    parser.add_argument('--pages', help="Pages to OCR, e.g. first, last, 1-3 (default: all)")
+    parser.add_argument('--classify', action='store_true', help="Skip documents that do not look like invoices")
+    parser.add_argument('--tenant', default=os.getenv('OCR_TENANT_ID', 'batch'),
+                        help="tenant_id claim when minting tokens from $JWT_SECRET")
+    args = parser.parse_args()
+
+    if os.getenv('OCR_SERVICE_TOKEN'):
+        tokens = TokenCache(os.environ['OCR_SERVICE_TOKEN'])
+    elif os.getenv('JWT_SECRET'):
+        tokens = TokenCache.from_secret(os.environ['JWT_SECRET'], {'sub': 'ocr-client', 'tenant_id': args.tenant})
+    else:
+        parser.error("set OCR_SERVICE_TOKEN or JWT_SECRET")
+
+    started = time.time()
+    ok = failed = pages = 0
+    output = open(args.output, 'w', encoding='utf-8') if args.output else None
+    try:
+        with OcrClient(args.url, tokens, max_connections=args.concurrency) as client:
+            for path, result, error in client.ocr_many(args.files, concurrency=args.concurrency,
+                                                         pages=args.pages, classify=args.classify):
+                if error is not None:
+                    failed += 1
+                    print(f"❌ {path}: {error}", file=sys.stderr)
+                    continue
+                ok += 1
+                pages += len(result['pages'])
+                if output:
+                    output.write(json.dumps(dict(result, source=str(path)), ensure_ascii=False) + '\n')
+            retries = client.retries
+    finally:
+        if output:
+            output.close()
+
+    elapsed = time.time() - started
+    print(f"✅ {ok} files ({pages} pages) in {elapsed:.1f}s, {failed} failed, {retries} retries, "
+          f"{pages / elapsed if elapsed else 0:.1f} pages/s")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
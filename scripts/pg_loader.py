@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Direct PostgreSQL loaders for ProductBatchImporter output
+Streams transformed product rows into PostgreSQL instead of generating mass_import.sql
+"""
+
+import io
+import os
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# Column order shared by every loader (same order as generate_sql_insert)
+PRODUCT_COLUMNS = (
+    'product_code', 'product_name', 'measure_unit', 'base_unit_for_pricing', 'selling_unit',
+    'measurement_units_per_selling_unit', 'unofficial_product_name', 'type_of_finish',
+    'surface', 'bevel', 'thickness_mm', 'width_mm', 'length_mm', 'package_m2',
+    'additional_item_description', 'retail_price_per_unit', 'selling_price_per_unit',
+    'purchase_price_per_unit', 'potential_profit', 'installation_allowance',
+    'currency', 'status', 'is_active', 'original_scraped_data'
+)
+
+# PostgreSQL array types used by the prepared batch upsert
+COLUMN_TYPES = {
+    'measurement_units_per_selling_unit': 'numeric',
+    'thickness_mm': 'numeric',
+    'width_mm': 'numeric',
+    'length_mm': 'numeric',
+    'package_m2': 'numeric',
+    'retail_price_per_unit': 'numeric',
+    'selling_price_per_unit': 'numeric',
+    'purchase_price_per_unit': 'numeric',
+    'potential_profit': 'numeric',
+    'installation_allowance': 'numeric',
+    'is_active': 'boolean',
+    'original_scraped_data': 'jsonb',
+}
+
+# SQLSTATEs worth retrying: serialization_failure, deadlock_detected
+RETRYABLE_PGCODES = ('40001', '40P01')
+
+# Columns refreshed on conflict (same as the ON CONFLICT clause in mass_import.sql)
+UPSERT_UPDATE_COLUMNS = ('product_name', 'selling_price_per_unit')
+
+SUPPORTED_TABLES = ('products_complete', 'products')
+
+
+def connect(dsn=None):
+    """Open a psycopg2 connection (DSN defaults to $DATABASE_URL)"""
+    try:
+        import psycopg2
+    except ImportError:
+        raise RuntimeError("psycopg2 is required for direct loading: pip install -r scripts/requirements.txt")
+
+    dsn = dsn or os.getenv('DATABASE_URL')
+    if not dsn:
+        raise RuntimeError("No database DSN given (use --dsn or set DATABASE_URL)")
+    return psycopg2.connect(dsn)
+
+
+def quote_ident(name):
+    """Quote an SQL identifier"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def build_merge_sql(table, staging_table, columns=PRODUCT_COLUMNS, update_columns=UPSERT_UPDATE_COLUMNS):
+    """Set-based merge of the staging table into the target table.
+
+    Duplicate product codes in one run are collapsed to the last staged row,
+    which matches the last-statement-wins behaviour of mass_import.sql.
+    """
+    column_list = ', '.join(quote_ident(c) for c in columns)
+    updates = ',\n    '.join(f"{quote_ident(c)} = EXCLUDED.{quote_ident(c)}" for c in update_columns)
+    return f"""
+INSERT INTO {quote_ident(table)} ({column_list})
+SELECT {column_list} FROM (
+    SELECT DISTINCT ON (product_code) *
+    FROM {quote_ident(staging_table)}
+    ORDER BY product_code, import_seq DESC
+) latest
+ON CONFLICT (product_code) DO UPDATE SET
+    {updates},
+    updated_at = CURRENT_TIMESTAMP
+""".strip()
+
+
+def csv_field(value):
+    """Render one COPY CSV field; NULL is an unquoted empty field, strings are always quoted"""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def csv_line(row, columns=PRODUCT_COLUMNS):
+    return ','.join(csv_field(row[c]) for c in columns) + '\n'
+
+
+class CopyLoader:
+    """Load rows with COPY into a temp staging table, then merge in one statement.
+
+    Usage follows the importer writer protocol: begin(), write_batch() per batch,
+    finish() to merge and commit. Without checkpoints everything is merged in a
+    single transaction; checkpoint() merges and commits what was staged so far.
+    """
+
+    label = 'COPY LOAD'
+    commits_to_database = True
+
+    def __init__(self, dsn=None, table='products_complete', columns=PRODUCT_COLUMNS,
+                 update_columns=UPSERT_UPDATE_COLUMNS):
+        if table not in SUPPORTED_TABLES:
+            raise ValueError(f"Unsupported target table: {table}")
+        self.dsn = dsn
+        self.table = table
+        self.columns = tuple(columns)
+        self.update_columns = tuple(update_columns)
+        self.staging_table = f"{table}_import_staging"
+        self.conn = None
+        self.stats = {'staged_rows': 0, 'merged_rows': 0}
+
+    def begin(self):
+        """Connect and create the session-scoped staging table"""
+        self.conn = connect(self.dsn)
+        with self.conn.cursor() as cur:
+            cur.execute(
+                f"CREATE TEMP TABLE {quote_ident(self.staging_table)} ON COMMIT DELETE ROWS AS "
+                f"SELECT {', '.join(quote_ident(c) for c in self.columns)} "
+                f"FROM {quote_ident(self.table)} WITH NO DATA"
+            )
+            cur.execute(f"ALTER TABLE {quote_ident(self.staging_table)} ADD COLUMN import_seq BIGSERIAL")
+        self.conn.commit()
+
+    def write_batch(self, batch_number, rows):
+        """Stream one batch of rows into the staging table with CSV COPY"""
+        if not rows:
+            return
+        buffer = io.StringIO(''.join(csv_line(row, self.columns) for row in rows))
+
+        copy_sql = (
+            f"COPY {quote_ident(self.staging_table)} ({', '.join(quote_ident(c) for c in self.columns)}) "
+            f"FROM STDIN WITH (FORMAT csv)"
+        )
+        with self.conn.cursor() as cur:
+            # A failed COPY (e.g. a value over a column's length or precision) aborts the
+            # transaction; rolling back to the savepoint keeps it usable for bisection
+            cur.execute("SAVEPOINT copy_batch")
+            try:
+                cur.copy_expert(copy_sql, buffer)
+            except Exception:
+                cur.execute("ROLLBACK TO SAVEPOINT copy_batch")
+                raise
+            cur.execute("RELEASE SAVEPOINT copy_batch")
+        self.stats['staged_rows'] += len(rows)
+
+    def checkpoint(self):
+        """Merge staged rows into the target table and commit (staging is emptied on commit)"""
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(build_merge_sql(self.table, self.staging_table, self.columns, self.update_columns))
+                self.stats['merged_rows'] += max(cur.rowcount, 0)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def finish(self, import_stats=None):
+        """Merge staging into the target table and commit"""
+        try:
+            self.checkpoint()
+        finally:
+            self.conn.close()
+            self.conn = None
+        return f"{self.table} ({self.stats['merged_rows']} rows merged from {self.stats['staged_rows']} staged)"
+
+    def abort(self):
+        """Roll back everything written so far"""
+        if self.conn is not None:
+            self.conn.rollback()
+            self.conn.close()
+            self.conn = None
+
+
+def build_prepare_sql(statement_name, table, columns=PRODUCT_COLUMNS, update_columns=UPSERT_UPDATE_COLUMNS):
+    """Server-side prepared multi-row upsert taking one array parameter per column"""
+    types = ', '.join(f"{COLUMN_TYPES.get(c, 'text')}[]" for c in columns)
+    column_list = ', '.join(quote_ident(c) for c in columns)
+    params = ', '.join(f"${i}" for i in range(1, len(columns) + 1))
+    updates = ',\n    '.join(f"{quote_ident(c)} = EXCLUDED.{quote_ident(c)}" for c in update_columns)
+    return f"""
+PREPARE {statement_name} ({types}) AS
+INSERT INTO {quote_ident(table)} ({column_list})
+SELECT {column_list} FROM (
+    SELECT DISTINCT ON (product_code) *
+    FROM unnest({params}) WITH ORDINALITY AS batch({column_list}, batch_seq)
+    ORDER BY product_code, batch_seq DESC
+) latest
+ON CONFLICT (product_code) DO UPDATE SET
+    {updates},
+    updated_at = CURRENT_TIMESTAMP
+""".strip()
+
+
+class BatchUpsertLoader:
+    """Parameterized multi-row upserts over a small connection pool.
+
+    Rows are routed to one of pool_size lanes by a stable hash of product_code.
+    Each lane owns a connection and flushes batches of batch_size rows in order,
+    one transaction per batch, so lanes run in parallel without ever touching
+    the same product, and the last occurrence of a code still wins.
+    Serialization failures and deadlocks are retried with backoff.
+    """
+
+    label = 'BATCHED UPSERT'
+    commits_to_database = True
+
+    def __init__(self, dsn=None, table='products_complete', batch_size=500, pool_size=4,
+                 max_retries=5, columns=PRODUCT_COLUMNS, update_columns=UPSERT_UPDATE_COLUMNS):
+        if table not in SUPPORTED_TABLES:
+            raise ValueError(f"Unsupported target table: {table}")
+        self.dsn = dsn
+        self.table = table
+        self.batch_size = max(1, batch_size)
+        self.pool_size = max(1, pool_size)
+        self.max_retries = max_retries
+        self.columns = tuple(columns)
+        self.update_columns = tuple(update_columns)
+        self.statement_name = f"{table}_batch_upsert"
+        self.execute_sql = (
+            f"EXECUTE {self.statement_name} ("
+            + ', '.join(f"%s::{COLUMN_TYPES.get(c, 'text')}[]" for c in self.columns)
+            + ")"
+        )
+        self.connections = []
+        self.lanes = []
+        self.buffers = []
+        self.futures = []
+        self.stats = {'batches': 0, 'rows': 0, 'upserted_rows': 0, 'retries': 0}
+
+    def begin(self):
+        """Open one connection and one ordered executor per lane"""
+        prepare_sql = build_prepare_sql(self.statement_name, self.table, self.columns, self.update_columns)
+        for _ in range(self.pool_size):
+            conn = connect(self.dsn)
+            with conn.cursor() as cur:
+                cur.execute(prepare_sql)
+            conn.commit()
+            self.connections.append(conn)
+            self.lanes.append(ThreadPoolExecutor(max_workers=1))
+            self.buffers.append([])
+
+    def lane_for(self, product_code):
+        return zlib.crc32(str(product_code).encode('utf-8')) % self.pool_size
+
+    def write_batch(self, batch_number, rows):
+        """Route rows to lanes and submit every full batch"""
+        for row in rows:
+            lane = self.lane_for(row['product_code'])
+            self.buffers[lane].append(row)
+            if len(self.buffers[lane]) >= self.batch_size:
+                self.submit(lane)
+        self.raise_failures()
+
+    def submit(self, lane):
+        rows, self.buffers[lane] = self.buffers[lane], []
+        if rows:
+            self.futures.append(self.lanes[lane].submit(self.upsert_batch, self.connections[lane], rows))
+
+    def upsert_batch(self, conn, rows):
+        """Run one batch in its own transaction, retrying transient failures"""
+        params = [[row[c] for row in rows] for c in self.columns]
+        attempt = 0
+        while True:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(self.execute_sql, params)
+                    upserted = cur.rowcount
+                conn.commit()
+                return len(rows), upserted, attempt
+            except Exception as e:
+                conn.rollback()
+                if getattr(e, 'pgcode', None) not in RETRYABLE_PGCODES or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                time.sleep(min(2.0, 0.05 * (2 ** attempt)))
+
+    def checkpoint(self):
+        """Submit partial batches and wait until every lane has committed"""
+        for lane in range(self.pool_size):
+            self.submit(lane)
+        futures, self.futures = self.futures, []
+        first_error = None
+        for future in futures:
+            error = future.exception()
+            if error is not None:
+                first_error = first_error or error
+            else:
+                self.record(*future.result())
+        if first_error is not None:
+            raise first_error
+
+    def raise_failures(self):
+        """Collect finished batches, re-raising the first failure"""
+        pending = []
+        first_error = None
+        for future in self.futures:
+            if not future.done():
+                pending.append(future)
+            elif future.exception() is not None:
+                first_error = first_error or future.exception()
+            else:
+                self.record(*future.result())
+        self.futures = pending
+        if first_error is not None:
+            raise first_error
+
+    def record(self, rows, upserted, retries):
+        self.stats['batches'] += 1
+        self.stats['rows'] += rows
+        self.stats['upserted_rows'] += upserted
+        self.stats['retries'] += retries
+
+    def finish(self, import_stats=None):
+        """Flush partial batches and wait for every lane"""
+        try:
+            self.checkpoint()
+        finally:
+            self.close()
+        return (f"{self.table} ({self.stats['upserted_rows']} rows upserted in {self.stats['batches']} batches, "
+                f"{self.stats['retries']} retries)")
+
+    def abort(self):
+        """Stop submitting work; batches already committed stay committed"""
+        for future in self.futures:
+            future.cancel()
+        self.close()
+
+    def close(self):
+        for executor in self.lanes:
+            executor.shutdown(wait=True)
+        for conn in self.connections:
+            conn.close()
+        self.lanes = []
+        self.connections = []
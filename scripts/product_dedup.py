@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Cross-file product deduplication for ProductBatchImporter
+Collapses every product_code to one row using a merge policy, spilling to SQLite when large
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+
+from pg_loader import PRODUCT_COLUMNS
+
+MERGE_POLICIES = ('latest', 'most_complete', 'coalesce')
+
+CODE_INDEX = PRODUCT_COLUMNS.index('product_code')
+
+
+def completeness(values):
+    return sum(value is not None for value in values)
+
+
+def merge_values(policy, older, newer):
+    """Merge two value tuples of the same product; newer is the later occurrence"""
+    if policy == 'latest':
+        return newer
+    if policy == 'most_complete':
+        # Ties go to the later occurrence, like 'latest'
+        return older if completeness(older) > completeness(newer) else newer
+    return tuple(old if new is None else new for old, new in zip(older, newer))
+
+
+class ProductDeduplicator:
+    """Keeps one merged row per product_code.
+
+    Rows are held as value tuples in PRODUCT_COLUMNS order (much smaller than
+    dicts) together with the sequence number of the code's first occurrence, so
+    output order is deterministic. Once more than max_in_memory codes are held,
+    the map is merged into an SQLite spill file and cleared.
+    """
+
+    def __init__(self, policy='latest', max_in_memory=500000, spill_dir=None):
+        if policy not in MERGE_POLICIES:
+            raise ValueError(f"Unknown merge policy: {policy}")
+        self.policy = policy
+        self.max_in_memory = max(1, max_in_memory)
+        self.spill_dir = spill_dir
+        self.entries = {}
+        self.sequence = 0
+        self.spill = None
+        self.spill_path = None
+        self.stats = {'input_rows': 0, 'unique_products': 0, 'duplicates_collapsed': 0,
+                      'duplicated_codes': 0, 'spills': 0}
+
+    def add(self, row):
+        values = tuple(row[column] for column in PRODUCT_COLUMNS)
+        code = values[CODE_INDEX]
+        self.stats['input_rows'] += 1
+
+        known = self.entries.get(code)
+        if known is not None:
+            self.entries[code] = (known[0], merge_values(self.policy, known[1], values), True)
+            return
+
+        self.entries[code] = (self.sequence, values, False)
+        self.sequence += 1
+        if len(self.entries) > self.max_in_memory:
+            self.spill_entries()
+
+    def add_rows(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def open_spill(self):
+        handle, self.spill_path = tempfile.mkstemp(prefix='import_dedup_', suffix='.sqlite', dir=self.spill_dir)
+        os.close(handle)
+        self.spill = sqlite3.connect(self.spill_path)
+        self.spill.execute("PRAGMA journal_mode = OFF")
+        self.spill.execute("PRAGMA synchronous = OFF")
+        self.spill.execute(
+            "CREATE TABLE rows (product_code TEXT PRIMARY KEY, seq INTEGER NOT NULL, "
+            "row_values TEXT NOT NULL, duplicated INTEGER NOT NULL)"
+        )
+
+    def spill_entries(self):
+        """Merge the in-memory map into the spill file (entries in memory are the newer ones)"""
+        if self.spill is None:
+            self.open_spill()
+        for code, (seq, values, duplicated) in self.entries.items():
+            spilled = self.spill.execute(
+                "SELECT seq, row_values FROM rows WHERE product_code = ?", (code,)
+            ).fetchone()
+            if spilled is not None:
+                seq = spilled[0]
+                values = merge_values(self.policy, tuple(json.loads(spilled[1])), values)
+                duplicated = True
+            self.spill.execute(
+                "INSERT OR REPLACE INTO rows (product_code, seq, row_values, duplicated) VALUES (?, ?, ?, ?)",
+                (code, seq, json.dumps(values, ensure_ascii=False), int(duplicated))
+            )
+        self.spill.commit()
+        self.entries = {}
+        self.stats['spills'] += 1
+
+    def iter_rows(self):
+        """Yield one merged row dict per product_code, in order of first occurrence"""
+        if self.spill is None:
+            ordered = sorted(self.entries.values(), key=lambda entry: entry[0])
+            self.finalize_stats(len(ordered), sum(entry[2] for entry in ordered))
+            for _, values, _ in ordered:
+                yield dict(zip(PRODUCT_COLUMNS, values))
+            return
+
+        self.spill_entries()
+        unique, duplicated = self.spill.execute("SELECT COUNT(*), COALESCE(SUM(duplicated), 0) FROM rows").fetchone()
+        self.finalize_stats(unique, duplicated)
+        for (row_values,) in self.spill.execute("SELECT row_values FROM rows ORDER BY seq"):
+            yield dict(zip(PRODUCT_COLUMNS, json.loads(row_values)))
+
+    def finalize_stats(self, unique, duplicated):
+        self.stats['unique_products'] = unique
+        self.stats['duplicated_codes'] = duplicated
+        self.stats['duplicates_collapsed'] = self.stats['input_rows'] - unique
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+        if self.spill_path and os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+        self.spill_path = None
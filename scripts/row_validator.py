@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Pre-load validation of transformed product rows against the table schema
+Rules are read from the CREATE TABLE statement and checked column-wise per batch
+"""
+
+import re
+from pathlib import Path
+
+from columnar_writer import load_pyarrow
+from pg_loader import PRODUCT_COLUMNS, COLUMN_TYPES
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Schema file defining the CHECK constraints of each supported target table
+SCHEMA_FILES = {
+    'products': REPO_ROOT / 'database' / 'create_products_table.sql',
+    'products_complete': REPO_ROOT / 'docs' / 'schema' / 'exact-user-schema.sql',
+}
+
+COMPARISONS = {
+    '>=': lambda value, bound: value < bound,
+    '>': lambda value, bound: value <= bound,
+    '<=': lambda value, bound: value > bound,
+    '<': lambda value, bound: value >= bound,
+}
+COMPARISON_KERNELS = {'>=': 'less', '>': 'less_equal', '<=': 'greater', '<': 'greater_equal'}
+
+COLUMN_LINE = re.compile(r"^\s*(\w+)\s+(VARCHAR|DECIMAL|NUMERIC|INTEGER|BOOLEAN|TEXT|JSONB|UUID|TIMESTAMP)\b(.*)$",
+                         re.IGNORECASE)
+VARCHAR_LENGTH = re.compile(r"VARCHAR\s*\(\s*(\d+)\s*\)", re.IGNORECASE)
+DECIMAL_PRECISION = re.compile(r"(?:DECIMAL|NUMERIC)\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)", re.IGNORECASE)
+CHECK_CLAUSE = re.compile(r"CHECK\s*\((.*)\)", re.IGNORECASE)
+CHECK_COMPARISON = re.compile(r"^(\w+)\s*(>=|<=|>|<)\s*(-?\d+(?:\.\d+)?)$")
+CHECK_IN = re.compile(r"^(\w+)\s+IN\s*\((.*)\)$", re.IGNORECASE)
+
+
+class Rule:
+    """One constraint on one column; name is what reject reasons and stats report"""
+
+    def __init__(self, column, kind, argument=None):
+        self.column = column
+        self.kind = kind
+        self.argument = argument
+        if kind == 'not_null':
+            self.name = f"{column} IS NOT NULL"
+        elif kind == 'max_length':
+            self.name = f"length({column}) <= {argument}"
+        elif kind == 'precision':
+            self.name = f"abs({column}) < {argument}"
+        elif kind == 'in_set':
+            self.name = f"{column} IN ({', '.join(argument)})"
+        else:
+            self.name = f"{column} {kind} {argument:g}"
+
+    def violations(self, values):
+        """Indices of violating values (NULL only violates NOT NULL, as in SQL CHECKs)"""
+        if self.kind == 'not_null':
+            return [i for i, value in enumerate(values) if value is None]
+        if self.kind == 'max_length':
+            return [i for i, value in enumerate(values) if value is not None and len(value) > self.argument]
+        if self.kind == 'in_set':
+            allowed = set(self.argument)
+            return [i for i, value in enumerate(values) if value is not None and value not in allowed]
+        if self.kind == 'precision':
+            return [i for i, value in enumerate(values) if value is not None and abs(value) >= self.argument]
+        failed = COMPARISONS[self.kind]
+        return [i for i, value in enumerate(values) if value is not None and failed(value, self.argument)]
+
+    def arrow_violations(self, pc, array):
+        """Same as violations() as a single compute kernel over an Arrow array"""
+        if self.kind == 'not_null':
+            mask = pc.is_null(array)
+        elif self.kind == 'max_length':
+            mask = pc.greater(pc.utf8_length(array), self.argument)
+        elif self.kind == 'in_set':
+            mask = pc.invert(pc.is_in(array, value_set=self.value_set))
+        elif self.kind == 'precision':
+            mask = pc.greater_equal(pc.abs(array), self.argument)
+        else:
+            mask = getattr(pc, COMPARISON_KERNELS[self.kind])(array, self.argument)
+        return pc.indices_nonzero(pc.fill_null(mask, False)).to_pylist()
+
+
+def extract_create_table(schema_sql, table):
+    """Column definition lines of CREATE TABLE <table> (...)"""
+    match = re.search(rf"CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?{re.escape(table)}\s*\(", schema_sql, re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"CREATE TABLE {table} not found in schema")
+    depth, position = 1, match.end()
+    while depth and position < len(schema_sql):
+        depth += {'(': 1, ')': -1}.get(schema_sql[position], 0)
+        position += 1
+    body = schema_sql[match.end():position - 1]
+    return [line.split('--', 1)[0].rstrip().rstrip(',') for line in body.splitlines()]
+
+
+def unwrap_parentheses(expression):
+    """Strip parentheses enclosing the whole expression: '((x >= 0))' -> 'x >= 0'"""
+    while expression.startswith('(') and expression.endswith(')'):
+        depth = 0
+        for position, char in enumerate(expression):
+            depth += {'(': 1, ')': -1}.get(char, 0)
+            if depth == 0 and position < len(expression) - 1:
+                return expression
+        expression = expression[1:-1].strip()
+    return expression
+
+
+def parse_check(column, expression):
+    """Rules for a CHECK expression made of comparisons / IN lists joined by AND"""
+    rules = []
+    for part in re.split(r"\s+AND\s+", expression.strip(), flags=re.IGNORECASE):
+        part = unwrap_parentheses(part.strip())
+        comparison = CHECK_COMPARISON.match(part)
+        in_list = CHECK_IN.match(part)
+        if comparison and comparison.group(1) == column:
+            rules.append(Rule(column, comparison.group(2), float(comparison.group(3))))
+        elif in_list and in_list.group(1) == column:
+            rules.append(Rule(column, 'in_set', tuple(re.findall(r"'([^']*)'", in_list.group(2)))))
+        else:
+            print(f"⚠️  Unsupported CHECK on {column} not validated: {part}")
+    return rules
+
+
+def load_schema_rules(table, schema_path=None, columns=PRODUCT_COLUMNS):
+    """Rules for the importer's columns derived from the table's CREATE TABLE statement"""
+    schema_path = Path(schema_path) if schema_path else SCHEMA_FILES[table]
+    with open(schema_path, 'r', encoding='utf-8') as f:
+        lines = extract_create_table(f.read(), table)
+
+    rules = []
+    for line in lines:
+        match = COLUMN_LINE.match(line)
+        if match is None or match.group(1) not in columns:
+            continue
+        column, definition = match.group(1), line
+        if re.search(r"\bNOT\s+NULL\b", definition, re.IGNORECASE):
+            rules.append(Rule(column, 'not_null'))
+        length = VARCHAR_LENGTH.search(definition)
+        if length:
+            rules.append(Rule(column, 'max_length', int(length.group(1))))
+        precision = DECIMAL_PRECISION.search(definition)
+        if precision:
+            rules.append(Rule(column, 'precision', 10 ** (int(precision.group(1)) - int(precision.group(2)))))
+        check = CHECK_CLAUSE.search(definition)
+        if check:
+            rules.extend(parse_check(column, check.group(1)))
+    return rules
+
+
+class RowValidator:
+    """Splits batches of rows into valid rows and rejects with reasons.
+
+    Each rule is evaluated over a whole column of the batch: one Arrow compute
+    kernel per rule when pyarrow is installed, one comprehension otherwise.
+    """
+
+    def __init__(self, table='products_complete', schema_path=None, use_arrow=True):
+        self.table = table
+        self.rules = load_schema_rules(table, schema_path)
+        arrow = load_pyarrow() if use_arrow else None
+        self.pa = arrow[0] if arrow else None
+        self.pc = None
+        if self.pa is not None:
+            import pyarrow.compute
+            self.pc = pyarrow.compute
+            for rule in self.rules:
+                if rule.kind == 'in_set':
+                    rule.value_set = self.pa.array(rule.argument, type=self.pa.string())
+        self.stats = {'validated_rows': 0, 'rejected_rows': 0, 'violations': {rule.name: 0 for rule in self.rules}}
+
+    def column_array(self, column, values):
+        if COLUMN_TYPES.get(column) == 'numeric':
+            return self.pa.array(values, type=self.pa.float64())
+        return self.pa.array(values, type=self.pa.string())
+
+    def split(self, rows):
+        """Return (valid_rows, [(row, [reason, ...]), ...])"""
+        if not rows:
+            return rows, []
+
+        reasons = {}
+        columns = {}
+        for rule in self.rules:
+            values = columns.get(rule.column)
+            if values is None:
+                values = [row[rule.column] for row in rows]
+                if self.pc is not None:
+                    values = self.column_array(rule.column, values)
+                columns[rule.column] = values
+
+            if self.pc is not None:
+                failing = rule.arrow_violations(self.pc, values)
+            else:
+                failing = rule.violations(values)
+            if failing:
+                self.stats['violations'][rule.name] += len(failing)
+                for i in failing:
+                    reasons.setdefault(i, []).append(f"{rule.name} (got {rows[i][rule.column]!r})")
+
+        self.stats['validated_rows'] += len(rows)
+        self.stats['rejected_rows'] += len(reasons)
+        if not reasons:
+            return rows, []
+        valid = [row for i, row in enumerate(rows) if i not in reasons]
+        rejects = [(rows[i], reasons[i]) for i in sorted(reasons)]
+        return valid, rejects
+
+    def summary_lines(self):
+        lines = [f"Validated rows: {self.stats['validated_rows']} ({self.stats['rejected_rows']} rejected)"]
+        for name, count in self.stats['violations'].items():
+            if count:
+                lines.append(f"   {name}: {count}")
+        return lines
@@ -3,145 +3,446 @@
 Convert mass_import_fixed.sql to JSON files for JavaScript importer
 """
 
+import argparse
+import codecs
 import re
 import json
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
-def extract_products_from_sql(sql_file_path):
-    """Extract product data from SQL INSERT statements"""
-    products = []
+# Characters that change the statement splitter's state
+STATEMENT_SPECIAL = re.compile(r"'|;|--")
+
+# Leading whitespace and line comments before a statement keyword
+LEADING_NOISE = re.compile(r"(?:\s+|--[^\n]*(?:\n|$))*")
+
+INSERT_PRODUCTS = re.compile(r"INSERT\s+INTO\s+products", re.IGNORECASE)
+VALUES_KEYWORD = re.compile(r"\bVALUES\b", re.IGNORECASE)
+
+# Tokens inside a VALUES list; strings use the unrolled '...''...' form so
+# doubled quotes are matched without per-character backtracking
+VALUE_TOKEN = re.compile(r"""
+    (?P<ws>\s+|--[^\n]*)
+  | (?P<str>'[^']*(?:''[^']*)*')
+  | (?P<num>[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)(?![\w.])
+  | (?P<word>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<cast>::)
+  | (?P<punct>[(),])
+""", re.VERBOSE)
+
+SQL_KEYWORDS = {'null': None, 'true': True, 'false': False}
+
+
+def iter_sql_statements(f, chunk_size=1024 * 1024):
+    """Yield statements from an SQL file, reading it in chunks.
     
-    with open(sql_file_path, 'r', encoding='utf-8') as f:
-        sql_content = f.read()
+    Semicolons inside string literals and line comments are ignored; the
+    splitter jumps between special characters with a regex, so the work is
+    linear in the file size and memory is bounded by the largest statement.
+    """
+    buf = ''
+    start = pos = 0
+    in_quote = False
+    eof = False
     
-    # Find all INSERT statements
-    insert_pattern = r"INSERT INTO products.*?VALUES\s*\((.*?)\)\s*ON CONFLICT"
-    matches = re.findall(insert_pattern, sql_content, re.DOTALL | re.IGNORECASE)
+    while not eof:
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buf = buf[start:] + chunk
+        pos -= start
+        start = 0
+        
+        while True:
+            if in_quote:
+                quote = buf.find("'", pos)
+                if quote == -1:
+                    pos = len(buf)
+                    break
+                if quote + 1 == len(buf) and not eof:
+                    # Can't tell '' from a closing quote yet
+                    pos = quote
+                    break
+                if quote + 1 < len(buf) and buf[quote + 1] == "'":
+                    pos = quote + 2
+                    continue
+                in_quote = False
+                pos = quote + 1
+                continue
+            
+            match = STATEMENT_SPECIAL.search(buf, pos)
+            if match is None:
+                # Keep a trailing '-' in case it starts a '--' in the next chunk
+                pos = len(buf) - 1 if buf.endswith('-') and not eof else len(buf)
+                break
+            
+            token = match.group()
+            if token == "'":
+                in_quote = True
+                pos = match.end()
+            elif token == '--':
+                newline = buf.find('\n', match.end())
+                if newline == -1:
+                    if eof:
+                        pos = len(buf)
+                    else:
+                        pos = match.start()
+                    break
+                pos = newline + 1
+            else:
+                yield buf[start:match.start()]
+                start = pos = match.end()
     
-    print(f"Found {len(matches)} INSERT statements")
+    tail = buf[start:]
+    if tail.strip():
+        yield tail
+
+
+def parse_sql_literal(kind, text):
+    """Convert one SQL literal token to a Python value"""
+    if kind == 'str':
+        return text[1:-1].replace("''", "'")
+    if kind == 'num':
+        if any(c in text for c in '.eE'):
+            return float(text)
+        return int(text)
+    lowered = text.lower()
+    if lowered in SQL_KEYWORDS:
+        return SQL_KEYWORDS[lowered]
+    raise ValueError(f"Unsupported SQL value: {text}")
+
+
+def iter_values_tuples(statement, start):
+    """Yield each VALUES (...) tuple of an INSERT statement as a list of Python values"""
+    tokens = (
+        (m.lastgroup, m.group()) for m in VALUE_TOKEN.finditer(statement, start)
+        if m.lastgroup != 'ws'
+    )
     
-    for i, match in enumerate(matches):  # Process ALL products
+    for kind, text in tokens:
+        if text != '(':
+            return
+        values = []
+        expecting_value = True
+        for kind, text in tokens:
+            if kind == 'cast':
+                next(tokens)  # type name, e.g. '...'::jsonb
+            elif text == ',':
+                expecting_value = True
+            elif text == ')':
+                break
+            elif expecting_value:
+                values.append(parse_sql_literal(kind, text))
+                expecting_value = False
+            else:
+                raise ValueError(f"Unexpected token in VALUES: {text}")
+        yield values
+        
+        # Another tuple follows a comma; anything else (ON CONFLICT, end) stops
+        following = next(tokens, (None, None))
+        if following[1] != ',':
+            return
+
+
+def values_to_product(clean_parts):
+    """Map one VALUES tuple (generate_sql_insert column order) to scraped-product keys"""
+    product = {
+        "kod_produktu": clean_parts[0],
+        "nazwa_produktu": clean_parts[1], 
+        "jednostka_sprzedażowa": clean_parts[4],  # selling_unit
+        "nieoficjalna_nazwa_produktu": clean_parts[6],
+        "rodzaj_wykończenia": clean_parts[7],
+        "powierzchnia": clean_parts[8],
+        "fazowanie": clean_parts[9],
+        "grubość_[mm]": str(clean_parts[10]) if clean_parts[10] is not None else None,
+        "szerokość_[mm]": str(clean_parts[11]) if clean_parts[11] is not None else None,
+        "długość_[mm]": str(clean_parts[12]) if clean_parts[12] is not None else None,
+        "paczka_[m²]": str(clean_parts[13]) if clean_parts[13] is not None else None,
+        "dodatkowy_opis_przedmiotu": clean_parts[14],
+        "cena_detaliczna_netto_1{}_[zł]".format(clean_parts[4]): str(clean_parts[15]) if clean_parts[15] is not None else None,
+        "cena_sprzedaży_netto_1{}_[zł]".format(clean_parts[4]): str(clean_parts[16]) if clean_parts[16] is not None else None,
+        "cena_zakupu_netto_1{}_[zł]".format(clean_parts[4]): str(clean_parts[17]) if clean_parts[17] is not None else None,
+        "potencjalny_zysk_1{}_[zł]".format(clean_parts[4]): str(clean_parts[18]) if clean_parts[18] is not None else None,
+        "długość_sprzedażowa_[mb]": str(clean_parts[5]) if clean_parts[5] is not None else None
+    }
+    
+    # Clean up None values
+    return {k: v for k, v in product.items() if v is not None}
+
+
+def iter_products_from_statements(statements, stats):
+    """Yield product dicts from the INSERT INTO products statements of a statement stream"""
+    stats.setdefault('statements', 0)
+    stats.setdefault('errors', 0)
+    
+    for statement in statements:
+        body_start = LEADING_NOISE.match(statement).end()
+        if not INSERT_PRODUCTS.match(statement, body_start):
+            continue
+        values_match = VALUES_KEYWORD.search(statement, body_start)
+        if values_match is None:
+            continue
+        
+        stats['statements'] += 1
         try:
-            # Parse VALUES content
-            values = match.strip()
-            
-            # Split by comma but respect quoted strings
-            parts = []
-            current_part = ""
-            in_quotes = False
-            escape_next = False
+            for clean_parts in iter_values_tuples(statement, values_match.end()):
+                if len(clean_parts) >= 19:  # Minimum required fields
+                    yield values_to_product(clean_parts)
+        except Exception as e:
+            print(f"Error parsing product {stats['statements']}: {e}")
+            stats['errors'] += 1
+
+
+def iter_products_from_sql(sql_file_path, stats=None):
+    """Stream product dicts from the INSERT statements of an SQL file"""
+    stats = stats if stats is not None else {}
+    with open(sql_file_path, 'r', encoding='utf-8') as f:
+        yield from iter_products_from_statements(iter_sql_statements(f), stats)
+
+
+def extract_products_from_sql(sql_file_path):
+    """Extract product data from SQL INSERT statements"""
+    stats = {}
+    products = list(iter_products_from_sql(sql_file_path, stats))
+    print(f"Found {stats['statements']} INSERT statements")
+    return products
+
+# Statement boundary used to split a dump into shards: an INSERT at the start of
+# a line whose previous non-blank, non-comment line ends with ';'
+SHARD_BOUNDARY = re.compile(rb"\n(?=INSERT\s+INTO\s+products)", re.IGNORECASE)
+
+OUTPUT_FORMATS = ('pretty', 'compact', 'ndjson')
+
+
+def is_statement_start(window, offset):
+    """True if the line before window[offset] closes a statement"""
+    for line in reversed(window[:offset].splitlines()):
+        line = line.strip()
+        if not line or line.startswith(b'--'):
+            continue
+        return line.endswith(b';')
+    return False
+
+
+def find_shard_offsets(sql_file_path, shard_count, window_size=256 * 1024):
+    """Byte offsets splitting the dump into up to shard_count statement-aligned ranges"""
+    size = os.path.getsize(sql_file_path)
+    offsets = [0]
+    
+    with open(sql_file_path, 'rb') as f:
+        for i in range(1, shard_count):
+            target = max(size * i // shard_count, offsets[-1])
+            f.seek(target)
+            window = f.read(window_size)
+            boundary = None
             
-            for char in values:
-                if escape_next:
-                    current_part += char
-                    escape_next = False
-                elif char == '\\':
-                    current_part += char
-                    escape_next = True
-                elif char == "'" and not escape_next:
-                    current_part += char
-                    in_quotes = not in_quotes
-                elif char == ',' and not in_quotes:
-                    parts.append(current_part.strip())
-                    current_part = ""
+            while boundary is None and window:
+                for match in SHARD_BOUNDARY.finditer(window):
+                    if is_statement_start(window, match.start()):
+                        boundary = target + match.end()
+                        break
                 else:
-                    current_part += char
+                    more = f.read(window_size)
+                    if not more:
+                        break
+                    window += more
             
-            if current_part.strip():
-                parts.append(current_part.strip())
-            
-            if len(parts) >= 17:  # Minimum required fields
-                # Clean up values
-                clean_parts = []
-                for part in parts:
-                    part = part.strip()
-                    if part.startswith("'") and part.endswith("'"):
-                        part = part[1:-1]
-                    elif part == 'NULL':
-                        part = None
-                    elif part == 'true':
-                        part = True
-                    elif part == 'false':
-                        part = False
-                    else:
-                        try:
-                            if '.' in part:
-                                part = float(part)
-                            else:
-                                part = int(part)
-                        except ValueError:
-                            pass
-                    clean_parts.append(part)
-                
-                # Map to product structure
-                product = {
-                    "kod_produktu": clean_parts[0],
-                    "nazwa_produktu": clean_parts[1], 
-                    "jednostka_sprzedażowa": clean_parts[4],  # selling_unit
-                    "nieoficjalna_nazwa_produktu": clean_parts[6],
-                    "rodzaj_wykończenia": clean_parts[7],
-                    "powierzchnia": clean_parts[8],
-                    "fazowanie": clean_parts[9],
-                    "grubość_[mm]": str(clean_parts[10]) if clean_parts[10] is not None else None,
-                    "szerokość_[mm]": str(clean_parts[11]) if clean_parts[11] is not None else None,
-                    "długość_[mm]": str(clean_parts[12]) if clean_parts[12] is not None else None,
-                    "paczka_[m²]": str(clean_parts[13]) if clean_parts[13] is not None else None,
-                    "dodatkowy_opis_przedmiotu": clean_parts[14],
-                    "cena_detaliczna_netto_1{}_[zł]".format(clean_parts[4]): str(clean_parts[15]) if clean_parts[15] is not None else None,
-                    "cena_sprzedaży_netto_1{}_[zł]".format(clean_parts[4]): str(clean_parts[16]) if clean_parts[16] is not None else None,
-                    "cena_zakupu_netto_1{}_[zł]".format(clean_parts[4]): str(clean_parts[17]) if clean_parts[17] is not None else None,
-                    "potencjalny_zysk_1{}_[zł]".format(clean_parts[4]): str(clean_parts[18]) if clean_parts[18] is not None else None,
-                    "długość_sprzedażowa_[mb]": str(clean_parts[5]) if clean_parts[5] is not None else None
-                }
-                
-                # Clean up None values
-                product = {k: v for k, v in product.items() if v is not None}
-                
-                products.append(product)
-                
-        except Exception as e:
-            print(f"Error parsing product {i}: {e}")
-            continue
+            if boundary is None:
+                break
+            if boundary > offsets[-1]:
+                offsets.append(boundary)
     
-    return products
+    offsets.append(size)
+    return list(zip(offsets, offsets[1:]))
+
+
+class ByteRangeReader:
+    """Text reader over the byte range [start, end) of a UTF-8 file"""
+    
+    def __init__(self, f, start, end):
+        self.f = f
+        self.remaining = end - start
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        f.seek(start)
+    
+    def read(self, size):
+        if self.remaining <= 0:
+            return self.decoder.decode(b'', final=True)
+        data = self.f.read(min(size, self.remaining))
+        self.remaining -= len(data)
+        if not data:
+            self.remaining = 0
+        return self.decoder.decode(data, final=self.remaining <= 0)
+
+
+def serialize_product(product, output_format):
+    """JSON text of one product as it appears inside a batch file"""
+    if output_format == 'pretty':
+        # Same text json.dump(batch, indent=2) produces for a list element
+        return '  ' + json.dumps(product, indent=2, ensure_ascii=False).replace('\n', '\n  ')
+    return json.dumps(product, ensure_ascii=False, separators=(',', ':'))
+
+
+def join_batch(fragments, output_format):
+    if output_format == 'ndjson':
+        return '\n'.join(fragments) + '\n'
+    if output_format == 'pretty':
+        return '[\n' + ',\n'.join(fragments) + '\n]'
+    return '[' + ','.join(fragments) + ']'
+
+
+def batch_filename(batch_number, output_format):
+    extension = 'ndjson' if output_format == 'ndjson' else 'json'
+    return f"products_batch_{batch_number:04d}.{extension}"
+
+
+def convert_shard(task):
+    """Parse one byte range of the dump and serialize its products (runs in a worker process)"""
+    sql_file_path, start, end, output_format = task
+    stats = {}
+    with open(sql_file_path, 'rb') as f:
+        statements = iter_sql_statements(ByteRangeReader(f, start, end))
+        products = iter_products_from_statements(statements, stats)
+        first = next(products, None)
+        fragments = [] if first is None else [serialize_product(first, output_format)]
+        fragments.extend(serialize_product(product, output_format) for product in products)
+    return {'fragments': fragments, 'sample': first, 'statements': stats['statements'], 'errors': stats['errors']}
+
+
+def write_json_batch(output_path, batch_number, fragments, output_format='pretty'):
+    filename = batch_filename(batch_number, output_format)
+    with open(output_path / filename, 'w', encoding='utf-8') as f:
+        f.write(join_batch(fragments, output_format))
+    return filename
 
-def create_json_files(products, output_dir, batch_size=200):
-    """Create JSON files with batches of products"""
+
+def create_json_files(products, output_dir, batch_size=200, output_format='pretty'):
+    """Create JSON files with batches of products (consumes any iterable lazily)"""
     output_path = Path(output_dir)
     output_path.mkdir(exist_ok=True)
     
-    for i in range(0, len(products), batch_size):
-        batch = products[i:i + batch_size]
-        filename = f"products_batch_{i//batch_size + 1:04d}.json"
-        filepath = output_path / filename
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(batch, f, indent=2, ensure_ascii=False)
-        
+    batch = []
+    batch_number = 0
+    for product in products:
+        batch.append(serialize_product(product, output_format))
+        if len(batch) >= batch_size:
+            batch_number += 1
+            filename = write_json_batch(output_path, batch_number, batch, output_format)
+            print(f"Created {filename} with {len(batch)} products")
+            batch = []
+    if batch:
+        batch_number += 1
+        filename = write_json_batch(output_path, batch_number, batch, output_format)
         print(f"Created {filename} with {len(batch)} products")
 
-def main():
-    sql_file = "mass_import_fixed.sql"
-    output_dir = "extracted_products"
+
+def convert_sql_parallel(sql_file_path, output_dir, batch_size=100, workers=1,
+                         output_format='pretty', writer_threads=4):
+    """Convert a dump with shards parsed in worker processes.
+    
+    Shards are returned in file order and cut into batches of batch_size, so
+    batch numbering and contents match a sequential run; batch files are
+    written concurrently by a small thread pool.
+    """
+    output_path = Path(output_dir)
+    output_path.mkdir(exist_ok=True)
+    
+    # A few shards per worker keeps the pool busy when shards differ in size
+    shard_count = workers * 4 if workers > 1 else 1
+    tasks = [(str(sql_file_path), start, end, output_format)
+             for start, end in find_shard_offsets(sql_file_path, shard_count)]
+    
+    stats = {'statements': 0, 'errors': 0, 'products': 0, 'files': 0, 'shards': len(tasks), 'sample': None}
+    pending = []
+    carry = []
+    batch_number = 0
+    
+    def report(futures):
+        for future, size in futures:
+            print(f"Created {future.result()} with {size} products")
+    
+    with ThreadPoolExecutor(max_workers=writer_threads) as io_pool:
+        if workers > 1:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            results = pool.map(convert_shard, tasks)
+        else:
+            pool = None
+            results = map(convert_shard, tasks)
+        
+        try:
+            for result in results:
+                stats['statements'] += result['statements']
+                stats['errors'] += result['errors']
+                stats['products'] += len(result['fragments'])
+                if stats['sample'] is None:
+                    stats['sample'] = result['sample']
+                
+                carry.extend(result['fragments'])
+                full = len(carry) - len(carry) % batch_size
+                for i in range(0, full, batch_size):
+                    batch_number += 1
+                    batch = carry[i:i + batch_size]
+                    pending.append((io_pool.submit(write_json_batch, output_path, batch_number, batch, output_format), len(batch)))
+                carry = carry[full:]
+                
+                report(pending)
+                pending = []
+            
+            if carry:
+                batch_number += 1
+                pending.append((io_pool.submit(write_json_batch, output_path, batch_number, carry, output_format), len(carry)))
+            report(pending)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+    
+    stats['files'] = batch_number
+    return stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Convert an SQL product dump to JSON batch files")
+    parser.add_argument('sql_file', nargs='?', default="mass_import_fixed.sql",
+                        help="SQL dump with INSERT INTO products statements")
+    parser.add_argument('output_dir', nargs='?', default="extracted_products",
+                        help="Directory for products_batch_NNNN files")
+    parser.add_argument('--batch-size', type=int, default=100,
+                        help="Products per output file")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Parse statement-aligned shards in N worker processes (0 = all CPU cores)")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='pretty',
+                        help="pretty: indented JSON arrays; compact: JSON arrays without whitespace; "
+                             "ndjson: one product per line")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sql_file = args.sql_file
+    output_dir = args.output_dir
+    workers = args.workers if args.workers > 0 else os.cpu_count()
     
     if not os.path.exists(sql_file):
         print(f"❌ SQL file not found: {sql_file}")
         return
     
     print("🚀 Extracting products from SQL...")
-    products = extract_products_from_sql(sql_file)
+    if workers > 1:
+        print(f"Parsing with {workers} worker processes")
+    
+    print("📄 Creating JSON files...")
+    stats = convert_sql_parallel(sql_file, output_dir, batch_size=args.batch_size,
+                                 workers=workers, output_format=args.format)
     
-    print(f"✅ Extracted {len(products)} products")
+    print(f"Found {stats['statements']} INSERT statements")
+    print(f"✅ Extracted {stats['products']} products ({stats['errors']} statements failed to parse)")
     
-    if products:
-        print("📄 Creating JSON files...")
-        create_json_files(products, output_dir, batch_size=100)
-        print(f"🎯 JSON files created in {output_dir}/")
+    if stats['sample']:
+        print(f"🎯 {stats['files']} JSON files created in {output_dir}/")
         
         # Show sample
         print("\n📋 Sample product:")
-        print(json.dumps(products[0], indent=2, ensure_ascii=False))
+        print(json.dumps(stats['sample'], indent=2, ensure_ascii=False))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()